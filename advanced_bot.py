@@ -7,22 +7,44 @@ import os
 import random
 import sqlite3
 import hashlib
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
-from config import BOT_CONFIG, DATABASE_NAME, LOG_FILE, LOG_LEVEL
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+from config import (
+    DATABASE_NAME, ORDER_DEDUP_WINDOW, ORDER_DEDUP_TTL, ORDER_CACHE_SIZE, ORDER_CACHE_TTL,
+    CONFIRMATION_TTL, CART_TTL, SESSION_TTL
+)
+from config_snapshot import config_store
+from date_parser import parse_date, parse_travel_date, format_date
+from idempotency import DedupWindow
+from expiry import ExpiryScheduler
+from ticket_ids import ticket_ids
+from order_cache import OrderCache
+from order_history import HistoryPage, OLDER, fetch_page, render_page
+import analytics
+import inventory
+import order_lifecycle
+import pricing
+from inventory import seat_inventory
+from pricing import dynamic_prices
+from metrics import registry, SIZE_BUCKETS
 import logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Логирование настраивает точка входа (telegram_sales_bot.create_app), а не импорт модуля
 logger = logging.getLogger(__name__)
 
+# Описание метрик
+registry.describe('process_message_seconds', 'Обработка сообщения по состоянию диалога')
+registry.describe('db_query_seconds', 'Запросы к базе данных')
+registry.describe('render_seconds', 'Формирование ответов')
+registry.describe('order_cart_size', 'Число позиций в оформленном заказе')
+registry.describe('expired_total', 'Снятые по сроку подтверждения, корзины и сессии')
+registry.describe('orders_total', 'Оформленные заказы')
+registry.describe('orders_per_minute', 'Заказов за последнюю минуту')
+registry.describe('duplicate_orders_total', 'Повторные подтверждения заказа без записи в БД')
+
 # Инициализация базы данных
 def init_database():
     """Инициализация SQLite базы данных"""
@@ -52,9 +74,13 @@ def init_database():
             total_price REAL,
             status TEXT DEFAULT 'confirmed',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            passenger_name TEXT,
             FOREIGN KEY (user_id) REFERENCES users (user_id)
         )
     ''')
+    # Базы до групповых бронирований: колонка имени пассажира
+    if 'passenger_name' not in {row[1] for row in cursor.execute('PRAGMA table_info(orders)')}:
+        cursor.execute('ALTER TABLE orders ADD COLUMN passenger_name TEXT')
     
     # Таблица товаров в заказе
     cursor.execute('''
@@ -69,12 +95,42 @@ def init_database():
         )
     ''')
     
+    # Индексы для истории заказов пользователя и товаров заказа
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_user_created
+        ON orders (user_id, created_at, order_id)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)')
+    
+    # Агрегаты продаж для отчетов
+    analytics.ensure_tables(cursor)
+    
+    # Поезда и места на даты
+    inventory.ensure_tables(cursor)
+    pricing.ensure_tables(cursor)
+    
+    # Журнал переходов статусов и счетчики заказов по статусам
+    order_lifecycle.ensure_tables(cursor)
+    
     conn.commit()
     conn.close()
     logger.info("База данных инициализирована")
 
-# Инициализация базы данных при импорте
-init_database()
+
+# Таблицы создаются один раз за процесс
+_database_ready = False
+_database_lock = threading.Lock()
+
+
+def ensure_database():
+    """Инициализация базы при первом использовании, а не при импорте модуля"""
+    global _database_ready
+    if _database_ready:
+        return
+    with _database_lock:
+        if not _database_ready:
+            init_database()
+            _database_ready = True
 
 
 class DatabaseManager:
@@ -96,55 +152,129 @@ class DatabaseManager:
                 user_data.get('last_name')
             ))
             conn.commit()
-            logger.info(f"Пользователь {user_data['user_id']} сохранен в БД")
+            logger.info("Пользователь %s сохранен в БД", user_data['user_id'])
         except Exception as e:
-            logger.error(f"Ошибка сохранения пользователя: {e}")
+            logger.error("Ошибка сохранения пользователя: %s", e)
         finally:
             conn.close()
     
     @staticmethod
-    def save_order(order_data: Dict):
+    def save_order(order_data: Dict) -> Optional[int]:
         """Сохраняет заказ в базу данных"""
+        order_ids = DatabaseManager.save_orders([order_data])
+        return order_ids[0] if order_ids else None
+    
+    @staticmethod
+    @registry.timed('db_query_seconds', query='save_orders')
+    def save_orders(orders: List[Dict]) -> List[int]:
+        """Сохраняет заказы одной транзакцией (групповое бронирование - заказ на пассажира)"""
         conn = sqlite3.connect(DATABASE_NAME)
         cursor = conn.cursor()
         try:
-            cursor.execute('''
-                INSERT INTO orders 
-                (user_id, ticket_number, destination, travel_date, scenario_name, total_price)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                order_data['user_id'], 
-                order_data['ticket_number'],
-                order_data.get('destination'), 
-                order_data.get('travel_date'),
-                order_data.get('scenario_name'),
-                order_data.get('total_price', 0)
-            ))
-            order_id = cursor.lastrowid
-            
-            # Сохраняем товары заказа
-            for item in order_data.get('items', []):
+            order_ids = []
+            for order_data in orders:
                 cursor.execute('''
-                    INSERT INTO order_items (order_id, item_type, item_name, price, quantity)
-                    VALUES (?, ?, ?, ?, ?)
+                    INSERT INTO orders 
+                    (user_id, ticket_number, destination, travel_date, scenario_name, total_price, passenger_name)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
                 ''', (
+                    order_data['user_id'], 
+                    order_data['ticket_number'],
+                    order_data.get('destination'), 
+                    order_data.get('travel_date'),
+                    order_data.get('scenario_name'),
+                    order_data.get('total_price', 0),
+                    order_data.get('passenger_name')
+                ))
+                order_ids.append(cursor.lastrowid)
+            
+            # Товары всех заказов одним пакетом
+            cursor.executemany('''
+                INSERT INTO order_items (order_id, item_type, item_name, price, quantity)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (
                     order_id,
                     item.get('type', 'product'),
                     item.get('name'),
                     item.get('price', 0),
                     item.get('quantity', 1)
-                ))
+                )
+                for order_id, order_data in zip(order_ids, orders)
+                for item in order_data.get('items', [])
+            ])
+            
+            # Агрегаты продаж и журнал статусов обновляются в той же транзакции
+            for order_data in orders:
+                analytics.record_order(cursor, order_data)
+            order_lifecycle.record_created(cursor, order_ids)
             
             conn.commit()
-            logger.info(f"Заказ {order_data['ticket_number']} сохранен в БД")
-            return order_id
+            logger.info("Заказы %s сохранены в БД", ', '.join(order['ticket_number'] for order in orders))
         except Exception as e:
-            logger.error(f"Ошибка сохранения заказа: {e}")
-            return None
+            logger.error("Ошибка сохранения заказа: %s", e)
+            conn.close()
+            return []
+        
+        # Заказы уже записаны: ошибка обновления кеша не отменяет сохранение
+        try:
+            # Write-through: сохраненные строки сразу попадают в кеш заказов
+            cursor.execute(
+                f"SELECT * FROM orders WHERE order_id IN ({', '.join('?' * len(order_ids))}) ORDER BY order_id",
+                order_ids
+            )
+            columns = [description[0] for description in cursor.description]
+            for row, order_data in zip(cursor.fetchall(), orders):
+                order = dict(zip(columns, row))
+                order['items_list'] = ', '.join(item.get('name') or '' for item in order_data.get('items', [])) or None
+                order_cache.add_order(order_data['user_id'], order)
+        except Exception as e:
+            logger.error("Ошибка обновления кеша заказов: %s", e)
+            DatabaseManager._invalidate_orders({order_data['user_id'] for order_data in orders})
         finally:
             conn.close()
+        
+        registry.inc('orders_total', len(orders))
+        registry.rate('orders_per_minute').add(len(orders))
+        histogram = registry.histogram('order_cart_size', buckets=SIZE_BUCKETS)
+        for order_data in orders:
+            histogram.observe(len(order_data.get('items', [])))
+        return order_ids
     
     @staticmethod
+    def _invalidate_orders(user_ids: List[int]):
+        """Сброс кеша заказов после смены статусов"""
+        for user_id in user_ids:
+            order_cache.invalidate(user_id)
+    
+    @staticmethod
+    @registry.timed('db_query_seconds', query='change_order_status')
+    def change_order_status(order_ids: List[int], status: str, reason: str = None) -> order_lifecycle.TransitionResult:
+        """Перевод заказов в статус одной транзакцией"""
+        result = order_lifecycle.transition(order_ids, status, reason, database=DATABASE_NAME)
+        DatabaseManager._invalidate_orders(result.user_ids)
+        return result
+    
+    @staticmethod
+    @registry.timed('db_query_seconds', query='refund_ticket')
+    def refund_ticket(user_id: int, ticket_number: str) -> order_lifecycle.TransitionResult:
+        """Возврат билета пользователем"""
+        result = order_lifecycle.refund_ticket(user_id, ticket_number, 'Возврат пользователем', database=DATABASE_NAME)
+        DatabaseManager._invalidate_orders(result.user_ids)
+        return result
+    
+    @staticmethod
+    @registry.timed('db_query_seconds', query='cancel_trip')
+    def cancel_trip(destination: str, travel_date: str, reason: str = None) -> order_lifecycle.TransitionResult:
+        """Отмена всех заказов на поезд (направление и дата)"""
+        result = order_lifecycle.cancel_trip(destination, travel_date, reason, database=DATABASE_NAME)
+        DatabaseManager._invalidate_orders(result.user_ids)
+        logger.info("Отмена поезда %s %s: заказов %s, возврат %.2f", destination, travel_date,
+                    result.orders, result.refunded)
+        return result
+    
+    @staticmethod
+    @registry.timed('db_query_seconds', query='get_user_orders')
     def get_user_orders(user_id: int) -> List[Dict]:
         """Получает заказы пользователя"""
         conn = sqlite3.connect(DATABASE_NAME)
@@ -157,7 +287,7 @@ class DatabaseManager:
                 LEFT JOIN order_items oi ON o.order_id = oi.order_id
                 WHERE o.user_id = ?
                 GROUP BY o.order_id
-                ORDER BY o.created_at DESC
+                ORDER BY o.created_at DESC, o.order_id DESC
                 LIMIT 10
             ''', (user_id,))
             
@@ -169,10 +299,44 @@ class DatabaseManager:
             
             return orders
         except Exception as e:
-            logger.error(f"Ошибка получения заказов: {e}")
+            logger.error("Ошибка получения заказов: %s", e)
             return []
         finally:
             conn.close()
+    
+    @staticmethod
+    @registry.timed('db_query_seconds', query='get_latest_order')
+    def get_latest_order(user_id: int) -> Optional[Dict]:
+        """Последний заказ пользователя (по индексу idx_orders_user_created)"""
+        conn = sqlite3.connect(DATABASE_NAME)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT o.*,
+                       (SELECT GROUP_CONCAT(oi.item_name, ', ')
+                        FROM order_items oi WHERE oi.order_id = o.order_id) as items_list
+                FROM orders o
+                WHERE o.user_id = ?
+                ORDER BY o.created_at DESC, o.order_id DESC
+                LIMIT 1
+            ''', (user_id,))
+            
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            columns = [description[0] for description in cursor.description]
+            return dict(zip(columns, row))
+        except Exception as e:
+            logger.error("Ошибка получения последнего заказа: %s", e)
+            return None
+        finally:
+            conn.close()
+
+
+# Кеш заказов для просмотра билетов
+order_cache = OrderCache(
+    DatabaseManager.get_user_orders, DatabaseManager.get_latest_order, ORDER_CACHE_SIZE, ORDER_CACHE_TTL
+)
 
 
 class UserState:
@@ -189,13 +353,23 @@ class UserState:
             'awaiting_destination': False,
             'destination': None,
             'date_text': None,
+            'travel_date': None,
             'scenario_id': None,
             'scenario_name': None,
             'booking_number': None,
             'passenger_name': 'Путешественник',
             'passenger_email': None,
-            'selected_promos': []
+            'passengers': [],
+            'selected_promos': [],
+            'seat_hold_id': None,
+            'confirmation_id': None
         }
+        # Последнее проданное удержание: возвращается, если заказ не сохранился
+        self.sold_hold_id: Optional[int] = None
+        # Сообщения пользователя и снятие его сроков выполняются по очереди
+        # (RLock: обработчик Telegram держит блокировку и вызывает process_message)
+        self.lock = threading.RLock()
+        self.touched_at = 0.0
         self.user_data = {}
         self.cart = {
             'products': [],
@@ -205,6 +379,7 @@ class UserState:
     
     def reset(self, clear_cart: bool = False):
         """Сброс состояния"""
+        self.release_seat()
         self.context = {
             'awaiting_confirmation': False,
             'awaiting_order_confirmation': False,
@@ -214,12 +389,16 @@ class UserState:
             'awaiting_destination': False,
             'destination': None,
             'date_text': None,
+            'travel_date': None,
             'scenario_id': None,
             'scenario_name': None,
             'booking_number': None,
             'passenger_name': 'Путешественник',
             'passenger_email': None,
-            'selected_promos': []
+            'passengers': [],
+            'selected_promos': [],
+            'seat_hold_id': None,
+            'confirmation_id': None
         }
         if clear_cart:
             self.clear_cart()
@@ -231,6 +410,53 @@ class UserState:
                 'promotions': self.cart['promotions']
             }
     
+    def set_travel_date(self, travel_date: date):
+        """Установка проверенной даты поездки"""
+        self.context['travel_date'] = travel_date.isoformat()
+        self.context['date_text'] = format_date(travel_date)
+    
+    def passenger_names(self) -> List[str]:
+        """Пассажиры заказа (без группы - один пассажир)"""
+        return self.context.get('passengers') or [self.context.get('passenger_name') or 'Путешественник']
+    
+    def hold_seat(self) -> bool:
+        """Удержание мест на выбранные направление и дату (повторное оформление - новое удержание)"""
+        if not (self.context.get('destination') and self.context.get('travel_date')):
+            return True
+        self.release_seat()
+        self.context['seat_hold_id'] = seat_inventory.hold(
+            self.user_id, self.context['destination'], self.context['travel_date'],
+            seats=len(self.passenger_names())
+        )
+        return self.context['seat_hold_id'] is not None
+    
+    def confirm_seat(self) -> bool:
+        """Продажа удержанного места; истекшее удержание оформляется заново, если места остались"""
+        hold_id = self.context.get('seat_hold_id')
+        self.sold_hold_id = None
+        if not (self.context.get('destination') and self.context.get('travel_date')):
+            return True
+        if hold_id is None or not seat_inventory.confirm(hold_id):
+            if not self.hold_seat() or not seat_inventory.confirm(self.context['seat_hold_id']):
+                self.context['seat_hold_id'] = None
+                return False
+        self.sold_hold_id = self.context['seat_hold_id']
+        self.context['seat_hold_id'] = None
+        return True
+    
+    def unsell_seat(self):
+        """Возврат проданного места, если заказ не удалось сохранить"""
+        if self.sold_hold_id is not None:
+            seat_inventory.unsell(self.sold_hold_id)
+            self.sold_hold_id = None
+    
+    def release_seat(self):
+        """Возврат удержанного места (отмена или сброс оформления)"""
+        hold_id = self.context.get('seat_hold_id')
+        if hold_id is not None:
+            self.context['seat_hold_id'] = None
+            seat_inventory.release(hold_id)
+    
     def clear_cart(self):
         """Очистка корзины"""
         self.cart = {
@@ -293,9 +519,9 @@ class UserState:
             })
         
         # Применяем скидку сценария
-        if self.context.get('scenario_id') and self.context['scenario_id'] in BOT_CONFIG['scenarios']:
-            scenario = BOT_CONFIG['scenarios'][self.context['scenario_id']]
-            discount = scenario['discount']
+        scenario = config_store.current.scenario(self.context.get('scenario_id'))
+        if scenario:
+            discount = scenario.discount
             discount_amount = total_price * discount / 100
             total_price -= discount_amount
         
@@ -317,18 +543,19 @@ class UserState:
     
     def apply_scenario(self, scenario_id: str) -> bool:
         """Применение сценария"""
-        if scenario_id in BOT_CONFIG['scenarios']:
-            scenario = BOT_CONFIG['scenarios'][scenario_id]
+        config = config_store.current
+        scenario = config.scenario(scenario_id)
+        if scenario:
             self.context['scenario_id'] = scenario_id
-            self.context['scenario_name'] = scenario['name']
+            self.context['scenario_name'] = scenario.name
             
             # Очищаем продукты (но оставляем промо-акции)
             self.cart['products'] = []
             self.cart['tickets'] = []
             
-            # Добавляем билет
+            # Добавляем билет (цена по спросу, сроку до поездки и дню недели)
             if self.context['destination']:
-                ticket_price = BOT_CONFIG['prices'].get(self.context['destination'], 1000)
+                ticket_price = dynamic_prices.price(self.context['destination'], self.context.get('travel_date'))
                 ticket_data = {
                     'name': f'Билет {self.context["destination"]}',
                     'price': ticket_price,
@@ -337,27 +564,45 @@ class UserState:
                 }
                 self.add_to_cart('ticket', f"ticket_{scenario_id}", ticket_data)
             
-            # Добавляем рекомендуемые услуги
-            for service_name in scenario.get('recommended_services', []):
-                if service_name in BOT_CONFIG['additional_services']:
-                    service_data = {
-                        'name': service_name,
-                        'price': BOT_CONFIG['additional_services'][service_name]
-                    }
-                    self.add_to_cart('product', f"product_{service_name}", service_data)
+            # Добавляем рекомендуемые услуги (неизвестные отсеяны при загрузке конфигурации)
+            for service in scenario.services:
+                service_data = {
+                    'name': service.name,
+                    'price': service.price
+                }
+                self.add_to_cart('product', f"product_{service.name}", service_data)
             
             return True
         return False
     
     def generate_ticket_number(self):
-        """Генерация уникального номера билета"""
-        if not self.context['booking_number']:
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            random_part = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=6))
-            self.context['booking_number'] = f"TK{timestamp[-6:]}{random_part}"
+        """Генерация уникального номера билета (новый номер для каждого заказа)"""
+        self.context['booking_number'] = ticket_ids.next_ticket_number()
         return self.context['booking_number']
     
-    def create_order_data(self, ticket_number: str) -> Dict:
+    def cart_hash(self) -> str:
+        """Хеш попытки оформления: корзина, направление, дата, сценарий и номер подтверждения"""
+        payload = json.dumps({
+            'user_id': self.user_id,
+            'confirmation_id': self.context.get('confirmation_id'),
+            'cart': self.cart,
+            'destination': self.context.get('destination'),
+            'travel_date': self.context.get('travel_date'),
+            'scenario_id': self.context.get('scenario_id'),
+            'passengers': self.passenger_names()
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    
+    def create_group_orders(self) -> List[Dict]:
+        """Заказ на каждого пассажира со своим номером билета"""
+        orders = [
+            self.create_order_data(ticket_ids.next_ticket_number(), name)
+            for name in self.passenger_names()
+        ]
+        self.context['booking_number'] = orders[0]['ticket_number']
+        return orders
+    
+    def create_order_data(self, ticket_number: str, passenger_name: str = None) -> Dict:
         """Создание данных заказа"""
         cart_summary = self.get_cart_summary()
         
@@ -393,27 +638,185 @@ class UserState:
             'travel_date': self.context.get('date_text'),
             'scenario_name': self.context.get('scenario_name'),
             'total_price': cart_summary['total_price'],
+            'passenger_name': passenger_name or self.context.get('passenger_name'),
             'items': items,
             'created_at': datetime.now().isoformat()
         }
 
 
+# Флаги ожидания в порядке приоритета обработки
+STATE_FLAGS = (
+    'awaiting_order_confirmation',
+    'awaiting_confirmation',
+    'awaiting_scenario_selection',
+    'awaiting_promo_selection',
+    'awaiting_date',
+    'awaiting_destination'
+)
+
+
 class TravelBot:
     """Основной класс бота"""
     
     def __init__(self):
+        ensure_database()
+        # Таблица цен строится при запуске: первые сообщения не получают базовую цену
+        dynamic_prices.refresh()
         self.user_states = {}
+        # Подтвержденные корзины: повтор "да" не создает второй заказ
+        self.confirmed_orders = DedupWindow(ORDER_DEDUP_WINDOW, ORDER_DEDUP_TTL)
+        self._confirm_lock = threading.Lock()
+        # Сроки брошенных подтверждений, корзин и сессий: ключ (user_id, вид)
+        self.expiry = ExpiryScheduler()
+        self._expiry_stop = threading.Event()
+        registry.gauge('sessions_alive', lambda: len(self.user_states), 'Активных сессий')
+        registry.gauge('expiry_timers', lambda: len(self.expiry), 'Активных таймеров истечения')
+        registry.gauge('cart_items', self._count_cart_items, 'Позиций в корзинах')
         logger.info("TravelBot инициализирован")
     
+    def _count_cart_items(self) -> int:
+        """Общее число позиций во всех корзинах"""
+        return sum(
+            len(state.cart['tickets']) + len(state.cart['products'])
+            for state in list(self.user_states.values())
+        )
+    
     def get_state(self, user_id: int) -> UserState:
         """Получение состояния пользователя"""
         if user_id not in self.user_states:
             self.user_states[user_id] = UserState(user_id)
         return self.user_states[user_id]
     
+    def save_sessions(self, path: str):
+        """Сохранение сессий в файл (через временный файл и атомарную замену)"""
+        sessions = {
+            str(user_id): {'context': state.context, 'user_data': state.user_data, 'cart': state.cart}
+            for user_id, state in list(self.user_states.items())
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as sessions_file:
+            json.dump(sessions, sessions_file, ensure_ascii=False, default=str)
+        os.replace(temp_path, path)
+        logger.info("Сохранено сессий: %s", len(sessions))
+    
+    def load_sessions(self, path: str) -> int:
+        """Восстановление сессий из файла"""
+        try:
+            with open(path, encoding='utf-8') as sessions_file:
+                sessions = json.load(sessions_file)
+        except (OSError, ValueError):
+            return 0
+        for user_id, saved in sessions.items():
+            state = self.get_state(int(user_id))
+            state.context.update(saved.get('context', {}))
+            state.user_data = saved.get('user_data', {})
+            state.cart = saved.get('cart', state.cart)
+            self._schedule_expiry(state)
+        logger.info("Восстановлено сессий: %s", len(sessions))
+        return len(sessions)
+    
+    @staticmethod
+    def _state_name(state: UserState) -> str:
+        """Текущее состояние диалога (для метрик)"""
+        for flag in STATE_FLAGS:
+            if state.context.get(flag):
+                return flag
+        return 'idle'
+    
     def process_message(self, text: str, user_data: Dict) -> str:
         """Обработка входящего сообщения"""
-        state = self.get_state(user_data['user_id'])
+        with self.session(user_data['user_id']) as state:
+            # Сообщение целиком обрабатывается по одной версии конфигурации
+            with config_store.pinned(), registry.timer('process_message_seconds', state=self._state_name(state)):
+                response = self._dispatch_message(text, state, user_data)
+        return response
+    
+    @contextmanager
+    def session(self, user_id: int):
+        """Состояние пользователя под его блокировкой: сроки не снимаются посреди обработки и продлеваются после нее"""
+        while True:
+            state = self.get_state(user_id)
+            state.lock.acquire()
+            # Сессия снята по сроку, пока сообщение ждало блокировку: берется новая
+            if self.user_states.get(user_id) is state:
+                break
+            state.lock.release()
+        try:
+            yield state
+        finally:
+            # Таймеры по итогу обработки: в т.ч. для кнопок Telegram, которые меняют состояние напрямую
+            try:
+                self._schedule_expiry(state)
+            finally:
+                state.touched_at = time.monotonic()
+                state.lock.release()
+    
+    def _schedule_expiry(self, state: UserState):
+        """Продление сроков после сообщения: сессия всегда, подтверждение и корзина - пока есть"""
+        user_id = state.user_id
+        now = time.monotonic()
+        self.expiry.touch((user_id, 'session'), SESSION_TTL, now)
+        if state.context['awaiting_order_confirmation']:
+            self.expiry.touch((user_id, 'confirmation'), CONFIRMATION_TTL, now)
+        else:
+            self.expiry.cancel((user_id, 'confirmation'))
+        if state.cart['tickets'] or state.cart['products']:
+            self.expiry.touch((user_id, 'cart'), CART_TTL, now)
+        else:
+            self.expiry.cancel((user_id, 'cart'))
+    
+    def expire_stale(self, now: float = None) -> List[Tuple[int, str]]:
+        """Снятие истекших подтверждений, корзин и сессий с возвратом удержанных мест"""
+        started = time.monotonic()
+        expired = []
+        for user_id, kind in self.expiry.expire(now):
+            state = self.user_states.get(user_id)
+            if state is None:
+                continue
+            with state.lock:
+                # Сообщение, обработанное после извлечения срока, уже продлило или сняло таймер
+                if (self.user_states.get(user_id) is not state or state.touched_at > started
+                        or self.expiry.deadline((user_id, kind)) is not None):
+                    continue
+                if kind == 'confirmation':
+                    state.context['awaiting_order_confirmation'] = False
+                    state.release_seat()
+                elif kind == 'cart':
+                    state.reset(clear_cart=True)
+                else:
+                    state.release_seat()
+                    self.user_states.pop(user_id, None)
+                    self.expiry.cancel((user_id, 'confirmation'))
+                    self.expiry.cancel((user_id, 'cart'))
+            expired.append((user_id, kind))
+            registry.inc('expired_total', kind=kind)
+        if expired:
+            logger.info("Снято по сроку: %s", len(expired))
+        return expired
+    
+    def start_expiry(self, interval: float, on_expired=None) -> threading.Thread:
+        """Фоновое снятие истекших сроков; on_expired(user_id, вид) - например, напоминание"""
+        def run():
+            while not self._expiry_stop.wait(interval):
+                try:
+                    for user_id, kind in self.expire_stale():
+                        if on_expired:
+                            on_expired(user_id, kind)
+                except Exception:
+                    logger.exception("Ошибка снятия истекших сессий")
+        
+        thread = threading.Thread(target=run, name='session-expiry', daemon=True)
+        thread.start()
+        return thread
+    
+    def stop_expiry(self):
+        self._expiry_stop.set()
+    
+    def _dispatch_message(self, text: str, state: UserState, user_data: Dict) -> str:
+        """Маршрутизация сообщения по состоянию диалога"""
         text_lower = text.lower().strip()
         
         # Обработка специальных команд
@@ -441,15 +844,9 @@ class TravelBot:
             return self._handle_destination_selection(text, state)
         
         # Обработка основных команд
-        if text_lower in ['москва', 'санкт-петербург', 'сочи', 'спб', 'питер']:
-            destination_map = {
-                'москва': 'Москва',
-                'санкт-петербург': 'Санкт-Петербург',
-                'сочи': 'Сочи',
-                'спб': 'Санкт-Петербург',
-                'питер': 'Санкт-Петербург'
-            }
-            state.context['destination'] = destination_map.get(text_lower, text)
+        destination = config_store.current.destinations.resolve(text)
+        if destination:
+            state.context['destination'] = destination
             
             if not state.context.get('date_text'):
                 return f"📍 Выбрано направление: {state.context['destination']}\n\n📅 Теперь выберите дату поездки (например: 'завтра', 'на выходные'):"
@@ -458,8 +855,11 @@ class TravelBot:
                 return f"📍 Направление: {state.context['destination']}\n📅 Дата: {state.context['date_text']}\n\nТеперь выберите тип путешествия!"
         
         # Обработка выбора даты
-        if text_lower in ['завтра', 'на выходные']:
-            state.context['date_text'] = text.capitalize()
+        if parse_date(text):
+            travel_date, error = parse_travel_date(text)
+            if error:
+                return error
+            state.set_travel_date(travel_date)
             
             if not state.context.get('destination'):
                 return f"📅 Дата выбрана: {state.context['date_text']}\n\n📍 Теперь выберите направление (Москва, СПб, Сочи):"
@@ -498,6 +898,9 @@ class TravelBot:
         elif text_lower == 'помощь':
             return self._show_help()
         
+        elif text_lower.startswith('пассажиры'):
+            return self._handle_passengers(text.strip()[len('пассажиры'):], state)
+        
         elif text_lower == 'сценарии':
             if state.context.get('destination') and state.context.get('date_text'):
                 state.context['awaiting_scenario_selection'] = True
@@ -529,14 +932,36 @@ class TravelBot:
         text_lower = text.lower().strip()
         
         if text_lower in ['да', 'yes', 'ок', 'подтверждаю', 'согласен', 'согласна', '✅ да, подтверждаю']:
-            # Генерируем номер билета
-            ticket_number = state.generate_ticket_number()
+            # Проверка и снятие флага атомарны: параллельный дубль не дойдет до БД
+            cart_hash = state.cart_hash()
+            with self._confirm_lock:
+                is_new = (
+                    state.context['awaiting_order_confirmation']
+                    and self.confirmed_orders.claim(cart_hash)
+                )
+                state.context['awaiting_order_confirmation'] = False
+            if not is_new:
+                registry.inc('duplicate_orders_total')
+                logger.info("Повторное подтверждение заказа пользователем %s пропущено", user_data['user_id'])
+                return (f"✅ Этот заказ уже подтвержден. Номер билета: "
+                        f"`{state.context.get('booking_number') or '—'}`")
+            
+            # Место продается до записи заказа; без места заказ не создается и может быть повторен
+            if not state.confirm_seat():
+                self.confirmed_orders.release(cart_hash)
+                return self._sold_out_message(state)
             
-            # Создаем данные заказа
-            order_data = state.create_order_data(ticket_number)
+            # Заказ с номером билета на каждого пассажира
+            orders = state.create_group_orders()
+            ticket_number = orders[0]['ticket_number']
             
-            # Сохраняем в БД
-            DatabaseManager.save_order(order_data)
+            # Сохраняем в БД одной транзакцией; без записи место и корзина возвращаются пользователю
+            if not DatabaseManager.save_orders(orders):
+                state.unsell_seat()
+                self.confirmed_orders.release(cart_hash)
+                state.context['booking_number'] = None
+                return (f"❌ {config_store.current.errors['booking_failed']}\n\n"
+                        f"Корзина сохранена: нажмите 'Оформить', чтобы повторить.")
             
             # Сохраняем пользователя
             DatabaseManager.save_user(user_data)
@@ -544,9 +969,6 @@ class TravelBot:
             # Очищаем корзину
             state.clear_cart()
             
-            # Сбрасываем состояния
-            state.context['awaiting_order_confirmation'] = False
-            
             # Формируем финальное сообщение
             response = f"""
 🎉 **БРОНИРОВАНИЕ ПОДТВЕРЖДЕНО!** 🎫
@@ -554,12 +976,12 @@ class TravelBot:
 ✅ **Ваш заказ успешно оформлен!**
 
 📋 **Детали заказа:**
-• Номер билета: `{ticket_number}`
+{self._render_ticket_numbers(orders)}
 • Направление: {state.context.get('destination', 'Не указано')}
 • Дата: {state.context.get('date_text', 'Не указана')}
 • Сценарий: {state.context.get('scenario_name', 'Не выбран')}
 
-💰 **Итоговая стоимость:** {order_data['total_price']:.2f} руб.
+💰 **Итоговая стоимость:** {sum(order['total_price'] for order in orders):.2f} руб.
 
 📧 **Информация отправлена:** {state.context.get('passenger_email', 'не указан')}
 
@@ -570,15 +992,50 @@ class TravelBot:
 Чтобы посмотреть его, нажмите '🎫 Мой билет'
 """
             
-            logger.info(f"Заказ подтвержден: {ticket_number} для пользователя {user_data['user_id']}")
+            logger.info("Заказ подтвержден: %s для пользователя %s",
+                        ', '.join(order['ticket_number'] for order in orders), user_data['user_id'])
             return response
         
         elif text_lower in ['нет', 'no', 'не', 'отменить', '❌ нет, отменить']:
             state.context['awaiting_order_confirmation'] = False
+            state.release_seat()
             return "❌ Заказ отменен. Вы можете изменить состав корзины и попробовать снова."
         
         return "Пожалуйста, подтвердите оформление заказа кнопкой '✅ Да, подтверждаю' или отмените кнопкой '❌ Нет, отменить'"
     
+    @staticmethod
+    def _render_ticket_numbers(orders: List[Dict]) -> str:
+        """Номера билетов в подтверждении: один билет или список по пассажирам"""
+        if len(orders) == 1:
+            return f"• Номер билета: `{orders[0]['ticket_number']}`"
+        lines = [f"• Билеты ({len(orders)}):"]
+        lines.extend(f"   {order['passenger_name']}: `{order['ticket_number']}`" for order in orders)
+        return "\n".join(lines)
+    
+    def _handle_passengers(self, argument: str, state: UserState) -> str:
+        """Состав группы: "пассажиры 3" или "пассажиры: Иван Петров, Анна Петрова\""""
+        limit = config_store.current.business['max_passengers_per_booking']
+        argument = argument.strip(' :')
+        by_count = argument.isdigit()
+        # Число проверяется до построения списка имен
+        count = int(argument) if by_count else None
+        names = [] if by_count else [name.strip() for name in argument.split(',') if name.strip()]
+        if not 1 <= (count if by_count else len(names)) <= limit:
+            return (f"👥 В одном бронировании от 1 до {limit} пассажиров.\n\n"
+                    f"Например: 'пассажиры 3' или 'пассажиры: Иван Петров, Анна Петрова'")
+        if by_count:
+            names = [f"Пассажир {number}" for number in range(1, count + 1)]
+        state.context['passengers'] = names if len(names) > 1 else []
+        # "пассажиры 1" - только сброс группы, имя пассажира остается прежним
+        if len(names) == 1 and not by_count:
+            state.context['passenger_name'] = names[0]
+        
+        # На подтверждении заказа места удерживаются заново под новый состав
+        if state.context['awaiting_order_confirmation']:
+            return self.process_order(state)
+        names = state.passenger_names()
+        return f"👥 Пассажиров: {len(names)}\n" + "\n".join(f"• {name}" for name in names)
+    
     def _handle_scenario_confirmation(self, text: str, state: UserState) -> str:
         """Обработка подтверждения сценария"""
         text_lower = text.lower().strip()
@@ -612,9 +1069,9 @@ class TravelBot:
                 return self._show_scenario_summary(state)
         
         # Проверка по названию
-        scenarios = BOT_CONFIG['scenarios']
+        scenarios = config_store.current.scenarios
         for scenario_id, scenario_data in scenarios.items():
-            if scenario_data['name'].lower() in text.lower():
+            if scenario_data.name.lower() in text.lower():
                 if state.apply_scenario(scenario_id):
                     return self._show_scenario_summary(state)
         
@@ -624,15 +1081,14 @@ class TravelBot:
         """Обработка выбора промо-акции"""
         try:
             promo_num = int(text.strip())
-            if 1 <= promo_num <= len(BOT_CONFIG['promotions']):
-                promo = BOT_CONFIG['promotions'][promo_num - 1]
-                
-                # Добавляем промо-акцию в корзину
-                if state.add_to_cart('promo', promo['id'], promo):
+            promo = config_store.current.promotion(promo_num)
+            if promo:
+                # Добавляем промо-акцию в корзину (копия полей: корзина сохраняется в JSON)
+                if state.add_to_cart('promo', promo.id, promo._asdict()):
                     state.context['awaiting_promo_selection'] = False
                     
-                    response = f"✅ **Добавлена акция: {promo['short']}**\n\n"
-                    response += f"{promo['full']}\n\n"
+                    response = f"✅ **Добавлена акция: {promo.short}**\n\n"
+                    response += f"{promo.full}\n\n"
                     
                     cart_summary = state.get_cart_summary()
                     if cart_summary['item_count'] > 0:
@@ -647,12 +1103,16 @@ class TravelBot:
     
     def _handle_date_selection(self, text: str, state: UserState) -> str:
         """Обработка выбора даты"""
-        state.context['date_text'] = text
+        travel_date, error = parse_travel_date(text)
+        if error:
+            return f"{error}\n\n📅 Например: 'завтра', '20 декабря', 'через неделю', 'в пятницу'"
+        
+        state.set_travel_date(travel_date)
         state.context['awaiting_date'] = False
         
         if state.context['destination']:
             state.context['awaiting_scenario_selection'] = True
-            response = f"📅 **Дата поездки: {text}**\n"
+            response = f"📅 **Дата поездки: {state.context['date_text']}**\n"
             response += f"📍 **Направление: {state.context['destination']}**\n\n"
             response += "Теперь выберите тип путешествия:\n\n"
             response += self._show_scenarios(state)
@@ -666,25 +1126,16 @@ class TravelBot:
     
     def _handle_destination_selection(self, text: str, state: UserState) -> str:
         """Обработка выбора направления"""
-        destination_map = {
-            'москва': 'Москва',
-            'мск': 'Москва',
-            'питер': 'Санкт-Петербург',
-            'спб': 'Санкт-Петербург',
-            'санкт-петербург': 'Санкт-Петербург',
-            'петербург': 'Санкт-Петербург',
-            'сочи': 'Сочи'
-        }
-        
-        text_lower = text.lower()
-        for key, value in destination_map.items():
-            if key in text_lower:
-                state.context['destination'] = value
-                break
-        
-        if not state.context['destination']:
-            state.context['destination'] = text
+        config = config_store.current
+        destination = config.destinations.resolve(text)
+        if not destination:
+            response = f"🤔 Не нашли направление «{text}».\n\n"
+            response += "📍 Доступные направления:\n"
+            response += "\n".join(f"• {name}" for name in config.prices)
+            response += "\n\nНапишите город еще раз:"
+            return response
         
+        state.context['destination'] = destination
         state.context['awaiting_destination'] = False
         
         if state.context['date_text']:
@@ -706,12 +1157,12 @@ class TravelBot:
             return "Сценарий не выбран."
         
         scenario_id = state.context['scenario_id']
-        scenario = BOT_CONFIG['scenarios'][scenario_id]
+        scenario = config_store.current.scenarios[scenario_id]
         
-        summary = f"✅ **Выбран сценарий: {scenario['name']}**\n\n"
-        summary += f"{random.choice(scenario.get('dialogue', ['Отличный выбор!']))}\n\n"
-        summary += f"📝 {scenario['description']}\n\n"
-        summary += f"💰 **Скидка по сценарию: {scenario['discount']}%**\n\n"
+        summary = f"✅ **Выбран сценарий: {scenario.name}**\n\n"
+        summary += f"{random.choice(scenario.dialogue)}\n\n"
+        summary += f"📝 {scenario.description}\n\n"
+        summary += f"💰 **Скидка по сценарию: {scenario.discount}%**\n\n"
         summary += "🛍️ **В корзину добавлены:**\n"
         
         cart_summary = state.get_cart_summary()
@@ -725,27 +1176,29 @@ class TravelBot:
         
         return summary
     
+    @registry.timed('render_seconds', view='show_scenarios')
     def _show_scenarios(self, state: UserState) -> str:
         """Показать доступные сценарии"""
-        scenarios = BOT_CONFIG['scenarios']
+        scenarios = config_store.current.scenarios
         
         response = "🎯 **Выберите тип путешествия:**\n\n"
-        for i, (scenario_id, scenario) in enumerate(scenarios.items(), 1):
-            response += f"{i}. **{scenario['name']}**\n"
-            response += f"   Скидка: {scenario['discount']}%\n"
-            response += f"   {scenario['description']}\n\n"
+        for i, scenario in enumerate(scenarios.values(), 1):
+            response += f"{i}. **{scenario.name}**\n"
+            response += f"   Скидка: {scenario.discount}%\n"
+            response += f"   {scenario.description}\n\n"
         response += "📝 Введите номер (1-5) или название сценария:"
         
         return response
     
+    @registry.timed('render_seconds', view='show_promotions')
     def _show_promotions(self, state: UserState) -> str:
         """Показать доступные промо-акции"""
-        promotions = BOT_CONFIG['promotions']
+        promotions = config_store.current.promotions
         
         response = "🎁 **ТЕКУЩИЕ АКЦИИ И ПРЕДЛОЖЕНИЯ**\n\n"
         for i, promo in enumerate(promotions, 1):
-            response += f"{i}. **{promo['short']}**\n"
-            response += f"   {promo['full']}\n\n"
+            response += f"{i}. **{promo.short}**\n"
+            response += f"   {promo.full}\n\n"
         response += "📝 Чтобы добавить акцию, введите её номер (1-6):"
         
         return response
@@ -757,11 +1210,12 @@ class TravelBot:
 
 📋 **Основные команды:**
 • Москва/СПб/Сочи - выбрать направление
-• Завтра/На выходные - выбрать дату
+• Завтра/20 декабря/Через неделю - выбрать дату
 • Сценарии - показать типы поездок
 • Акции - показать текущие акции
 • Корзина - просмотр корзины
 • Оформить - завершить покупку
+• Пассажиры 3 / Пассажиры: Иван, Анна - групповое бронирование
 • Сброс - начать заново
 • Помощь - показать это сообщение
 
@@ -789,6 +1243,7 @@ class TravelBot:
         else:
             return "Здравствуйте! Я помогу вам организовать путешествие! 🚂\n\nКуда хотите отправиться? (Москва, СПб, Сочи)"
     
+    @registry.timed('render_seconds', view='show_cart')
     def show_cart(self, state: UserState) -> str:
         """Показать содержимое корзины"""
         cart_summary = state.get_cart_summary()
@@ -822,7 +1277,7 @@ class TravelBot:
         
         # Скидка сценария
         if state.context.get('scenario_name'):
-            response += f"💰 **Скидка по сценарию '{state.context['scenario_name']}': {BOT_CONFIG['scenarios'][state.context['scenario_id']]['discount']}%**\n\n"
+            response += f"💰 **Скидка по сценарию '{state.context['scenario_name']}': {config_store.current.scenarios[state.context['scenario_id']].discount}%**\n\n"
         
         response += f"💵 **ИТОГО: {cart_summary['total_price']:.2f} руб.**\n\n"
         
@@ -835,6 +1290,7 @@ class TravelBot:
         
         return response
     
+    @registry.timed('render_seconds', view='process_order')
     def process_order(self, state: UserState) -> str:
         """Обработка оформления заказа"""
         cart_summary = state.get_cart_summary()
@@ -846,6 +1302,10 @@ class TravelBot:
         if not cart_summary['tickets']:
             return "Для оформления заказа нужен билет! Выберите сценарий путешествия. 🎫"
         
+        # Место держится, пока пользователь подтверждает заказ
+        if not state.hold_seat():
+            return self._sold_out_message(state)
+        
         response = "✅ **ПОДТВЕРЖДЕНИЕ ЗАКАЗА**\n\n"
         
         # Показываем детали заказа
@@ -857,8 +1317,12 @@ class TravelBot:
         if state.context.get('date_text'):
             response += f"📅 Дата: {state.context['date_text']}\n"
         
-        # Пассажир
-        response += f"👤 Пассажир: {state.context.get('passenger_name', 'Не указан')}\n"
+        # Пассажиры
+        passengers = state.passenger_names()
+        if len(passengers) == 1:
+            response += f"👤 Пассажир: {state.context.get('passenger_name', 'Не указан')}\n"
+        else:
+            response += f"👥 Пассажиры ({len(passengers)}): {', '.join(passengers)}\n"
         
         # Билеты
         response += "\n🎫 **Билеты:**\n"
@@ -882,10 +1346,14 @@ class TravelBot:
         
         # Скидка сценария
         if state.context.get('scenario_name'):
-            scenario = BOT_CONFIG['scenarios'][state.context['scenario_id']]
-            response += f"\n💰 **Скидка по сценарию '{scenario['name']}': {scenario['discount']}%**\n"
+            scenario = config_store.current.scenarios[state.context['scenario_id']]
+            response += f"\n💰 **Скидка по сценарию '{scenario.name}': {scenario.discount}%**\n"
         
-        response += f"\n💵 **Общая стоимость: {cart_summary['total_price']:.2f} руб.**\n\n"
+        if len(passengers) == 1:
+            response += f"\n💵 **Общая стоимость: {cart_summary['total_price']:.2f} руб.**\n\n"
+        else:
+            response += (f"\n💵 **Общая стоимость: {cart_summary['total_price'] * len(passengers):.2f} руб.** "
+                         f"({cart_summary['total_price']:.2f} руб. x {len(passengers)})\n\n")
         
         response += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
         response += "✅ **Подтвердить оформление заказа?**\n\n"
@@ -897,25 +1365,30 @@ class TravelBot:
         response += "Нажмите '✅ Да, подтверждаю' чтобы завершить оформление\n"
         response += "или '❌ Нет, отменить' для отмены"
         
-        # Устанавливаем состояние ожидания подтверждения заказа
+        # Устанавливаем состояние ожидания подтверждения заказа; новая попытка - новый ключ
+        # защиты от дублей, поэтому повторная покупка той же корзины не отклоняется
         state.context['awaiting_order_confirmation'] = True
+        state.context['confirmation_id'] = os.urandom(8).hex()
         
         return response
     
+    def _sold_out_message(self, state: UserState) -> str:
+        """Сообщение о распроданной дате"""
+        return (f"😔 На {state.context.get('date_text') or 'эту дату'} в {state.context['destination']} "
+                f"свободных мест нет.\n\nВыберите другую дату или направление.")
+    
+    @registry.timed('render_seconds', view='show_ticket')
     def show_ticket(self, state: UserState) -> str:
         """Показать электронный билет"""
         # Проверяем, есть ли подтвержденный заказ
         if not state.context.get('booking_number'):
             return "У вас нет активных билетов. Сначала оформите заказ! 🎫"
         
-        # Получаем заказы пользователя из БД
-        orders = DatabaseManager.get_user_orders(state.user_id)
-        if not orders:
+        # Последний заказ (из кеша или одним запросом по индексу)
+        latest_order = order_cache.get_latest(state.user_id)
+        if not latest_order:
             return "Билеты не найдены. Возможно, они были отменены."
         
-        # Берем последний заказ
-        latest_order = orders[0]
-        
         # Формируем билет
         ticket_response = f"""
 🎫 **ВАШ ЭЛЕКТРОННЫЙ БИЛЕТ**
@@ -927,7 +1400,7 @@ class TravelBot:
 • Направление: {latest_order.get('destination', 'Не указано')}
 • Дата поездки: {latest_order.get('travel_date', 'Не указана')}
 • Тип путешествия: {latest_order.get('scenario_name', 'Не выбран')}
-• Статус: ✅ Подтвержден
+• Статус: {order_lifecycle.render_status(latest_order.get('status', order_lifecycle.CONFIRMED))}
 • Дата бронирования: {datetime.fromisoformat(latest_order['created_at']).strftime('%d.%m.%Y %H:%M') if 'created_at' in latest_order else 'Неизвестно'}
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -989,10 +1462,10 @@ Email: {state.context.get('passenger_email', 'Не указан')}
         
         # Скидка
         if state.context.get('scenario_name'):
-            scenario = BOT_CONFIG['scenarios'][state.context['scenario_id']]
+            scenario = config_store.current.scenarios[state.context['scenario_id']]
             receipt += f"💰 СКИДКА\n"
-            receipt += f"Сценарий: {scenario['name']}\n"
-            receipt += f"Размер скидки: {scenario['discount']}%\n"
+            receipt += f"Сценарий: {scenario.name}\n"
+            receipt += f"Размер скидки: {scenario.discount}%\n"
             receipt += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
         
         # Акции
@@ -1009,9 +1482,17 @@ Email: {state.context.get('passenger_email', 'Не указан')}
         
         return receipt
     
+    @registry.timed('render_seconds', view='order_history')
+    def show_order_history(self, user_id: int, cursor: Optional[int] = None,
+                           direction: str = OLDER) -> Tuple[str, HistoryPage]:
+        """Страница истории заказов (keyset-пагинация)"""
+        page = fetch_page(user_id, cursor, direction)
+        return render_page(page), page
+    
+    @registry.timed('render_seconds', view='show_user_tickets')
     def show_user_tickets(self, user_id: int) -> str:
         """Показать все билеты пользователя"""
-        orders = DatabaseManager.get_user_orders(user_id)
+        orders = order_cache.get_orders(user_id)
         
         if not orders:
             return "🎫 У вас нет активных билетов. Начните новое бронирование!"
@@ -1023,7 +1504,7 @@ Email: {state.context.get('passenger_email', 'Не указан')}
             response += f"📍 Направление: {order.get('destination', 'Не указано')}\n"
             response += f"📅 Дата: {order.get('travel_date', 'Не указана')}\n"
             response += f"💰 Стоимость: {order.get('total_price', 0):.2f} руб.\n"
-            response += f"📋 Статус: {order.get('status', 'Неизвестно')}\n"
+            response += f"📋 Статус: {order_lifecycle.render_status(order.get('status'))}\n"
             
             created_date = None
             if 'created_at' in order:
@@ -0,0 +1,369 @@
+"""
+Аналитика продаж: агрегаты в таблице sales_rollup
+
+Агрегаты обновляются в транзакции save_order (отмена и возврат заказа
+вычитают его в своей транзакции), поэтому отчет читает несколько строк
+вместо полного прохода по orders. Пересчет с нуля (для уже накопленных
+данных) идет одним потоковым проходом по orders и order_items с накоплением
+в массивах array.
+
+Запуск:
+    python analytics.py              # отчет
+    python analytics.py --recompute  # пересчет агрегатов
+    python analytics.py --benchmark 200000
+"""
+
+import sqlite3
+import time
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+from config import DATABASE_NAME
+
+# Измерения отчета
+TOTAL = 'total'
+DESTINATION = 'destination'
+SCENARIO = 'scenario'
+PROMO = 'promo'
+
+# Ключи строк TOTAL: все заказы и заказы хотя бы с одной акцией
+ALL_ORDERS = 'all'
+WITH_PROMO = 'with_promo'
+
+# Отмененные и возвращенные заказы в агрегатах не учитываются
+EXCLUDED_STATUSES = ('cancelled', 'refunded')
+
+ROLLUP_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS sales_rollup (
+        dimension TEXT NOT NULL,
+        key TEXT NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        items INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, key)
+    )
+'''
+
+_UPSERT = '''
+    INSERT INTO sales_rollup (dimension, key, orders, revenue, items) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (dimension, key) DO UPDATE SET
+        orders = orders + excluded.orders,
+        revenue = revenue + excluded.revenue,
+        items = items + excluded.items
+'''
+
+
+def ensure_tables(cursor: sqlite3.Cursor):
+    """Создание таблицы агрегатов и заполнение по существующим заказам"""
+    cursor.execute(ROLLUP_SCHEMA)
+    empty = cursor.execute('SELECT 1 FROM sales_rollup LIMIT 1').fetchone() is None
+    if empty and cursor.execute('SELECT 1 FROM orders LIMIT 1').fetchone() is not None:
+        _replace_rollup(cursor, _aggregate(cursor.connection))
+
+
+def _order_rows(destination, scenario, revenue: float, items: int, promos: List[str]) -> List[Tuple]:
+    """Строки агрегатов, которые затрагивает один заказ"""
+    rows = [
+        (TOTAL, ALL_ORDERS, 1, revenue, items),
+        (DESTINATION, destination or '—', 1, revenue, items),
+        (SCENARIO, scenario or '—', 1, revenue, items)
+    ]
+    if promos:
+        rows.append((TOTAL, WITH_PROMO, 1, revenue, items))
+        rows.extend((PROMO, name, 1, revenue, items) for name in set(promos))
+    return rows
+
+
+def record_order(cursor: sqlite3.Cursor, order_data: Dict):
+    """Учет заказа в агрегатах (в транзакции сохранения заказа)"""
+    items = order_data.get('items', [])
+    cursor.executemany(_UPSERT, _order_rows(
+        order_data.get('destination'),
+        order_data.get('scenario_name'),
+        order_data.get('total_price', 0) or 0,
+        sum(1 for item in items if item.get('type') != 'promo'),
+        [item.get('name') or '—' for item in items if item.get('type') == 'promo']
+    ))
+
+
+def forget_orders(cursor: sqlite3.Cursor, where: str, params: Tuple):
+    """Исключение заказов условия where из агрегатов (в транзакции отмены или возврата)"""
+    promos: Dict[int, set] = {}
+    for order_id, name in cursor.execute(
+        f"SELECT order_id, item_name FROM order_items WHERE item_type = 'promo' "
+        f"AND order_id IN (SELECT order_id FROM orders WHERE {where})", params
+    ):
+        promos.setdefault(order_id, set()).add(name or '—')
+
+    totals: Dict[Tuple[str, str], List] = {}
+    for order_id, destination, scenario, revenue, items in cursor.execute(
+        f"SELECT order_id, destination, scenario_name, COALESCE(total_price, 0), "
+        f"(SELECT COUNT(*) FROM order_items WHERE order_items.order_id = orders.order_id "
+        f"AND item_type != 'promo') FROM orders WHERE {where}", params
+    ).fetchall():
+        for dimension, key, _, _, _ in _order_rows(destination, scenario, revenue, items, promos.get(order_id)):
+            row = totals.setdefault((dimension, key), [0, 0.0, 0])
+            row[0] -= 1
+            row[1] -= revenue
+            row[2] -= items
+    cursor.executemany(_UPSERT, [
+        (dimension, key, orders, revenue, items) for (dimension, key), (orders, revenue, items) in totals.items()
+    ])
+
+
+class _Column:
+    """Агрегаты одного измерения: ключ -> индекс в массивах"""
+
+    __slots__ = ('index', 'orders', 'revenue', 'items')
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.orders = array('q')
+        self.revenue = array('d')
+        self.items = array('q')
+
+    def slot(self, key: str) -> int:
+        position = self.index.get(key)
+        if position is None:
+            position = self.index[key] = len(self.orders)
+            self.orders.append(0)
+            self.revenue.append(0.0)
+            self.items.append(0)
+        return position
+
+    def add(self, key: str, revenue: float, items: int):
+        position = self.slot(key)
+        self.orders[position] += 1
+        self.revenue[position] += revenue
+        self.items[position] += items
+
+
+def _iter_items(conn: sqlite3.Connection, chunk_size: int) -> Iterator[Tuple]:
+    """Товары заказов по возрастанию order_id"""
+    cursor = conn.execute('SELECT order_id, item_type, item_name FROM order_items ORDER BY order_id')
+    cursor.arraysize = chunk_size
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            return
+        yield from rows
+
+
+def _aggregate(conn: sqlite3.Connection, chunk_size: int = 10000) -> Dict[str, _Column]:
+    """Пересчет агрегатов: слияние отсортированных потоков orders и order_items"""
+    columns = {TOTAL: _Column(), DESTINATION: _Column(), SCENARIO: _Column(), PROMO: _Column()}
+    total, destinations, scenarios, promos = (columns[name] for name in (TOTAL, DESTINATION, SCENARIO, PROMO))
+
+    items = _iter_items(conn, chunk_size)
+    pending = next(items, None)
+    cursor = conn.execute(
+        f"SELECT order_id, destination, scenario_name, total_price FROM orders "
+        f"WHERE status IS NULL OR status NOT IN ({', '.join('?' * len(EXCLUDED_STATUSES))}) ORDER BY order_id",
+        EXCLUDED_STATUSES
+    )
+    cursor.arraysize = chunk_size
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        for order_id, destination, scenario, revenue in rows:
+            basket = 0
+            order_promos = set()
+            # Пропуск товаров удаленных заказов и сбор товаров текущего
+            while pending is not None and pending[0] <= order_id:
+                if pending[0] == order_id:
+                    if pending[1] == 'promo':
+                        order_promos.add(pending[2] or '—')
+                    else:
+                        basket += 1
+                pending = next(items, None)
+
+            revenue = revenue or 0
+            total.add(ALL_ORDERS, revenue, basket)
+            destinations.add(destination or '—', revenue, basket)
+            scenarios.add(scenario or '—', revenue, basket)
+            if order_promos:
+                total.add(WITH_PROMO, revenue, basket)
+                for name in order_promos:
+                    promos.add(name, revenue, basket)
+    return columns
+
+
+def _replace_rollup(cursor: sqlite3.Cursor, columns: Dict[str, _Column]):
+    """Замена содержимого sales_rollup результатом пересчета"""
+    cursor.execute('DELETE FROM sales_rollup')
+    cursor.executemany(
+        'INSERT INTO sales_rollup (dimension, key, orders, revenue, items) VALUES (?, ?, ?, ?, ?)',
+        (
+            (dimension, key, column.orders[position], column.revenue[position], column.items[position])
+            for dimension, column in columns.items()
+            for key, position in column.index.items()
+        )
+    )
+
+
+def recompute(database: str = DATABASE_NAME, chunk_size: int = 10000) -> int:
+    """Полный пересчет агрегатов; возвращает число учтенных заказов"""
+    conn = sqlite3.connect(database)
+    try:
+        # BEGIN IMMEDIATE: новые заказы не попадут между пересчетом и заменой
+        conn.isolation_level = None
+        conn.execute('BEGIN IMMEDIATE')
+        columns = _aggregate(conn, chunk_size)
+        _replace_rollup(conn.cursor(), columns)
+        conn.execute('COMMIT')
+        total = columns[TOTAL]
+        return total.orders[total.index[ALL_ORDERS]] if ALL_ORDERS in total.index else 0
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def load_report(database: str = DATABASE_NAME) -> Dict[str, Dict[str, Tuple[int, float, int]]]:
+    """Агрегаты по измерениям: {измерение: {ключ: (заказы, выручка, позиции)}}"""
+    conn = sqlite3.connect(database)
+    try:
+        report: Dict[str, Dict[str, Tuple[int, float, int]]] = {}
+        for dimension, key, orders, revenue, items in conn.execute(
+            'SELECT dimension, key, orders, revenue, items FROM sales_rollup ORDER BY revenue DESC'
+        ):
+            report.setdefault(dimension, {})[key] = (orders, revenue, items)
+        return report
+    finally:
+        conn.close()
+
+
+def render_report(report: Dict[str, Dict[str, Tuple[int, float, int]]]) -> str:
+    """Текст отчета для администратора"""
+    orders, revenue, items = report.get(TOTAL, {}).get(ALL_ORDERS, (0, 0.0, 0))
+    if not orders:
+        return "📊 Заказов пока нет."
+
+    promo_orders = report.get(TOTAL, {}).get(WITH_PROMO, (0, 0.0, 0))[0]
+    lines = [
+        "📊 ОТЧЕТ ПО ПРОДАЖАМ",
+        f"Заказов: {orders}, выручка: {revenue:.2f} руб.",
+        f"Средний чек: {revenue / orders:.2f} руб., позиций в заказе: {items / orders:.2f}",
+        f"Заказов с акциями: {promo_orders} ({promo_orders / orders * 100:.1f}%)",
+        "",
+        "Выручка по направлениям:"
+    ]
+    for key, (count, amount, _) in report.get(DESTINATION, {}).items():
+        lines.append(f"• {key}: {amount:.2f} руб. ({count} заказов)")
+
+    lines += ["", "Сценарии:"]
+    for key, (count, _, _) in sorted(report.get(SCENARIO, {}).items(), key=lambda entry: -entry[1][0]):
+        lines.append(f"• {key}: {count / orders * 100:.1f}% ({count})")
+
+    if report.get(PROMO):
+        lines += ["", "Использование акций:"]
+        for key, (count, _, _) in sorted(report[PROMO].items(), key=lambda entry: -entry[1][0]):
+            lines.append(f"• {key}: {count} ({count / orders * 100:.1f}% заказов)")
+    return "\n".join(lines)
+
+
+def _benchmark(count: int):
+    """Отчет по агрегатам против полного прохода по таблицам"""
+    import os
+    import random
+    import tempfile
+
+    database = os.path.join(tempfile.mkdtemp(), 'analytics.db')
+    conn = sqlite3.connect(database)
+    conn.executescript('''
+        CREATE TABLE orders (
+            order_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, ticket_number TEXT,
+            destination TEXT, travel_date TEXT, scenario_name TEXT, total_price REAL,
+            status TEXT DEFAULT 'confirmed', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE order_items (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT, order_id INTEGER, item_type TEXT,
+            item_name TEXT, price REAL, quantity INTEGER DEFAULT 1
+        );
+        CREATE INDEX idx_order_items_order ON order_items (order_id);
+    ''')
+    conn.execute(ROLLUP_SCHEMA)
+    destinations = ['Москва', 'Санкт-Петербург', 'Сочи', 'Казань', 'Калининград']
+    scenarios = ['Эконом', 'Стандартный', 'Комфорт', 'Бизнес', 'Семейный']
+    promo_names = ['Первый заказ', 'Раннее бронирование', 'Выходные']
+
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    for order_id in range(1, count + 1):
+        order = {
+            'destination': random.choice(destinations),
+            'scenario_name': random.choice(scenarios),
+            'total_price': round(random.uniform(1000, 9000), 2),
+            'items': [{'type': 'ticket', 'name': 'Билет'}]
+                     + [{'type': 'product', 'name': 'Услуга'}] * random.randint(0, 3)
+                     + ([{'type': 'promo', 'name': random.choice(promo_names)}] if random.random() < 0.3 else [])
+        }
+        cursor.execute(
+            'INSERT INTO orders (order_id, destination, scenario_name, total_price) VALUES (?, ?, ?, ?)',
+            (order_id, order['destination'], order['scenario_name'], order['total_price'])
+        )
+        cursor.executemany(
+            'INSERT INTO order_items (order_id, item_type, item_name) VALUES (?, ?, ?)',
+            ((order_id, item['type'], item['name']) for item in order['items'])
+        )
+        record_order(cursor, order)
+    conn.commit()
+    print(f"Заказов: {count}, запись с обновлением агрегатов: {time.perf_counter() - started:.1f} с")
+
+    started = time.perf_counter()
+    scan = conn.execute('''
+        SELECT destination, COUNT(*), SUM(total_price) FROM orders GROUP BY destination
+    ''').fetchall()
+    conn.execute('''
+        SELECT oi.item_name, COUNT(DISTINCT oi.order_id) FROM order_items oi
+        WHERE oi.item_type = 'promo' GROUP BY oi.item_name
+    ''').fetchall()
+    conn.execute('SELECT scenario_name, COUNT(*) FROM orders GROUP BY scenario_name').fetchall()
+    scan_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    report = load_report(database)
+    text = render_report(report)
+    rollup_ms = (time.perf_counter() - started) * 1000
+    print(f"Отчет полным проходом: {scan_ms:.1f} мс, по агрегатам: {rollup_ms:.2f} мс")
+
+    incremental = report
+    started = time.perf_counter()
+    recompute(database)
+    print(f"Пересчет с нуля: {time.perf_counter() - started:.2f} с")
+    recomputed = load_report(database)
+    for dimension, rows in incremental.items():
+        for key, (orders, revenue, items) in rows.items():
+            again = recomputed[dimension][key]
+            assert orders == again[0] and items == again[2] and abs(revenue - again[1]) < 1e-3 * max(1, revenue)
+    for key, orders, revenue in scan:
+        assert incremental[DESTINATION][key][0] == orders
+        assert abs(incremental[DESTINATION][key][1] - revenue) < 1e-6 * revenue
+    print("Инкрементальные агрегаты совпадают с пересчетом\n")
+    print(text)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=DATABASE_NAME)
+    parser.add_argument('--recompute', action='store_true', help="пересчитать агрегаты по всем заказам")
+    parser.add_argument('--benchmark', type=int, metavar='N', help="бенчмарк на N синтетических заказах")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark(args.benchmark)
+        return
+    if args.recompute:
+        started = time.perf_counter()
+        orders = recompute(args.database)
+        print(f"Агрегаты пересчитаны: {orders} заказов за {time.perf_counter() - started:.2f} с")
+    print(render_report(load_report(args.database)))
+
+
+if __name__ == "__main__":
+    main()
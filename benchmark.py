@@ -0,0 +1,418 @@
+"""
+Сквозной бенчмарк: синтетические пользователи проходят полный цикл бронирования
+
+Примеры:
+    python benchmark.py --users 2000
+    python benchmark.py --mode telegram --users 500 --output results.json
+    python benchmark.py --compare bench_results/baseline.json
+    python benchmark.py --mode startup --runs 10
+    python benchmark.py --mode group --runs 50
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Шаги сценария для TravelBot.process_message
+CORE_FLOW = [
+    ('destination', 'москва'),
+    ('date', 'завтра'),
+    ('scenario', '2'),
+    ('scenario_confirm', 'да'),
+    ('promotions', 'акции'),
+    ('promo', '1'),
+    ('cart', 'корзина'),
+    ('checkout', 'оформить'),
+    ('confirm', 'да'),
+    ('ticket', None)
+]
+
+# Шаги сценария для обработчиков telegram_sales_bot
+TELEGRAM_FLOW = [
+    ('start', '/start'),
+    ('destination', '📍 Москва'),
+    ('date', '📅 Завтра'),
+    ('scenario', '🎯 2. Стандартный'),
+    ('scenario_confirm', '✅ Да, подтверждаю'),
+    ('promotions', '🎁 Акции'),
+    ('promo', '🎁 1. Первый заказ - 1...'),
+    ('cart', '🛒 Корзина'),
+    ('checkout', '✅ Оформить'),
+    ('confirm', '✅ Да, подтверждаю'),
+    ('ticket', '/ticket')
+]
+
+
+# Процесс бота для замера запуска: Bot API заменяется заглушкой
+STARTUP_SCRIPT = """
+import config
+config.TELEGRAM_API_URL = {api_url!r}
+config.METRICS_PORT = {metrics_port}
+import telegram_sales_bot
+telegram_sales_bot.main()
+"""
+
+# Цель: первый ответ бота не позднее чем через 200 мс после запуска процесса
+STARTUP_TARGET_MS = 200
+
+# Групповое бронирование: пассажиров в группе (предел business.max_passengers_per_booking)
+GROUP_SIZE = 10
+
+
+class StubBot:
+    """Заглушка отправки сообщений: считает вызовы вместо обращения к API"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+        return SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=text)
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Перцентиль по отсортированному списку"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[index]
+
+
+def _peak_rss_mb() -> float:
+    """Пиковое потребление памяти процессом, МБ"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает КБ, macOS - байты
+    return usage / 1024 / 1024 if sys.platform == 'darwin' else usage / 1024
+
+
+def _git_commit() -> str:
+    """Текущий коммит репозитория (если доступен)"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _make_message(user_id: int, text: str) -> SimpleNamespace:
+    """Объект сообщения с полями, которые читают обработчики"""
+    return SimpleNamespace(
+        text=text,
+        chat=SimpleNamespace(id=user_id),
+        from_user=SimpleNamespace(
+            id=user_id, username=f"user{user_id}", first_name="Бенч", last_name=str(user_id)
+        )
+    )
+
+
+def _core_steps() -> Tuple[List[Tuple[str, Callable[[int], object]]], Dict]:
+    """Шаги, вызывающие TravelBot напрямую"""
+    from advanced_bot import TravelBot
+
+    travel_bot = TravelBot()
+    steps = []
+    for name, text in CORE_FLOW:
+        if text is None:
+            steps.append((name, lambda user_id: travel_bot.show_ticket(travel_bot.get_state(user_id))))
+        else:
+            steps.append((name, lambda user_id, text=text: travel_bot.process_message(text, {'user_id': user_id})))
+    return steps, {}
+
+
+def _telegram_steps() -> Tuple[List[Tuple[str, Callable[[int], object]]], Dict]:
+    """Шаги, вызывающие обработчики Telegram с заглушкой bot"""
+    import telegram_sales_bot as tsb
+
+    tsb.create_app()
+    stub = StubBot()
+    tsb.bot.send_message = stub.send_message
+    commands = {'/start': tsb.handle_start, '/ticket': tsb.handle_ticket_command}
+
+    steps = []
+    for name, text in TELEGRAM_FLOW:
+        handler = commands.get(text, tsb.handle_all_messages)
+        steps.append((name, lambda user_id, text=text, handler=handler: handler(_make_message(user_id, text))))
+    return steps, {'stub': stub}
+
+
+def run(mode: str, users: int) -> Dict:
+    """Прогон сценария для всех пользователей, шаг за шагом"""
+    steps, extra = _core_steps() if mode == 'core' else _telegram_steps()
+
+    latencies: Dict[str, List[float]] = {name: [] for name, _ in steps}
+    user_ids = list(range(1_000_000, 1_000_000 + users))
+
+    started = time.perf_counter()
+    for name, step in steps:
+        samples = latencies[name]
+        for user_id in user_ids:
+            step_start = time.perf_counter()
+            step(user_id)
+            samples.append(time.perf_counter() - step_start)
+    elapsed = time.perf_counter() - started
+
+    total_messages = users * len(steps)
+    result = {
+        'mode': mode,
+        'users': users,
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'messages': total_messages,
+        'elapsed_seconds': round(elapsed, 3),
+        'messages_per_second': round(total_messages / elapsed, 1),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'steps': {}
+    }
+    for name, samples in latencies.items():
+        samples.sort()
+        result['steps'][name] = {
+            'p50_ms': round(_percentile(samples, 50) * 1000, 4),
+            'p95_ms': round(_percentile(samples, 95) * 1000, 4),
+            'p99_ms': round(_percentile(samples, 99) * 1000, 4)
+        }
+    if 'stub' in extra:
+        result['sent_messages'] = extra['stub'].sent
+    return result
+
+
+def _free_port() -> int:
+    """Свободный TCP-порт на localhost"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _import_times(module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """Время импорта модуля (-X importtime), мс, и самые медленные из его прямых импортов"""
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=tempfile.mkdtemp(prefix='travel_bot_import_'), env=dict(os.environ, PYTHONPATH=REPO_DIR),
+        capture_output=True, text=True, check=True
+    ).stderr
+    # Строки идут в порядке завершения импорта: вложенные модули перед родителем,
+    # глубина вложенности - число пробелов перед именем
+    children: List[Tuple[str, float]] = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative) / 1000))
+        elif depth == 0:
+            if name.strip() == module:
+                children.sort(key=lambda item: item[1], reverse=True)
+                return int(cumulative) / 1000, children[:10]
+            children = []
+    raise RuntimeError(f"Нет данных -X importtime для {module}")
+
+
+def run_startup(runs: int) -> Dict:
+    """Время от запуска процесса telegram_sales_bot до первого ответа на /start"""
+    from fake_telegram_api import FakeTelegramAPI, start_fake_api
+
+    samples = []
+    for _ in range(runs):
+        api = FakeTelegramAPI()
+        api.add_update(1_000_000, '/start')
+        server = start_fake_api(api, port=0)
+        # Обрыв соединений при остановке процесса бота - не ошибка замера
+        server.handle_error = lambda request, client_address: None
+        script = STARTUP_SCRIPT.format(
+            api_url=f"http://127.0.0.1:{server.server_address[1]}", metrics_port=_free_port()
+        )
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-c', script], cwd=tempfile.mkdtemp(prefix='travel_bot_startup_'),
+            env=dict(os.environ, PYTHONPATH=REPO_DIR), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        answered = api.first_message.wait(timeout=30)
+        elapsed = time.perf_counter() - started
+        # Состояние процесса во временном каталоге не нужно: штатная остановка не ждется
+        process.kill()
+        process.wait()
+        server.shutdown()
+        server.server_close()
+        if not answered:
+            raise RuntimeError("Бот не ответил на /start за 30 с")
+        samples.append(elapsed)
+
+    samples.sort()
+    import_ms, slowest = _import_times('telegram_sales_bot')
+    return {
+        'mode': 'startup',
+        'runs': runs,
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'first_response_p50_ms': round(_percentile(samples, 50) * 1000, 1),
+        'first_response_max_ms': round(samples[-1] * 1000, 1),
+        'import_ms': round(import_ms, 1),
+        'slowest_imports': [[name, round(ms, 1)] for name, ms in slowest]
+    }
+
+
+def run_group(runs: int) -> Dict:
+    """Оформление и подтверждение группы из GROUP_SIZE пассажиров против GROUP_SIZE заказов по одному"""
+    import sqlite3
+    from advanced_bot import TravelBot
+    from config import DATABASE_NAME
+
+    travel_bot = TravelBot()
+    # Мест хватает на все прогоны: замеряется запись заказов, а не распродажа
+    with sqlite3.connect(DATABASE_NAME) as conn:
+        conn.execute('UPDATE trains SET seats = 1000000')
+
+    def prepare(user_id: int):
+        for name, text in CORE_FLOW:
+            if name == 'checkout':
+                return
+            travel_bot.process_message(text, {'user_id': user_id})
+
+    def checkout(user_id: int) -> float:
+        started = time.perf_counter()
+        travel_bot.process_message('оформить', {'user_id': user_id})
+        response = travel_bot.process_message('да', {'user_id': user_id})
+        elapsed = time.perf_counter() - started
+        if 'ПОДТВЕРЖДЕНО' not in response:
+            raise RuntimeError(f"Заказ пользователя {user_id} не оформлен: {response[:80]!r}")
+        return elapsed
+
+    group_samples, sequential_samples = [], []
+    user_id = 2_000_000
+    for _ in range(runs):
+        user_id += 1
+        prepare(user_id)
+        travel_bot.process_message(f'пассажиры {GROUP_SIZE}', {'user_id': user_id})
+        group_samples.append(checkout(user_id))
+
+        sequential = 0.0
+        for _ in range(GROUP_SIZE):
+            user_id += 1
+            prepare(user_id)
+            sequential += checkout(user_id)
+        sequential_samples.append(sequential)
+
+    group_samples.sort()
+    sequential_samples.sort()
+    group_ms = _percentile(group_samples, 50) * 1000
+    sequential_ms = _percentile(sequential_samples, 50) * 1000
+    return {
+        'mode': 'group',
+        'runs': runs,
+        'group_size': GROUP_SIZE,
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'group_p50_ms': round(group_ms, 3),
+        'group_p95_ms': round(_percentile(group_samples, 95) * 1000, 3),
+        'sequential_p50_ms': round(sequential_ms, 3),
+        'sequential_p95_ms': round(_percentile(sequential_samples, 95) * 1000, 3),
+        'speedup': round(sequential_ms / group_ms, 2)
+    }
+
+
+def print_group_report(result: Dict, baseline: Dict = None):
+    """Вывод сравнения группового и последовательного оформления"""
+    size = result['group_size']
+    print(f"Прогонов: {result['runs']}, пассажиров в группе: {size}, коммит: {result['commit']}")
+    print(f"Группа из {size} (оформить + да): p50 {result['group_p50_ms']} мс, p95 {result['group_p95_ms']} мс")
+    print(f"{size} заказов по одному:       p50 {result['sequential_p50_ms']} мс, "
+          f"p95 {result['sequential_p95_ms']} мс")
+    print(f"Групповое оформление быстрее в {result['speedup']} раза")
+    if baseline and baseline.get('mode') == 'group':
+        before = baseline['group_p50_ms']
+        print(f"Группа: {before} -> {result['group_p50_ms']} мс "
+              f"({(result['group_p50_ms'] - before) / before * 100:+.1f}%)")
+
+
+def print_startup_report(result: Dict, baseline: Dict = None):
+    """Вывод замера запуска (и сравнения с базовым прогоном)"""
+    p50 = result['first_response_p50_ms']
+    status = "в пределах цели" if p50 <= STARTUP_TARGET_MS else "выше цели"
+    print(f"Запусков: {result['runs']}, коммит: {result['commit']}")
+    print(f"Первый ответ после запуска: p50 {p50} мс, max {result['first_response_max_ms']} мс "
+          f"({status} {STARTUP_TARGET_MS} мс)")
+    print(f"Импорт telegram_sales_bot: {result['import_ms']} мс, самые медленные модули:")
+    for name, ms in result['slowest_imports']:
+        print(f"  {name:<24}{ms:>8.1f} мс")
+    if baseline and baseline.get('mode') == 'startup':
+        before = baseline['first_response_p50_ms']
+        print(f"Первый ответ: {before} -> {p50} мс ({(p50 - before) / before * 100:+.1f}%)")
+
+
+def print_report(result: Dict, baseline: Dict = None):
+    """Вывод результатов (и сравнения с базовым прогоном)"""
+    print(f"Режим: {result['mode']}, пользователей: {result['users']}, коммит: {result['commit']}")
+    print(f"Сообщений: {result['messages']} за {result['elapsed_seconds']} с "
+          f"({result['messages_per_second']} сообщ./с), пик RSS: {result['peak_rss_mb']} МБ")
+    print(f"{'шаг':<18}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, stats in result['steps'].items():
+        line = f"{name:<18}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+        if baseline and name in baseline.get('steps', {}):
+            before = baseline['steps'][name]['p95_ms']
+            if before:
+                line += f"   p95 {(stats['p95_ms'] - before) / before * 100:+.1f}%"
+        print(line)
+    if baseline:
+        before = baseline['messages_per_second']
+        print(f"Пропускная способность: {before} -> {result['messages_per_second']} сообщ./с "
+              f"({(result['messages_per_second'] - before) / before * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['core', 'telegram', 'startup', 'group'], default='core',
+                        help="core - TravelBot.process_message, telegram - обработчики бота с заглушкой API, "
+                             "startup - время до первого ответа нового процесса бота, "
+                             "group - групповой заказ против заказов по одному")
+    parser.add_argument('--users', type=int, default=1000, help="число синтетических пользователей")
+    parser.add_argument('--output', help="файл JSON с результатами (по умолчанию bench_results/<коммит>-<режим>.json)")
+    parser.add_argument('--compare', help="JSON предыдущего прогона для сравнения")
+    parser.add_argument('--runs', type=int, default=5,
+                        help="число запусков процесса в режиме startup, число групп в режиме group")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(REPO_DIR, 'bench_results', f"{_git_commit()}-{args.mode}.json")
+    output = os.path.abspath(output)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    # База данных и логи бота создаются во временном каталоге
+    os.chdir(tempfile.mkdtemp(prefix='travel_bot_bench_'))
+    logging.disable(logging.INFO)
+
+    if args.mode == 'startup':
+        result = run_startup(args.runs)
+        print_startup_report(result, baseline)
+    elif args.mode == 'group':
+        result = run_group(args.runs)
+        print_group_report(result, baseline)
+    else:
+        result = run(args.mode, args.users)
+        print_report(result, baseline)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(result, output_file, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены: {output}")
+
+
+if __name__ == "__main__":
+    main()
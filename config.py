@@ -4,11 +4,139 @@
 
 # Токен бота Telegram
 TELEGRAM_TOKEN = "8243899616:AAGRDASeRKMAfioV-rMU4r9TZK33Pu1HXwA"
+# Адрес Bot API; None - официальный сервер. Для локальной заглушки
+# (fake_telegram_api.py) укажите, например, "http://127.0.0.1:8081"
+TELEGRAM_API_URL = None
+
+# Режим получения обновлений: "polling" (long polling) или "webhook"
+BOT_MODE = "polling"
+# Публичный адрес, на который Telegram отправляет обновления (https://...)
+WEBHOOK_URL = None
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "/telegram/webhook"
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = ""
+# Число потоков обработки обновлений
+WEBHOOK_WORKERS = 4
+
+# Перезапуск после сбоев: задержка растет от BASE до MAX (с), сброс после RESET_AFTER с работы
+SUPERVISOR_BASE_DELAY = 0.5
+SUPERVISOR_MAX_DELAY = 60
+SUPERVISOR_RESET_AFTER = 300
+# Каталог состояния: последний обработанный update_id и сессии пользователей
+STATE_DIR = "state"
+UPDATE_OFFSET_FILE = STATE_DIR + "/update_offset.json"
+SESSIONS_FILE = STATE_DIR + "/sessions.json"
+# Как часто сохранять update_id во время работы, с
+CHECKPOINT_INTERVAL = 5
+
+# Дедупликация: сколько последних update_id помнить
+UPDATE_DEDUP_WINDOW = 10000
+# Повторное подтверждение той же корзины в течение ORDER_DEDUP_TTL с не создает заказ
+ORDER_DEDUP_WINDOW = 10000
+ORDER_DEDUP_TTL = 600
 
 # Настройки логирования
 LOG_LEVEL = "INFO"
 LOG_FILE = "travel_bot.log"
+# Формат записей в файле: "json" (структурированный) или "text"
+LOG_FORMAT = "json"
+# Ротация: "size" (по размеру файла) или "time" (по времени)
+LOG_ROTATION = "size"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATION_WHEN = "midnight"
+LOG_BACKUP_COUNT = 7
+# Уровни логирования по модулям
+LOG_LEVELS = {
+    "advanced_bot": "INFO",
+    "telegram_sales_bot": "INFO",
+    "TeleBot": "WARNING",
+    "urllib3": "WARNING"
+}
 DATABASE_NAME = "travel_bot.db"
+# Номера билетов резервируются блоками по TICKET_ID_BLOCK_SIZE на поток
+TICKET_ID_BLOCK_SIZE = 1000
+# Кеш заказов для просмотра билетов: пользователей в кеше и время жизни записи, с
+ORDER_CACHE_SIZE = 10000
+ORDER_CACHE_TTL = 300
+# Заказов на странице истории (/history)
+HISTORY_PAGE_SIZE = 5
+# Выгрузка заказов (order_export.py): каталог файлов и строк в порции чтения
+EXPORT_DIR = "exports"
+EXPORT_CHUNK_SIZE = 5000
+# Запись входящих сообщений в JSONL для replay.py (None - не записывать)
+CAPTURE_FILE = None
+
+# Администраторы бота (Telegram user_id), которым доступны служебные команды
+ADMIN_USER_IDS = []
+
+# HTTP-эндпоинт метрик Prometheus (/metrics); None - не запускать
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Выборочное профилирование обработчиков (/profile, сигнал SIGUSR2)
+PROFILE_SAMPLE_RATE = 0.1
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = "profiles"
+
+# Лимиты исходящих сообщений (Telegram: ~30 сообщений/с всего, ~1/с в один чат)
+SEND_GLOBAL_RATE = 30
+SEND_GLOBAL_BURST = 30
+SEND_CHAT_RATE = 1
+SEND_CHAT_BURST = 3
+SEND_WORKERS = 4
+# Число повторов после ответа 429 (Too Many Requests)
+SEND_MAX_RETRIES = 5
+
+# HTTP-транспорт Bot API: пул соединений на все потоки отправки и long polling
+HTTP_POOL_SIZE = SEND_WORKERS + 2
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 15
+# Таймауты (соединение, чтение) по методам API, с
+HTTP_METHOD_TIMEOUTS = {
+    'sendMessage': (5, 10),
+    'answerCallbackQuery': (5, 5),
+    'sendDocument': (5, 60),
+    'sendPhoto': (5, 60)
+}
+# HTTP/2 через httpx (pip install httpx[http2])
+HTTP2 = False
+
+# Файл переопределений BOT_CONFIG (JSON) и период проверки его изменений, сек
+CONFIG_OVERRIDE_FILE = "bot_config.json"
+CONFIG_RELOAD_INTERVAL = 5
+
+# Места в поездах: поездов в день по направлению и мест в поезде
+TRAINS_PER_ROUTE = 2
+TRAIN_SEATS = 300
+# Время удержания места при оформлении заказа, с
+SEAT_HOLD_TTL = 900
+# Полос кеша остатков мест и время жизни остатка в кеше, с
+INVENTORY_STRIPES = 16
+INVENTORY_CACHE_TTL = 2
+
+# Брошенные оформления, с: подтверждение заказа (держит место), корзина, сессия целиком
+CONFIRMATION_TTL = SEAT_HOLD_TTL
+CART_TTL = 3600
+SESSION_TTL = 86400
+# Как часто проверять истекшие сроки, с
+EXPIRY_INTERVAL = 30
+# Напоминание пользователю, когда неподтвержденный заказ снят
+CHECKOUT_REMINDER = True
+
+# Динамические цены билетов: таблица (направление, день) пересчитывается раз в PRICE_REFRESH_INTERVAL с
+DYNAMIC_PRICING = True
+PRICE_REFRESH_INTERVAL = 300
+# Множители по дню недели (пн..вс)
+PRICE_WEEKDAY_FACTORS = (1.0, 0.95, 0.95, 1.0, 1.1, 1.15, 1.05)
+# Множители по сроку до поездки: (не больше дней, множитель), None - все остальные
+PRICE_LEAD_TIME_FACTORS = ((2, 1.25), (7, 1.1), (30, 1.0), (90, 0.95), (None, 0.9))
+# Надбавка за спрос: доля проданных мест дня * PRICE_DEMAND_WEIGHT
+PRICE_DEMAND_WEIGHT = 0.5
+# Границы итогового множителя к базовой цене
+PRICE_MIN_FACTOR = 0.8
+PRICE_MAX_FACTOR = 1.6
 
 # Конфигурация бота
 BOT_CONFIG = {
@@ -24,6 +152,18 @@ BOT_CONFIG = {
         "Владивосток": 8500
     },
     
+    # Синонимы и сокращения направлений (ключ - название из "prices")
+    "destination_aliases": {
+        "Москва": ["мск", "москву", "moscow"],
+        "Санкт-Петербург": ["спб", "питер", "петербург", "санкт петербург", "ленинград", "saint petersburg"],
+        "Сочи": ["sochi"],
+        "Казань": ["kazan"],
+        "Екатеринбург": ["екб", "екат", "свердловск"],
+        "Новосибирск": ["нск", "новосиб"],
+        "Краснодар": ["кдр"],
+        "Владивосток": ["влад", "vladivostok"]
+    },
+    
     # Дополнительные услуги
     "additional_services": {
         "Wi-Fi в поезде": 300,
@@ -0,0 +1,391 @@
+"""
+Скомпилированная конфигурация бота с проверкой и горячей перезагрузкой
+
+BOT_CONFIG компилируется в неизменяемый снимок: сценарии и акции - именованные
+кортежи, словари - MappingProxyType, списки - кортежи. Ссылки между разделами
+(рекомендуемые услуги сценариев, синонимы направлений) проверяются и
+разрешаются при загрузке. Файл CONFIG_OVERRIDE_FILE (JSON) накладывается поверх
+BOT_CONFIG; при его изменении собирается новый снимок и подменяется одной
+операцией присваивания. Обработка сообщения закрепляет снимок (pinned), поэтому
+не видит наполовину обновленных цен.
+
+Проверка файла без запуска бота:
+    python config_snapshot.py [bot_config.json]
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from config import BOT_CONFIG, CONFIG_OVERRIDE_FILE, CONFIG_RELOAD_INTERVAL
+from destinations import DestinationResolver
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+registry.describe('config_reloads_total', 'Перезагрузки конфигурации')
+
+PROMO_DISCOUNT_TYPES = ('percentage', 'service')
+
+# Разделы, без которых бот не работает, и обязательные ключи в них
+REQUIRED_KEYS = {
+    'business': ('min_booking_hours', 'max_booking_days'),
+    'errors': ('invalid_date', 'booking_failed'),
+    'display': ('date_format',)
+}
+
+
+class ConfigError(ValueError):
+    """Конфигурация не прошла проверку; problems - список всех ошибок"""
+
+    def __init__(self, problems: List[str]):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+class Service(NamedTuple):
+    name: str
+    price: float
+
+
+class Scenario(NamedTuple):
+    id: str
+    name: str
+    discount: float
+    description: str
+    services: Tuple[Service, ...]
+    dialogue: Tuple[str, ...]
+    icon: str
+
+
+class Promotion(NamedTuple):
+    id: Any
+    short: str
+    full: str
+    discount_type: str
+    discount_value: Any
+    conditions: str
+    icon: str
+
+
+class ConfigSnapshot(NamedTuple):
+    """Неизменяемый снимок конфигурации"""
+    version: int
+    prices: Mapping[str, float]
+    services: Mapping[str, float]
+    scenarios: Mapping[str, Scenario]
+    promotions: Tuple[Promotion, ...]
+    checkout_dialogue: Mapping[str, Tuple[str, ...]]
+    business: Mapping[str, Any]
+    display: Mapping[str, Any]
+    errors: Mapping[str, str]
+    destinations: DestinationResolver
+    # Исходные разделы целиком (intents, order_statuses и т.п.) в замороженном виде
+    raw: Mapping[str, Any]
+
+    def scenario(self, scenario_id: Optional[str]) -> Optional[Scenario]:
+        """Сценарий по номеру или None"""
+        return self.scenarios.get(scenario_id) if scenario_id else None
+
+    def promotion(self, number: int) -> Optional[Promotion]:
+        """Акция по порядковому номеру (с 1) или None"""
+        if 1 <= number <= len(self.promotions):
+            return self.promotions[number - 1]
+        return None
+
+
+def _freeze(value):
+    """Рекурсивная заморозка: dict -> MappingProxyType, list -> tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _is_price(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+
+def merge_config(base: Dict, override: Dict) -> Dict:
+    """Наложение override на base: словари объединяются, остальное заменяется"""
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def compile_config(raw: Dict, version: int = 1) -> Tuple[ConfigSnapshot, List[str]]:
+    """Проверка и сборка снимка: (снимок, предупреждения) или ConfigError"""
+    problems: List[str] = []
+    warnings: List[str] = []
+
+    prices = raw.get('prices')
+    if not isinstance(prices, dict) or not prices:
+        problems.append("prices: нужен непустой словарь направление -> цена")
+        prices = {}
+    for name, price in prices.items():
+        if not _is_price(price):
+            problems.append(f"prices[{name!r}]: цена должна быть неотрицательным числом, а не {price!r}")
+
+    services = raw.get('additional_services', {})
+    if not isinstance(services, dict):
+        problems.append("additional_services: нужен словарь услуга -> цена")
+        services = {}
+    for name, price in services.items():
+        if not _is_price(price):
+            problems.append(f"additional_services[{name!r}]: цена должна быть неотрицательным числом, а не {price!r}")
+
+    aliases = raw.get('destination_aliases', {})
+    if not isinstance(aliases, dict):
+        problems.append("destination_aliases: нужен словарь направление -> список синонимов")
+        aliases = {}
+    for name in aliases:
+        if name not in prices:
+            warnings.append(f"destination_aliases[{name!r}]: направления нет в prices, синонимы не используются")
+
+    scenario_section = raw.get('scenarios', {})
+    if not isinstance(scenario_section, dict):
+        problems.append("scenarios: нужен словарь идентификатор -> сценарий")
+        scenario_section = {}
+    scenarios = {}
+    for scenario_id, data in scenario_section.items():
+        where = f"scenarios[{scenario_id!r}]"
+        if not isinstance(data, dict) or not data.get('name'):
+            problems.append(f"{where}: нужен словарь с непустым name")
+            continue
+        discount = data.get('discount', 0)
+        if not _is_price(discount) or discount > 100:
+            problems.append(f"{where}.discount: ожидается процент от 0 до 100, а не {discount!r}")
+            continue
+        scenario_services = []
+        for service_name in data.get('recommended_services', []):
+            if service_name in services:
+                scenario_services.append(Service(service_name, services[service_name]))
+            else:
+                warnings.append(f"{where}.recommended_services: неизвестная услуга {service_name!r} пропущена")
+        scenarios[str(scenario_id)] = Scenario(
+            id=str(scenario_id),
+            name=data['name'],
+            discount=discount,
+            description=data.get('description', ''),
+            services=tuple(scenario_services),
+            dialogue=tuple(data.get('dialogue') or ('Отличный выбор!',)),
+            icon=data.get('icon', '')
+        )
+
+    promotion_section = raw.get('promotions', [])
+    if not isinstance(promotion_section, list):
+        problems.append("promotions: нужен список акций")
+        promotion_section = []
+    promotions = []
+    for index, data in enumerate(promotion_section, 1):
+        where = f"promotions[{index}]"
+        if not isinstance(data, dict):
+            problems.append(f"{where}: нужен словарь, а не {data!r}")
+            continue
+        missing = [key for key in ('id', 'short', 'full') if key not in data]
+        if missing:
+            problems.append(f"{where}: нет полей {', '.join(missing)}")
+            continue
+        discount_type = data.get('discount_type')
+        discount_value = data.get('discount_value', 0)
+        if discount_type not in PROMO_DISCOUNT_TYPES:
+            problems.append(f"{where}.discount_type: неизвестный тип {discount_type!r}")
+            continue
+        if discount_type == 'percentage' and (not _is_price(discount_value) or discount_value > 100):
+            problems.append(f"{where}.discount_value: ожидается процент от 0 до 100, а не {discount_value!r}")
+            continue
+        if discount_type == 'service' and discount_value not in services:
+            warnings.append(f"{where}.discount_value: неизвестная услуга {discount_value!r}")
+        promotions.append(Promotion(
+            id=data['id'],
+            short=data['short'],
+            full=data['full'],
+            discount_type=discount_type,
+            discount_value=discount_value,
+            conditions=data.get('conditions', ''),
+            icon=data.get('icon', '')
+        ))
+
+    for section, keys in REQUIRED_KEYS.items():
+        values = raw.get(section)
+        if not isinstance(values, dict):
+            problems.append(f"{section}: раздел отсутствует")
+            continue
+        for key in keys:
+            if key not in values:
+                problems.append(f"{section}.{key}: обязательный ключ отсутствует")
+
+    if problems:
+        raise ConfigError(problems)
+
+    snapshot = ConfigSnapshot(
+        version=version,
+        prices=MappingProxyType(dict(prices)),
+        services=MappingProxyType(dict(services)),
+        scenarios=MappingProxyType(scenarios),
+        promotions=tuple(promotions),
+        checkout_dialogue=_freeze(raw.get('checkout_dialogue', {})),
+        business=_freeze(raw['business']),
+        display=_freeze(raw['display']),
+        errors=_freeze(raw['errors']),
+        destinations=DestinationResolver(prices.keys(), aliases),
+        raw=_freeze(raw)
+    )
+    return snapshot, warnings
+
+
+class _Pin(threading.local):
+    """Снимок, закрепленный за потоком"""
+    snapshot: Optional[ConfigSnapshot] = None
+
+
+class ConfigStore:
+    """Текущий снимок конфигурации и его перезагрузка из файла"""
+
+    def __init__(self, base: Dict, override_path: Optional[str] = None):
+        self.base = base
+        self.override_path = override_path
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._mtime: Optional[float] = None
+        self._local = _Pin()
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[ConfigSnapshot], None]] = []
+        self._stop = threading.Event()
+        self.reload()
+        if self._snapshot is None:
+            # Файл переопределений испорчен: работаем на BOT_CONFIG
+            self._install(compile_config(base, 1)[0])
+
+    @property
+    def current(self) -> ConfigSnapshot:
+        """Снимок, закрепленный за потоком, или последний загруженный"""
+        return self._local.snapshot or self._snapshot
+
+    @contextmanager
+    def pinned(self):
+        """Один и тот же снимок на время обработки сообщения"""
+        previous = self._local.snapshot
+        self._local.snapshot = previous or self._snapshot
+        try:
+            yield self._local.snapshot
+        finally:
+            self._local.snapshot = previous
+
+    def subscribe(self, listener: Callable[[ConfigSnapshot], None]):
+        """Вызов listener(snapshot) после каждой успешной перезагрузки"""
+        self._listeners.append(listener)
+
+    def _read_override(self) -> Dict:
+        if not self.override_path or not os.path.exists(self.override_path):
+            return {}
+        with open(self.override_path, encoding='utf-8') as override_file:
+            override = json.load(override_file)
+        if not isinstance(override, dict):
+            raise ConfigError([f"{self.override_path}: ожидается JSON-объект"])
+        return override
+
+    def _install(self, snapshot: ConfigSnapshot):
+        # Присваивание ссылки атомарно: читатели видят старый или новый снимок целиком
+        self._snapshot = snapshot
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception("Ошибка обработчика перезагрузки конфигурации")
+
+    def reload(self) -> Tuple[bool, List[str]]:
+        """Сборка нового снимка; при ошибке остается прежний. Возвращает (успех, сообщения)"""
+        with self._reload_lock:
+            try:
+                self._mtime = self._override_mtime()
+                raw = merge_config(self.base, self._read_override())
+                version = self._snapshot.version + 1 if self._snapshot else 1
+                snapshot, warnings = compile_config(raw, version)
+            except Exception as error:
+                # Любая ошибка разбора (не только ConfigError) оставляет прежний снимок
+                problems = error.problems if isinstance(error, ConfigError) else [f"{type(error).__name__}: {error}"]
+                logger.error("Конфигурация не загружена, используется прежняя: %s", "; ".join(problems))
+                registry.inc('config_reloads_total', result='error')
+                return False, problems
+
+            for warning in warnings:
+                logger.warning("Конфигурация: %s", warning)
+            self._install(snapshot)
+            registry.inc('config_reloads_total', result='ok')
+            logger.info("Загружена конфигурация версии %s", snapshot.version)
+            return True, warnings
+
+    def _override_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.override_path).st_mtime if self.override_path else None
+        except OSError:
+            return None
+
+    def watch(self, interval: float = CONFIG_RELOAD_INTERVAL) -> threading.Thread:
+        """Фоновая перезагрузка при изменении файла переопределений"""
+        def run():
+            while not self._stop.wait(interval):
+                if self._override_mtime() != self._mtime:
+                    self.reload()
+
+        thread = threading.Thread(target=run, name='config-watcher', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+# Общий экземпляр для бота
+config_store = ConfigStore(BOT_CONFIG, CONFIG_OVERRIDE_FILE)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    path = sys.argv[1] if len(sys.argv) > 1 else CONFIG_OVERRIDE_FILE
+    store = ConfigStore(BOT_CONFIG, path)
+    ok, messages = store.reload()
+    for message in messages:
+        print(("⚠️ " if ok else "❌ ") + message)
+    if not ok:
+        raise SystemExit(1)
+
+    snapshot = store.current
+    print(f"Конфигурация версии {snapshot.version}: сценариев {len(snapshot.scenarios)}, "
+          f"акций {len(snapshot.promotions)}, направлений {len(snapshot.prices)}")
+
+    # Стоимость перезагрузки: слияние, проверка и сборка снимка
+    rounds = 200
+    started = time.perf_counter()
+    for _ in range(rounds):
+        store.reload()
+    print(f"Перезагрузка: {(time.perf_counter() - started) / rounds * 1000:.2f} мс")
+
+    # Услуги сценария в корзину: разбор BOT_CONFIG против готового списка снимка
+    rounds = 200_000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        scenarios = BOT_CONFIG['scenarios']
+        for scenario_id in scenarios:
+            [(name, BOT_CONFIG['additional_services'][name])
+             for name in scenarios[scenario_id].get('recommended_services', [])
+             if name in BOT_CONFIG['additional_services']]
+    dict_us = (time.perf_counter() - started) / rounds * 1e6
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for scenario in store.current.scenarios.values():
+            list(scenario.services)
+    snapshot_us = (time.perf_counter() - started) / rounds * 1e6
+    print(f"Услуги всех сценариев: BOT_CONFIG {dict_us:.2f} мкс, снимок {snapshot_us:.2f} мкс")
@@ -0,0 +1,213 @@
+"""
+Разбор дат поездки на русском языке ("20 декабря", "через неделю", "в пятницу")
+"""
+
+import calendar
+import re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from config_snapshot import config_store
+
+# Месяцы по основе слова ("декабря", "дек", "декабрь")
+MONTHS = {
+    'янв': 1, 'фев': 2, 'мар': 3, 'апр': 4, 'май': 5, 'мая': 5,
+    'июн': 6, 'июл': 7, 'авг': 8, 'сен': 9, 'окт': 10, 'ноя': 11, 'дек': 12
+}
+
+WEEKDAYS = {
+    'понедельник': 0, 'вторник': 1, 'среду': 2, 'среда': 2, 'четверг': 3,
+    'пятницу': 4, 'пятница': 4, 'субботу': 5, 'суббота': 5,
+    'воскресенье': 6
+}
+
+NUMBER_WORDS = {
+    'один': 1, 'одну': 1, 'одна': 1, 'два': 2, 'две': 2, 'три': 3, 'четыре': 4,
+    'пять': 5, 'шесть': 6, 'семь': 7, 'восемь': 8, 'девять': 9, 'десять': 10
+}
+
+RELATIVE_DAYS = {
+    'сегодня': 0,
+    'завтра': 1,
+    'послезавтра': 2
+}
+
+_CLEAN_RE = re.compile(r"[^0-9a-zа-я.\-/\s]+")
+_SPACES_RE = re.compile(r"\s+")
+
+_NUMBER = r"(\d{1,3}|" + "|".join(NUMBER_WORDS) + r")"
+
+_DAY_MONTH_RE = re.compile(
+    r"\b(\d{1,2})\s+(" + "|".join(MONTHS) + r")[а-я]*\.?(?:\s+(\d{4}))?"
+)
+_NUMERIC_RE = re.compile(r"\b(\d{1,2})[./](\d{1,2})(?:[./](\d{2}|\d{4}))?\b")
+_ISO_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_IN_PERIOD_RE = re.compile(
+    r"\bчерез\s+(?:" + _NUMBER + r"\s+)?(дн|день|недел|месяц)[а-я]*"
+)
+_WEEKDAY_RE = re.compile(
+    r"\b(?:во?\s+)?(следующ[а-я]*\s+)?(" + "|".join(WEEKDAYS) + r")\b"
+)
+_WEEKEND_RE = re.compile(r"\bвыходн[а-я]*")
+
+
+def normalize(text: str) -> str:
+    """Нормализация фразы (регистр, ё, эмодзи, пробелы)"""
+    text = text.lower().replace('ё', 'е')
+    text = _CLEAN_RE.sub(' ', text)
+    return _SPACES_RE.sub(' ', text).strip()
+
+
+def _number(value: Optional[str]) -> int:
+    """Число из цифр или слова (по умолчанию 1)"""
+    if not value:
+        return 1
+    if value.isdigit():
+        return int(value)
+    return NUMBER_WORDS[value]
+
+
+def _add_months(start: date, months: int) -> date:
+    """Сдвиг на месяцы с учетом длины месяца"""
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
+
+def _build_date(year: Optional[int], month: int, day: int, today: date) -> Optional[date]:
+    """Дата без года - ближайшая в будущем"""
+    try:
+        if year is not None:
+            return date(year, month, day)
+        result = date(today.year, month, day)
+        if result < today:
+            result = date(today.year + 1, month, day)
+        return result
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_cached(phrase: str, today: date) -> Optional[date]:
+    """Разбор нормализованной фразы относительно today (результат кэшируется)"""
+    for word, offset in RELATIVE_DAYS.items():
+        if phrase == word or phrase.startswith(word + ' ') or phrase.endswith(' ' + word):
+            return today + timedelta(days=offset)
+
+    match = _ISO_RE.search(phrase)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+        return _build_date(year, month, day, today)
+
+    match = _DAY_MONTH_RE.search(phrase)
+    if match:
+        year = int(match.group(3)) if match.group(3) else None
+        return _build_date(year, MONTHS[match.group(2)], int(match.group(1)), today)
+
+    match = _NUMERIC_RE.search(phrase)
+    if match:
+        day, month, year = match.groups()
+        if year is not None:
+            year = int(year) + 2000 if len(year) == 2 else int(year)
+        return _build_date(year, int(month), int(day), today)
+
+    match = _IN_PERIOD_RE.search(phrase)
+    if match:
+        amount = _number(match.group(1))
+        unit = match.group(2)
+        if unit == 'месяц':
+            return _add_months(today, amount)
+        if unit == 'недел':
+            return today + timedelta(weeks=amount)
+        return today + timedelta(days=amount)
+
+    match = _WEEKDAY_RE.search(phrase)
+    if match:
+        days_ahead = (WEEKDAYS[match.group(2)] - today.weekday()) % 7 or 7
+        return today + timedelta(days=days_ahead)
+
+    if _WEEKEND_RE.search(phrase):
+        return today + timedelta(days=(5 - today.weekday()) % 7)
+
+    return None
+
+
+def parse_date(text: str, today: Optional[date] = None) -> Optional[date]:
+    """Дата поездки из текста пользователя или None"""
+    phrase = normalize(text)
+    if not phrase:
+        return None
+    return _parse_cached(phrase, today or date.today())
+
+
+def validate_travel_date(travel_date: date, now: Optional[datetime] = None) -> Optional[str]:
+    """Проверка окна бронирования, возвращает текст ошибки или None"""
+    now = now or datetime.now()
+    business = config_store.current.business
+
+    # Поездка возможна до конца выбранного дня
+    latest_departure = datetime.combine(travel_date, time.max)
+    if latest_departure - now < timedelta(hours=business['min_booking_hours']):
+        return (
+            f"⚠️ Бронирование возможно не позднее чем за "
+            f"{business['min_booking_hours']} ч. до поездки. Выберите более позднюю дату."
+        )
+
+    if (travel_date - now.date()).days > business['max_booking_days']:
+        return (
+            f"⚠️ Бронирование открыто только на {business['max_booking_days']} дней вперед. "
+            f"Выберите более раннюю дату."
+        )
+
+    return None
+
+
+def parse_travel_date(text: str, now: Optional[datetime] = None) -> Tuple[Optional[date], Optional[str]]:
+    """Разбор и проверка даты: (дата, None) или (None, текст ошибки)"""
+    now = now or datetime.now()
+    travel_date = parse_date(text, now.date())
+    if travel_date is None:
+        return None, config_store.current.errors['invalid_date']
+
+    error = validate_travel_date(travel_date, now)
+    if error:
+        return None, error
+    return travel_date, None
+
+
+def format_date(travel_date: date) -> str:
+    """Дата в формате отображения из конфигурации"""
+    return travel_date.strftime(config_store.current.display['date_format'])
+
+
+if __name__ == "__main__":
+    # Бенчмарк на корпусе фраз: первый разбор и повтор из кэша
+    import time as timer
+
+    corpus = [
+        'завтра', 'Завтра', '📅 На выходные', 'послезавтра', 'сегодня', '20 декабря',
+        '1 января 2027', '5 мая', '31.12', '15/03/2027', '2026-11-30', 'через неделю',
+        'через 3 дня', 'через две недели', 'через месяц', 'в пятницу',
+        'в следующую среду', 'во вторник', 'на выходных', 'когда-нибудь', '32 декабря'
+    ]
+    today = date.today()
+
+    start = timer.perf_counter()
+    results = [parse_date(phrase, today) for phrase in corpus]
+    cold = timer.perf_counter() - start
+
+    rounds = 1000
+    start = timer.perf_counter()
+    for _ in range(rounds):
+        for phrase in corpus:
+            parse_date(phrase, today)
+    warm = timer.perf_counter() - start
+
+    for phrase, result in zip(corpus, results):
+        print(f"{phrase!r:>22} -> {result}")
+    print(f"Первый разбор: {cold / len(corpus) * 1e6:.1f} мкс на фразу")
+    print(f"Из кэша: {warm / (rounds * len(corpus)) * 1e6:.2f} мкс на фразу")
+    print(_parse_cached.cache_info())
@@ -0,0 +1,215 @@
+"""
+Распознавание направлений: таблица синонимов и нечеткий поиск по триграммам
+"""
+
+import re
+from collections import Counter
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import BOT_CONFIG
+
+# Символы, которые не участвуют в сравнении (эмодзи, пунктуация)
+_NON_WORD_RE = re.compile(r"[^0-9a-zа-я\s-]+")
+_SPACES_RE = re.compile(r"[\s-]+")
+
+# Минимальная длина слова для нечеткого поиска
+MIN_FUZZY_LENGTH = 4
+
+
+def normalize(text: str) -> str:
+    """Нормализация строки для сравнения"""
+    text = text.lower().replace('ё', 'е')
+    text = _NON_WORD_RE.sub(' ', text)
+    return _SPACES_RE.sub(' ', text).strip()
+
+
+def _trigrams(word: str) -> set:
+    """Множество триграмм слова с граничными маркерами"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_distance(length: int) -> int:
+    """Допустимое число опечаток для слова заданной длины"""
+    if length < MIN_FUZZY_LENGTH:
+        return 0
+    if length <= 8:
+        return 1
+    return 2
+
+
+def _bounded_levenshtein(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна с отсечением по порогу (limit + 1 - превышение)"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            cost = previous[j - 1] + (char_a != char_b)
+            insert = current[j - 1] + 1
+            delete = previous[j] + 1
+            value = min(cost, insert, delete)
+            current.append(value)
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return limit + 1
+        previous = current
+
+    return previous[-1]
+
+
+class DestinationResolver:
+    """Поиск направления по тексту пользователя с учетом опечаток"""
+
+    def __init__(self, destinations: Iterable[str], aliases: Dict[str, List[str]] = None):
+        self.destinations = list(destinations)
+        # Нормализованный синоним -> каноническое название
+        self.alias_table: Dict[str, str] = {}
+        # Максимальное число слов в синониме (для поиска по фразам)
+        self.max_alias_words = 1
+
+        for name in self.destinations:
+            self._add_alias(name, name)
+        for name, name_aliases in (aliases or {}).items():
+            if name not in self.destinations:
+                continue
+            for alias in name_aliases:
+                self._add_alias(alias, name)
+
+        self._keys = list(self.alias_table)
+        # (длина синонима, триграмма) -> индексы синонимов в self._keys
+        self._index: Dict[Tuple[int, str], List[int]] = {}
+        for key_id, key in enumerate(self._keys):
+            for gram in _trigrams(key):
+                self._index.setdefault((len(key), gram), []).append(key_id)
+
+    @classmethod
+    def from_config(cls, config: Dict = None) -> 'DestinationResolver':
+        """Создание из BOT_CONFIG"""
+        config = config or BOT_CONFIG
+        return cls(config['prices'].keys(), config.get('destination_aliases', {}))
+
+    def _add_alias(self, alias: str, name: str):
+        """Добавление синонима в таблицу"""
+        key = normalize(alias)
+        if not key:
+            return
+        self.alias_table.setdefault(key, name)
+        self.max_alias_words = max(self.max_alias_words, key.count(' ') + 1)
+
+    def resolve(self, text: str) -> Optional[str]:
+        """Каноническое название направления или None"""
+        query = normalize(text)
+        if not query:
+            return None
+
+        # Точное совпадение всей фразы
+        exact = self.alias_table.get(query)
+        if exact:
+            return exact
+
+        words = query.split(' ')
+        phrases = self._phrases(words)
+
+        # Точное совпадение части фразы ("хочу в спб")
+        for phrase in phrases:
+            exact = self.alias_table.get(phrase)
+            if exact:
+                return exact
+
+        # Нечеткий поиск ("масква", "в казань", "новосибирсг")
+        best = None
+        candidates = phrases if len(words) == 1 else [query] + phrases
+        for phrase in candidates:
+            match = self._fuzzy_lookup(phrase)
+            if match and (best is None or match[1] < best[1]):
+                best = match
+                if best[1] == 1:
+                    break
+
+        return best[0] if best else None
+
+    def _phrases(self, words: List[str]) -> List[str]:
+        """Все подфразы длиной до max_alias_words, начиная с длинных"""
+        phrases = []
+        for size in range(min(self.max_alias_words, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                phrases.append(' '.join(words[start:start + size]))
+        return phrases
+
+    def _fuzzy_lookup(self, phrase: str) -> Optional[Tuple[str, int]]:
+        """Ближайший синоним по триграммам с проверкой расстояния"""
+        limit = _max_distance(len(phrase))
+        if limit == 0:
+            return None
+
+        grams = _trigrams(phrase)
+        # Каждая опечатка портит не более трех триграмм
+        min_shared = len(grams) - 3 * limit
+        if min_shared < 1:
+            min_shared = 1
+
+        # Кандидаты только среди синонимов близкой длины
+        index = self._index
+        lengths = range(len(phrase) - limit, len(phrase) + limit + 1)
+        counts = Counter(chain.from_iterable(
+            index[(length, gram)] for length in lengths for gram in grams if (length, gram) in index
+        ))
+
+        best = None
+        for key_id, shared in counts.most_common():
+            if shared < min_shared:
+                break
+            key = self._keys[key_id]
+            # Порог и по длине синонима: "омск" не должен стать "мск" (Москвой)
+            key_limit = min(limit, _max_distance(len(key)))
+            if key_limit == 0:
+                continue
+            distance = _bounded_levenshtein(phrase, key, key_limit)
+            if distance <= key_limit and (best is None or distance < best[1]):
+                best = (self.alias_table[key], distance)
+                if distance == 1:
+                    break
+
+        return best
+
+
+if __name__ == "__main__":
+    # Микробенчмарк на синтетическом каталоге станций
+    import random
+    import time
+
+    syllables = [c + v for c in 'бвгдзклмнпрстхчш' for v in 'аеиоуя'] + ['ск', 'ов', 'гра', 'бург', 'ин']
+    random.seed(42)
+    catalog = list(BOT_CONFIG['prices'])
+    while len(catalog) < 5000:
+        name = ''.join(random.choices(syllables, k=random.randint(2, 5))).capitalize()
+        if name not in catalog:
+            catalog.append(name)
+
+    resolver = DestinationResolver(catalog, BOT_CONFIG.get('destination_aliases', {}))
+
+    queries = []
+    for name in random.sample(catalog, 1000):
+        word = name.lower()
+        position = random.randrange(len(word))
+        queries.append(word[:position] + 'о' + word[position + 1:])
+    queries += ['хочу в спб', 'Масква', '📍 Сочи', 'новосибирсг', 'привет']
+
+    start = time.perf_counter()
+    for query in queries:
+        resolver.resolve(query)
+    elapsed = time.perf_counter() - start
+
+    # Короткие синонимы - только точное совпадение
+    config_resolver = DestinationResolver.from_config()
+    assert config_resolver.resolve('омск') is None, config_resolver.resolve('омск')
+    assert config_resolver.resolve('масква') == 'Москва'
+
+    print(f"Каталог: {len(catalog)} направлений, синонимов: {len(resolver.alias_table)}")
+    print(f"Среднее время поиска: {elapsed / len(queries) * 1e6:.1f} мкс")
@@ -0,0 +1,111 @@
+"""
+Таймеры истечения: брошенные подтверждения заказа, корзины и сессии
+
+Срок ключа хранится в словаре, в куче - не больше одной записи на ключ.
+Продление срока (touch на каждом сообщении) меняет только словарь, O(1);
+запись в куче со старым сроком при извлечении переставляется на новый.
+Отмена удаляет ключ из словаря, запись в куче отбрасывается при извлечении.
+Истечение - O(log n) на ключ, поэтому миллионы таймеров не требуют обхода.
+"""
+
+import heapq
+import threading
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class ExpiryScheduler:
+    """Сроки ключей с ленивой перестановкой в куче"""
+
+    def __init__(self):
+        self._deadlines: Dict[Hashable, float] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _push(self, deadline: float, key: Hashable):
+        self._sequence += 1
+        heapq.heappush(self._heap, (deadline, self._sequence, key))
+
+    def touch(self, key: Hashable, ttl: float, now: float = None):
+        """Срок ключа - через ttl секунд (новый ключ или продление)"""
+        deadline = (time.monotonic() if now is None else now) + ttl
+        with self._lock:
+            current = self._deadlines.get(key)
+            self._deadlines[key] = deadline
+            # Более поздний срок догонит запись в куче при ее извлечении
+            if current is None or deadline < current:
+                self._push(deadline, key)
+
+    def cancel(self, key: Hashable):
+        """Снятие таймера"""
+        with self._lock:
+            self._deadlines.pop(key, None)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        """Срок ключа (None - таймера нет)"""
+        return self._deadlines.get(key)
+
+    def expire(self, now: float = None, limit: int = None) -> List[Hashable]:
+        """Ключи с наступившим сроком (снимаются с учета)"""
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now and (limit is None or len(expired) < limit):
+                deadline, _, key = heapq.heappop(heap)
+                current = self._deadlines.get(key)
+                if current is None:
+                    continue
+                if current > deadline:
+                    # Срок продлен после постановки в кучу
+                    if current > now:
+                        self._push(current, key)
+                        continue
+                elif current < deadline:
+                    # Устаревшая запись: для укороченного срока есть своя
+                    continue
+                del self._deadlines[key]
+                expired.append(key)
+        return expired
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+
+if __name__ == "__main__":
+    # Миллион таймеров: постановка, продление половины, отмена десятой части, истечение
+    import random
+
+    COUNT = 1_000_000
+    scheduler = ExpiryScheduler()
+    keys = [(user_id, 'session') for user_id in range(COUNT)]
+
+    started = time.perf_counter()
+    for key in keys:
+        scheduler.touch(key, random.uniform(0, 100), now=0.0)
+    scheduled = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for key in keys[::2]:
+        scheduler.touch(key, 200, now=0.0)
+    touched = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for key in keys[::10]:
+        scheduler.cancel(key)
+    cancelled = time.perf_counter() - started
+
+    started = time.perf_counter()
+    first = len(scheduler.expire(now=100))
+    second = len(scheduler.expire(now=200))
+    expired = time.perf_counter() - started
+
+    # Отменены только продленные ключи (четные)
+    assert first == COUNT // 2 and first + second == COUNT - COUNT // 10, (first, second)
+    assert len(scheduler) == 0 and not scheduler._heap
+    print(f"Таймеров: {COUNT}")
+    print(f"постановка {scheduled / COUNT * 1e9:.0f} нс, продление {touched / (COUNT // 2) * 1e9:.0f} нс, "
+          f"отмена {cancelled / (COUNT // 10) * 1e9:.0f} нс на ключ")
+    print(f"истечение {first + second} ключей за {expired:.2f} с ({expired / (first + second) * 1e9:.0f} нс на ключ)")
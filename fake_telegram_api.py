@@ -0,0 +1,262 @@
+"""
+Локальная заглушка Telegram Bot API для нагрузочного тестирования без сети
+
+Запуск:
+    python fake_telegram_api.py --port 8081 --latency-ms 40 --error-rate 0.01 --update-rate 200
+Бот подключается через TELEGRAM_API_URL = "http://127.0.0.1:8081" в config.py.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qsl, urlparse
+
+# Сообщения, которые отправляют синтетические пользователи
+DEFAULT_TEXTS = [
+    '/start', '📍 Москва', '📅 Завтра', '🎯 2. Стандартный', '✅ Да, подтверждаю',
+    '🛒 Корзина', '✅ Оформить', '✅ Да, подтверждаю', '/ticket'
+]
+
+
+class FakeTelegramAPI:
+    """Состояние заглушки: очередь обновлений, параметры задержек и ошибок"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 retry_after: int = 1, update_rate: float = 0, users: int = 100,
+                 texts: List[str] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.update_rate = update_rate
+        self.users = users
+        self.texts = texts or DEFAULT_TEXTS
+
+        self.updates: List[Dict] = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.webhook_url = ''
+        self.stats = {'getUpdates': 0, 'sendMessage': 0, 'setWebhook': 0, 'errors': 0}
+        # Первый ответ бота (замер времени запуска в benchmark.py)
+        self.first_message = threading.Event()
+        # Позиция каждого пользователя в сценарии
+        self._user_step: Dict[int, int] = {}
+        self._condition = threading.Condition()
+        self._running = False
+
+    def add_update(self, user_id: int, text: str) -> Dict:
+        """Добавление входящего сообщения в очередь getUpdates"""
+        with self._condition:
+            update = {
+                'update_id': self.next_update_id,
+                'message': {
+                    'message_id': self.next_message_id,
+                    'from': {'id': user_id, 'is_bot': False, 'first_name': 'Тест', 'username': f'user{user_id}'},
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'date': int(time.time()),
+                    'text': text
+                }
+            }
+            self.next_update_id += 1
+            self.next_message_id += 1
+            self.updates.append(update)
+            self._condition.notify_all()
+        return update
+
+    def get_updates(self, offset: int, limit: int, timeout: float) -> List[Dict]:
+        """Обновления начиная с offset (с ожиданием до timeout секунд)"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            # Подтвержденные обновления удаляются, как в настоящем API
+            if offset:
+                self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            while not self.updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self.updates[:limit]
+
+    def send_message(self, params: Dict) -> Dict:
+        """Ответ на sendMessage"""
+        with self._condition:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        chat_id = int(params.get('chat_id', 0))
+        self.first_message.set()
+        return {
+            'message_id': message_id,
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'FakeBot'},
+            'chat': {'id': chat_id, 'type': 'private'},
+            'date': int(time.time()),
+            'text': params.get('text', '')
+        }
+
+    def start_generator(self):
+        """Фоновая генерация входящих сообщений с частотой update_rate"""
+        if self.update_rate <= 0:
+            return
+        self._running = True
+        threading.Thread(target=self._generate, name='fake-updates', daemon=True).start()
+
+    def stop(self):
+        """Остановка генерации сообщений"""
+        self._running = False
+
+    def _generate(self):
+        """Поток генерации: пользователи по очереди проходят сценарий из texts"""
+        interval = 1.0 / self.update_rate
+        next_time = time.monotonic()
+        while self._running:
+            user_id = random.randint(1, self.users)
+            step = self._user_step.get(user_id, 0)
+            self._user_step[user_id] = (step + 1) % len(self.texts)
+            self.add_update(user_id, self.texts[step])
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def delay(self):
+        """Искусственная задержка ответа"""
+        latency = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def should_fail(self) -> bool:
+        """Нужно ли ответить ошибкой 429"""
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+def _make_handler(api: FakeTelegramAPI):
+    """Класс обработчика HTTP, привязанный к состоянию заглушки"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self._handle()
+
+        def do_POST(self):
+            self._handle()
+
+        def log_message(self, format, *args):
+            """Без записи каждого запроса"""
+
+        def _params(self) -> Dict:
+            url = urlparse(self.path)
+            params = dict(parse_qsl(url.query))
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                body = self.rfile.read(length).decode('utf-8')
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params.update(json.loads(body or '{}'))
+                else:
+                    params.update(parse_qsl(body))
+            return params
+
+        def _reply(self, status: int, payload: Dict):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _handle(self):
+            # Путь вида /bot<token>/<method>
+            parts = urlparse(self.path).path.strip('/').split('/')
+            if len(parts) != 2 or not parts[0].startswith('bot'):
+                self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                return
+            method = parts[1]
+            params = self._params()
+
+            if method != 'getUpdates':
+                api.delay()
+            if method in api.stats:
+                api.stats[method] += 1
+
+            if method in ('sendMessage', 'getUpdates') and api.should_fail():
+                api.stats['errors'] += 1
+                self._reply(429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {api.retry_after}',
+                    'parameters': {'retry_after': api.retry_after}
+                })
+                return
+
+            if method == 'getUpdates':
+                result = api.get_updates(
+                    int(params.get('offset') or 0),
+                    int(params.get('limit') or 100),
+                    float(params.get('timeout') or 0)
+                )
+            elif method == 'sendMessage':
+                result = api.send_message(params)
+            elif method == 'setWebhook':
+                api.webhook_url = params.get('url', '')
+                result = True
+            elif method == 'deleteWebhook':
+                api.webhook_url = ''
+                result = True
+            elif method == 'getMe':
+                result = {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+            else:
+                self._reply(400, {'ok': False, 'error_code': 400, 'description': f'Method {method} not supported'})
+                return
+
+            self._reply(200, {'ok': True, 'result': result})
+
+    return Handler
+
+
+def start_fake_api(api: FakeTelegramAPI, host: str = '127.0.0.1', port: int = 8081) -> ThreadingHTTPServer:
+    """Запуск заглушки в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), _make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-telegram-api', daemon=True).start()
+    api.start_generator()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0, help="задержка ответа, мс")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="случайная добавка к задержке, мс")
+    parser.add_argument('--error-rate', type=float, default=0, help="доля ответов 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429, с")
+    parser.add_argument('--update-rate', type=float, default=0, help="входящих сообщений в секунду")
+    parser.add_argument('--users', type=int, default=100, help="число синтетических пользователей")
+    args = parser.parse_args()
+
+    api = FakeTelegramAPI(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        retry_after=args.retry_after, update_rate=args.update_rate, users=args.users
+    )
+    server = start_fake_api(api, args.host, args.port)
+    print(f"Заглушка Bot API: http://{args.host}:{server.server_address[1]}")
+
+    try:
+        previous = dict(api.stats)
+        while True:
+            time.sleep(5)
+            current = dict(api.stats)
+            rates = {key: (current[key] - previous[key]) / 5 for key in current}
+            print(f"sendMessage: {rates['sendMessage']:.1f}/с, getUpdates: {rates['getUpdates']:.1f}/с, "
+                  f"ошибок: {rates['errors']:.1f}/с, в очереди: {len(api.updates)}")
+            previous = current
+    except KeyboardInterrupt:
+        api.stop()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
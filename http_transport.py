@@ -0,0 +1,171 @@
+"""
+HTTP-транспорт для запросов к Bot API: пул соединений, keep-alive, таймауты по типу вызова
+
+Подключается через apihelper.CUSTOM_REQUEST_SENDER библиотеки telebot.
+HTTP/2 включается параметром HTTP2 в config.py (нужен пакет httpx[http2]).
+"""
+
+import logging
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (
+    HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_METHOD_TIMEOUTS, HTTP2
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'Connection': 'keep-alive',
+    'Accept-Encoding': 'gzip, deflate'
+}
+
+
+class _HttpxResponse:
+    """Ответ httpx с интерфейсом requests.Response, который ожидает telebot"""
+
+    __slots__ = ('_response',)
+
+    def __init__(self, response):
+        self._response = response
+
+    @property
+    def status_code(self) -> int:
+        return self._response.status_code
+
+    @property
+    def text(self) -> str:
+        return self._response.text
+
+    @property
+    def reason(self) -> str:
+        return self._response.reason_phrase
+
+    def json(self):
+        return self._response.json()
+
+
+class BotApiTransport:
+    """Общий пул соединений к Bot API для всех потоков процесса"""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, http2: bool = HTTP2):
+        self.pool_size = pool_size
+        self.http2 = False
+        self._client = None
+        self._session: Optional[requests.Session] = None
+        if http2:
+            self._client = self._create_http2_client()
+            self.http2 = self._client is not None
+        if self._client is None:
+            self._session = self._create_session()
+
+    def _create_session(self) -> requests.Session:
+        """Сессия requests с пулом нужного размера"""
+        session = requests.Session()
+        # Повторяем только установку соединения: запросы к API не идемпотентны
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+            max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.1)
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(DEFAULT_HEADERS)
+        return session
+
+    def _create_http2_client(self):
+        """Клиент httpx с HTTP/2 (None, если пакет не установлен)"""
+        try:
+            import httpx
+            return httpx.Client(
+                http2=True,
+                headers=DEFAULT_HEADERS,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size, max_keepalive_connections=self.pool_size
+                )
+            )
+        except ImportError:
+            logger.warning("HTTP/2 недоступен (нужен пакет httpx[http2]), используется HTTP/1.1")
+            return None
+
+    @staticmethod
+    def timeout_for(url: str, timeout) -> Tuple[float, float]:
+        """Таймауты (соединение, чтение) для метода API из URL"""
+        method = url.rsplit('/', 1)[-1]
+        if method == 'getUpdates' and timeout:
+            # Long polling: telebot уже учел long_polling_timeout
+            return timeout if isinstance(timeout, tuple) else (HTTP_CONNECT_TIMEOUT, timeout)
+        return HTTP_METHOD_TIMEOUTS.get(method, (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+
+    def request(self, method: str, url: str, params: Dict = None, files: Dict = None,
+                timeout=None, proxies: Dict = None, **kwargs):
+        """Отправка запроса (сигнатура CUSTOM_REQUEST_SENDER)"""
+        timeout = self.timeout_for(url, timeout)
+        if self._client is not None:
+            response = self._client.request(
+                method, url, params=params, files=files, timeout=timeout[1]
+            )
+            return _HttpxResponse(response)
+        return self._session.request(
+            method, url, params=params, files=files, timeout=timeout, proxies=proxies
+        )
+
+    def close(self):
+        """Закрытие соединений"""
+        if self._client is not None:
+            self._client.close()
+        if self._session is not None:
+            self._session.close()
+
+
+def install(pool_size: int = HTTP_POOL_SIZE, http2: bool = HTTP2) -> BotApiTransport:
+    """Подключение транспорта к telebot"""
+    from telebot import apihelper
+
+    transport = BotApiTransport(pool_size, http2)
+    apihelper.CUSTOM_REQUEST_SENDER = transport.request
+    logger.info("HTTP-транспорт Bot API: пул %s соединений, HTTP/2: %s", pool_size, transport.http2)
+    return transport
+
+
+if __name__ == "__main__":
+    # Бенчмарк на локальной заглушке: отправка через apihelper telebot со стандартной
+    # сессией (своя requests.Session в каждом потоке) и через общий пул
+    import argparse
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    from telebot import apihelper
+
+    from fake_telegram_api import FakeTelegramAPI, start_fake_api
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=HTTP_POOL_SIZE)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    api = FakeTelegramAPI(latency_ms=args.latency_ms)
+    server = start_fake_api(api, '127.0.0.1', 0)
+    apihelper.API_URL = f"http://127.0.0.1:{server.server_address[1]}/bot{{0}}/{{1}}"
+
+    def send(i):
+        apihelper.send_message('TEST', i, 'тест')
+
+    def run() -> float:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as executor:
+            list(executor.map(send, range(args.requests)))
+        return args.requests / (time.perf_counter() - start)
+
+    apihelper.CUSTOM_REQUEST_SENDER = None
+    print(f"Стандартная сессия telebot (по сессии на поток): {run():.0f} запросов/с")
+
+    transport = BotApiTransport(pool_size=args.threads, http2=False)
+    apihelper.CUSTOM_REQUEST_SENDER = transport.request
+    print(f"Пул {args.threads} соединений, keep-alive: {run():.0f} запросов/с")
+    transport.close()
@@ -0,0 +1,74 @@
+"""
+Окно дедупликации: повторно доставленные обновления и повторные подтверждения заказа
+"""
+
+import threading
+import time
+from typing import Dict, Hashable, List, Optional
+
+
+class DedupWindow:
+    """Последние capacity ключей: кольцевой буфер для вытеснения и множество для поиска"""
+
+    def __init__(self, capacity: int, ttl: Optional[float] = None):
+        self.capacity = capacity
+        # Время жизни ключа, с (None - пока не вытеснен из буфера)
+        self.ttl = ttl
+        self._ring: List[Optional[Hashable]] = [None] * capacity
+        self._position = 0
+        self._keys: Dict[Hashable, float] = {}
+        # Ключ -> его слот в кольцевом буфере
+        self._slots: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def claim(self, key: Hashable) -> bool:
+        """Регистрация ключа: True - ключ новый, False - дубликат"""
+        now = time.monotonic()
+        with self._lock:
+            seen_at = self._keys.get(key)
+            if seen_at is not None and (self.ttl is None or now - seen_at < self.ttl):
+                self.duplicates += 1
+                return False
+            if seen_at is None:
+                evicted = self._ring[self._position]
+                if evicted is not None:
+                    self._keys.pop(evicted, None)
+                    self._slots.pop(evicted, None)
+                self._ring[self._position] = key
+                self._slots[key] = self._position
+                self._position = (self._position + 1) % self.capacity
+            self._keys[key] = now
+            return True
+
+    def release(self, key: Hashable):
+        """Снятие ключа: действие не выполнено, повтор не считается дубликатом"""
+        with self._lock:
+            self._keys.pop(key, None)
+            # Слот освобождается сразу: иначе после повторного claim он вытеснил бы ключ раньше срока
+            slot = self._slots.pop(key, None)
+            if slot is not None:
+                self._ring[slot] = None
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+if __name__ == "__main__":
+    # Стоимость проверки на поток update_id с 5% повторов
+    import random
+
+    window = DedupWindow(10_000)
+    ids = list(range(1_000_000))
+    for i in random.sample(range(1000, len(ids)), 50_000):
+        ids[i] = ids[i] - random.randint(1, 1000)
+
+    start = time.perf_counter()
+    fresh = sum(window.claim(update_id) for update_id in ids)
+    elapsed = time.perf_counter() - start
+    print(f"{len(ids)} проверок за {elapsed:.2f} с ({elapsed / len(ids) * 1e9:.0f} нс/проверка), "
+          f"новых: {fresh}, дубликатов: {window.duplicates}, в окне: {len(window)}")
@@ -0,0 +1,426 @@
+"""
+Места в поездах: вместимость по (направление, дата) и удержание мест на время оформления
+
+Вместимость дня - сумма мест поездов направления (таблица trains). Счетчик
+(route, travel_date) в seat_inventory хранит занятые (held) и проданные (sold)
+места; удержание - одна условная UPDATE вместе с записью в seat_holds, поэтому
+мест не продается больше вместимости даже при гонке нескольких процессов.
+Удержание истекает через hold_ttl секунд: просроченные места возвращаются при
+следующей нехватке или вызовом release_expired().
+
+Для популярных дат в процессе хранятся остатки мест, разбитые на полосы
+(lock striping) по хешу (route, travel_date): проверка наличия и отказ при
+распроданной дате не обращаются к базе, а разные даты не ждут одну блокировку.
+Записи одного процесса выполняются по очереди, без ожидания SQLITE_BUSY.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from config import (
+    DATABASE_NAME, TRAINS_PER_ROUTE, TRAIN_SEATS, SEAT_HOLD_TTL,
+    INVENTORY_STRIPES, INVENTORY_CACHE_TTL
+)
+from config_snapshot import ConfigSnapshot, config_store
+from metrics import registry
+
+registry.describe('seat_holds_total', 'Удержания мест при оформлении')
+
+HELD = 'held'
+SOLD = 'sold'
+RELEASED = 'released'
+EXPIRED = 'expired'
+
+
+def ensure_tables(cursor: sqlite3.Cursor, prices: Mapping[str, float] = None) -> List[str]:
+    """Таблицы поездов и мест; поезда создаются для направлений без них. Возвращает новые направления"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS trains (
+            train_number TEXT PRIMARY KEY,
+            route TEXT NOT NULL,
+            seats INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trains_route ON trains (route)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS seat_inventory (
+            route TEXT NOT NULL,
+            travel_date TEXT NOT NULL,
+            capacity INTEGER NOT NULL,
+            held INTEGER NOT NULL DEFAULT 0,
+            sold INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (route, travel_date)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS seat_holds (
+            hold_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            route TEXT NOT NULL,
+            travel_date TEXT NOT NULL,
+            user_id INTEGER,
+            seats INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'held',
+            expires_at REAL NOT NULL
+        )
+    ''')
+    # Поиск просроченных удержаний без полного просмотра таблицы
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_seat_holds_status_expires ON seat_holds (status, expires_at)')
+
+    routes = {row[0] for row in cursor.execute('SELECT DISTINCT route FROM trains')}
+    number = cursor.execute('SELECT COUNT(*) FROM trains').fetchone()[0]
+    added = []
+    for route in prices or config_store.current.prices:
+        if route in routes:
+            continue
+        added.append(route)
+        for _ in range(TRAINS_PER_ROUTE):
+            number += 1
+            cursor.execute(
+                'INSERT INTO trains (train_number, route, seats) VALUES (?, ?, ?)',
+                (f"{number:03d}", route, TRAIN_SEATS)
+            )
+    return added
+
+
+def return_sold(cursor: sqlite3.Cursor, seats: Mapping[Tuple[str, str], int]):
+    """Возврат проданных мест (route, travel_date) -> число (в транзакции отмены или возврата)"""
+    cursor.executemany(
+        'UPDATE seat_inventory SET sold = MAX(sold - ?, 0) WHERE route = ? AND travel_date = ?',
+        [(count, route, travel_date) for (route, travel_date), count in seats.items()]
+    )
+
+
+class _Stripe:
+    """Полоса кеша остатков: своя блокировка и словарь (route, date) -> (остаток, время)"""
+
+    __slots__ = ('lock', 'available')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.available: Dict[Tuple[str, str], Tuple[int, float]] = {}
+
+
+class SeatInventory:
+    """Удержание, продажа и возврат мест"""
+
+    def __init__(self, database: str = DATABASE_NAME, hold_ttl: float = SEAT_HOLD_TTL,
+                 stripes: int = INVENTORY_STRIPES, cache_ttl: float = INVENTORY_CACHE_TTL):
+        self.database = database
+        self.hold_ttl = hold_ttl
+        self.cache_ttl = cache_ttl
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._write_lock = threading.Lock()
+        self._capacity: Dict[str, int] = {}
+        # Направление, добавленное перезагрузкой конфигурации, получает поезда
+        config_store.subscribe(self.sync_trains)
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: транзакцией управляем явно через BEGIN IMMEDIATE
+        return sqlite3.connect(self.database, timeout=30, isolation_level=None)
+
+    def _stripe(self, key: Tuple[str, str]) -> _Stripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def _remember(self, key: Tuple[str, str], available: int):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.available[key] = (available, time.monotonic())
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[int]:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            entry = stripe.available.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.cache_ttl:
+            return None
+        return entry[0]
+
+    def capacity(self, conn: sqlite3.Connection, route: str) -> int:
+        """Мест в день по направлению (сумма мест поездов)"""
+        if route not in self._capacity:
+            self._capacity[route] = conn.execute(
+                'SELECT COALESCE(SUM(seats), 0) FROM trains WHERE route = ?', (route,)
+            ).fetchone()[0]
+        return self._capacity[route]
+
+    def sync_trains(self, snapshot: ConfigSnapshot) -> List[str]:
+        """Поезда для новых направлений конфигурации и пересчет их вместимости"""
+        conn = self._connect()
+        try:
+            with self._write_lock:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    cursor = conn.cursor()
+                    added = ensure_tables(cursor, snapshot.prices)
+                    # Даты, на которые уже пытались удерживать места с нулевой вместимостью
+                    cursor.executemany(
+                        'UPDATE seat_inventory SET capacity = '
+                        '(SELECT COALESCE(SUM(seats), 0) FROM trains WHERE route = ?) WHERE route = ?',
+                        [(route, route) for route in added]
+                    )
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+                for route in added:
+                    self._forget_route(route)
+        finally:
+            conn.close()
+        return added
+
+    def _forget_route(self, route: str):
+        """Сброс вместимости и остатков направления в кешах"""
+        self._capacity.pop(route, None)
+        for stripe in self._stripes:
+            with stripe.lock:
+                for key in [key for key in stripe.available if key[0] == route]:
+                    del stripe.available[key]
+
+    def available(self, route: str, travel_date: str) -> int:
+        """Свободные места на дату (просроченные удержания считаются свободными)"""
+        key = (route, travel_date)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT capacity - held - sold FROM seat_inventory WHERE route = ? AND travel_date = ?', key
+            ).fetchone()
+            expired = conn.execute(
+                'SELECT COALESCE(SUM(seats), 0) FROM seat_holds '
+                'WHERE status = ? AND expires_at <= ? AND route = ? AND travel_date = ?',
+                (HELD, time.time(), route, travel_date)
+            ).fetchone()[0]
+            available = (row[0] if row else self.capacity(conn, route)) + expired
+        finally:
+            conn.close()
+        self._remember(key, available)
+        return available
+
+    def _take(self, conn: sqlite3.Connection, route: str, travel_date: str, seats: int) -> bool:
+        """Условное занятие мест в счетчике (внутри транзакции)"""
+        return conn.execute(
+            'UPDATE seat_inventory SET held = held + ? '
+            'WHERE route = ? AND travel_date = ? AND capacity - held - sold >= ?',
+            (seats, route, travel_date, seats)
+        ).rowcount == 1
+
+    def hold(self, user_id: int, route: str, travel_date: str, seats: int = 1) -> Optional[int]:
+        """Удержание мест на hold_ttl секунд: hold_id или None, если мест нет"""
+        key = (route, travel_date)
+        cached = self._cached(key)
+        if cached is not None and cached < seats:
+            # Распроданная дата: отказ без транзакции
+            registry.inc('seat_holds_total', result='sold_out_cached')
+            return None
+
+        now = time.time()
+        conn = self._connect()
+        try:
+            with self._write_lock:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.execute(
+                        'INSERT OR IGNORE INTO seat_inventory (route, travel_date, capacity) VALUES (?, ?, ?)',
+                        (route, travel_date, self.capacity(conn, route))
+                    )
+                    taken = self._take(conn, route, travel_date, seats)
+                    if not taken and self._expire(conn, now, route, travel_date):
+                        taken = self._take(conn, route, travel_date, seats)
+                    hold_id = None
+                    if taken:
+                        hold_id = conn.execute(
+                            'INSERT INTO seat_holds (route, travel_date, user_id, seats, expires_at) '
+                            'VALUES (?, ?, ?, ?, ?)',
+                            (route, travel_date, user_id, seats, now + self.hold_ttl)
+                        ).lastrowid
+                    available = conn.execute(
+                        'SELECT capacity - held - sold FROM seat_inventory WHERE route = ? AND travel_date = ?', key
+                    ).fetchone()[0]
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        finally:
+            conn.close()
+
+        self._remember(key, available)
+        registry.inc('seat_holds_total', result='held' if hold_id else 'sold_out')
+        return hold_id
+
+    def _finish(self, hold_id: int, status: str, sold: int, require_active: bool, from_status: str = HELD) -> bool:
+        """Перевод удержания from_status -> status с переносом мест в счетчике"""
+        conn = self._connect()
+        try:
+            with self._write_lock:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    condition = ' AND expires_at > ?' if require_active else ''
+                    params = (hold_id, from_status, time.time()) if require_active else (hold_id, from_status)
+                    row = conn.execute(
+                        f'SELECT route, travel_date, seats FROM seat_holds '
+                        f'WHERE hold_id = ? AND status = ?{condition}', params
+                    ).fetchone()
+                    if row is not None:
+                        route, travel_date, seats = row
+                        held = seats if from_status == HELD else 0
+                        sold_delta = seats * sold - (seats if from_status == SOLD else 0)
+                        conn.execute('UPDATE seat_holds SET status = ? WHERE hold_id = ?', (status, hold_id))
+                        conn.execute(
+                            'UPDATE seat_inventory SET held = held - ?, sold = sold + ? '
+                            'WHERE route = ? AND travel_date = ?',
+                            (held, sold_delta, route, travel_date)
+                        )
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        finally:
+            conn.close()
+
+        if row is None:
+            return False
+        if not sold:
+            # Возвращенные места сразу видны в кеше остатков
+            self._invalidate((row[0], row[1]))
+        return True
+
+    def _invalidate(self, key: Tuple[str, str]):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.available.pop(key, None)
+
+    def forget(self, keys):
+        """Сброс кеша остатков после изменения счетчиков в чужой транзакции"""
+        for key in keys:
+            self._invalidate(key)
+
+    def confirm(self, hold_id: int) -> bool:
+        """Продажа удержанных мест (False - удержание истекло или уже завершено)"""
+        return self._finish(hold_id, SOLD, 1, require_active=True)
+
+    def release(self, hold_id: int) -> bool:
+        """Возврат удержанных мест (отмена оформления)"""
+        return self._finish(hold_id, RELEASED, 0, require_active=False)
+
+    def unsell(self, hold_id: int) -> bool:
+        """Возврат проданных мест, если заказ не удалось сохранить"""
+        return self._finish(hold_id, RELEASED, 0, require_active=False, from_status=SOLD)
+
+    def _expire(self, conn: sqlite3.Connection, now: float, route: str = None, travel_date: str = None) -> int:
+        """Возврат просроченных удержаний в счетчики (внутри транзакции); число удержаний"""
+        scope, params = '', ()
+        if route is not None:
+            scope, params = ' AND route = ? AND travel_date = ?', (route, travel_date)
+        expired = conn.execute(
+            f'SELECT route, travel_date, SUM(seats), COUNT(*) FROM seat_holds '
+            f'WHERE status = ? AND expires_at <= ?{scope} GROUP BY route, travel_date',
+            (HELD, now) + params
+        ).fetchall()
+        if not expired:
+            return 0
+        conn.executemany(
+            'UPDATE seat_inventory SET held = held - ? WHERE route = ? AND travel_date = ?',
+            [(seats, route, date) for route, date, seats, _ in expired]
+        )
+        conn.execute(
+            f'UPDATE seat_holds SET status = ? WHERE status = ? AND expires_at <= ?{scope}',
+            (EXPIRED, HELD, now) + params
+        )
+        for route, date, _, _ in expired:
+            self._invalidate((route, date))
+        return sum(count for _, _, _, count in expired)
+
+    def release_expired(self, now: float = None) -> int:
+        """Возврат всех просроченных удержаний; число удержаний"""
+        conn = self._connect()
+        try:
+            with self._write_lock:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    count = self._expire(conn, now or time.time())
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        finally:
+            conn.close()
+        if count:
+            registry.inc('seat_holds_total', count, result='expired')
+        return count
+
+
+# Общий экземпляр для бота
+seat_inventory = SeatInventory()
+
+
+if __name__ == "__main__":
+    # Тысячи одновременных оформлений на одну популярную дату
+    import os
+    import random
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    CHECKOUTS = 5000
+    THREADS = 32
+    ROUTE, DATE = 'Сочи', '2027-07-01'
+
+    database = os.path.join(tempfile.mkdtemp(), 'inventory.db')
+    conn = sqlite3.connect(database)
+    ensure_tables(conn.cursor(), {'Сочи': 0, 'Казань': 0})
+    conn.commit()
+    conn.close()
+    inventory = SeatInventory(database, hold_ttl=1.0)
+    capacity = TRAINS_PER_ROUTE * TRAIN_SEATS
+
+    latencies = {True: [], False: []}
+
+    def checkout(user_id: int) -> str:
+        started = time.perf_counter()
+        hold_id = inventory.hold(user_id, ROUTE, DATE, seats=random.choice((1, 1, 2)))
+        latencies[hold_id is not None].append(time.perf_counter() - started)
+        if hold_id is None:
+            return 'sold_out'
+        outcome = random.random()
+        if outcome < 0.15:
+            inventory.release(hold_id)
+            return 'cancelled'
+        if outcome < 0.25:
+            # Брошенное оформление: удержание истечет само
+            return 'abandoned'
+        return 'sold' if inventory.confirm(hold_id) else 'expired'
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        outcomes = list(pool.map(checkout, range(CHECKOUTS)))
+    elapsed = time.perf_counter() - started
+
+    time.sleep(1.1)
+    inventory.release_expired()
+    conn = sqlite3.connect(database)
+    capacity_row, held, sold = conn.execute(
+        'SELECT capacity, held, sold FROM seat_inventory WHERE route = ? AND travel_date = ?', (ROUTE, DATE)
+    ).fetchone()
+    sold_holds = conn.execute(
+        'SELECT COALESCE(SUM(seats), 0) FROM seat_holds WHERE status = ?', (SOLD,)
+    ).fetchone()[0]
+    conn.close()
+
+    assert capacity_row == capacity and held == 0, (capacity_row, held)
+    assert sold == sold_holds and sold <= capacity, (sold, sold_holds)
+    counts = {name: outcomes.count(name) for name in sorted(set(outcomes))}
+    print(f"Оформлений: {CHECKOUTS} в {THREADS} потоках за {elapsed:.2f} с ({CHECKOUTS / elapsed:.0f}/с)")
+    print(f"Итоги: {counts}; продано мест {sold} из {capacity}, без перепродажи")
+    for held, name in ((True, 'удержание'), (False, 'отказ')):
+        values = sorted(latencies[held])
+        print(f"hold(), {name}: p50 {values[len(values) // 2] * 1000:.2f} мс, "
+              f"p99 {values[int(len(values) * 0.99)] * 1000:.2f} мс")
+
+    # Повторный наплыв: возвращенные места разбираются, дальше отказы из кеша остатков без базы
+    inventory.cache_ttl = 60
+    started = time.perf_counter()
+    rejected = sum(inventory.hold(user_id, ROUTE, DATE) is None for user_id in range(10000))
+    print(f"Повторный наплыв: удержано {10000 - rejected}, отказов {rejected} "
+          f"за {(time.perf_counter() - started) * 1000:.1f} мс")
@@ -0,0 +1,160 @@
+"""
+Неблокирующее логирование: очередь, фоновая запись, JSON-формат и ротация
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime
+from typing import Optional
+
+from config import (
+    LOG_FILE, LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_ROTATION,
+    LOG_MAX_BYTES, LOG_ROTATION_WHEN, LOG_BACKUP_COUNT
+)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Стандартные атрибуты LogRecord (все остальные - поля из extra=)
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирование записи в одну строку JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Аргументы, значение которых не изменится до записи в фоновом потоке
+_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None), datetime)
+
+
+def _is_immutable(value) -> bool:
+    if isinstance(value, tuple):
+        return all(_is_immutable(item) for item in value)
+    return isinstance(value, _IMMUTABLE_ARGS)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке
+
+    Стандартный QueueHandler.prepare() собирает строку сообщения сразу;
+    здесь подстановка неизменяемых аргументов откладывается до фонового потока.
+    Изменяемые аргументы (словари, списки, объекты) подставляются сразу: к моменту
+    записи вызывающий код мог их изменить.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and not (isinstance(record.msg, str) and _is_immutable(record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # Трассировку нельзя хранить в очереди - форматируем сразу
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _create_file_handler(log_file: str) -> logging.Handler:
+    """Файловый обработчик с ротацией по размеру или по времени"""
+    if LOG_ROTATION == 'time':
+        handler = logging.handlers.TimedRotatingFileHandler(
+            log_file, when=LOG_ROTATION_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def setup_logging(log_file: str = LOG_FILE, console: bool = True):
+    """Настройка логирования через очередь (повторный вызов ничего не делает)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    handlers = [_create_file_handler(log_file)]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.setLevel(getattr(logging, LOG_LEVEL))
+
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(getattr(logging, level))
+
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Остановка фоновой записи с дозаписью очереди"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def measure_logging_cost(logger: logging.Logger, messages: int = 10000) -> float:
+    """Среднее время вызова logger.info в вызывающем потоке, мкс"""
+    import time
+
+    start = time.perf_counter()
+    for i in range(messages):
+        logger.info("Пользователь %s сохранен в БД", i)
+    return (time.perf_counter() - start) / messages * 1e6
+
+
+if __name__ == "__main__":
+    # Сравнение стоимости сообщения: синхронный FileHandler и очередь
+    import os
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+
+    sync_logger = logging.getLogger('bench.sync')
+    sync_logger.propagate = False
+    sync_handler = logging.FileHandler(os.path.join(directory, 'sync.log'), encoding='utf-8')
+    sync_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    sync_logger.addHandler(sync_handler)
+    sync_logger.setLevel(logging.INFO)
+
+    setup_logging(os.path.join(directory, 'queue.log'), console=False)
+    queue_logger = logging.getLogger('bench.queue')
+    queue_logger.setLevel(logging.INFO)
+
+    print(f"FileHandler (синхронно): {measure_logging_cost(sync_logger):.2f} мкс/сообщение")
+    print(f"QueueHandler ({LOG_FORMAT}): {measure_logging_cost(queue_logger):.2f} мкс/сообщение")
+    shutdown_logging()
@@ -0,0 +1,279 @@
+"""
+Метрики производительности: гистограммы задержек, счетчики и экспорт в формате Prometheus
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Границы корзин гистограммы в секундах (логарифмическая шкала 50 мкс .. 10 с)
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Границы для размеров (корзина покупок, число элементов)
+SIZE_BUCKETS = (1, 2, 3, 5, 8, 13, 21)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    """Ключ набора меток (отсортированный кортеж)"""
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    """Метки в синтаксисе Prometheus"""
+    pairs = key + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Последняя ячейка - значения больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Добавление наблюдения"""
+        index = bisect_left(self.buckets, value)
+        # Наблюдения приходят из потоков обработчиков: += не атомарно
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+
+    def percentile(self, percent: float) -> float:
+        """Оценка перцентиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        threshold = self.count * percent / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= threshold:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class RateCounter:
+    """Число событий за последние window секунд (кольцо посекундных ячеек)"""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self.slots = [0] * window
+        self.stamps = [0] * window
+        self._lock = threading.Lock()
+
+    def add(self, amount: int = 1, now: Optional[float] = None):
+        """Регистрация событий"""
+        second = int(now if now is not None else time.time())
+        slot = second % self.window
+        with self._lock:
+            if self.stamps[slot] != second:
+                self.stamps[slot] = second
+                self.slots[slot] = 0
+            self.slots[slot] += amount
+
+    def total(self, now: Optional[float] = None) -> int:
+        """Сумма событий в окне"""
+        second = int(now if now is not None else time.time())
+        return sum(
+            count for count, stamp in zip(self.slots, self.stamps)
+            if second - stamp < self.window
+        )
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.rates: Dict[str, RateCounter] = {}
+        self.descriptions: Dict[str, str] = {}
+
+    def histogram(self, name: str, labels: Dict[str, str] = None,
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        """Гистограмма по имени и меткам (создается при первом обращении)"""
+        key = _label_key(labels or {})
+        series = self.histograms.get(name)
+        if series is None or key not in series:
+            with self._lock:
+                series = self.histograms.setdefault(name, {})
+                if key not in series:
+                    series[key] = Histogram(buckets)
+        return series[key]
+
+    def observe(self, name: str, value: float, **labels):
+        """Наблюдение в гистограмму"""
+        self.histogram(name, labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Увеличение счетчика"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name: str, callback: Callable[[], float], description: str = ''):
+        """Регистрация вычисляемого показателя"""
+        self.gauges[name] = callback
+        if description:
+            self.descriptions[name] = description
+
+    def rate(self, name: str, window: int = 60) -> RateCounter:
+        """Скользящий счетчик событий за окно"""
+        if name not in self.rates:
+            self.rates[name] = RateCounter(window)
+        return self.rates[name]
+
+    def describe(self, name: str, description: str):
+        """Описание метрики для HELP"""
+        self.descriptions[name] = description
+
+    def timer(self, name: str, **labels) -> '_Timer':
+        """Контекстный менеджер для замера задержки"""
+        return _Timer(self.histogram(name, labels))
+
+    def timed(self, name: str, **labels) -> Callable:
+        """Декоратор замера времени выполнения функции"""
+        def decorator(func):
+            histogram = self.histogram(name, labels)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def render_prometheus(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines: List[str] = []
+
+        for name, series in sorted(self.histograms.items()):
+            self._header(lines, name, 'histogram')
+            for key, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.total:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, 'counter')
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name, callback in sorted(self.gauges.items()):
+            self._header(lines, name, 'gauge')
+            lines.append(f"{name} {callback()}")
+
+        for name, counter in sorted(self.rates.items()):
+            self._header(lines, name, 'gauge')
+            lines.append(f"{name} {counter.total()}")
+
+        return '\n'.join(lines) + '\n'
+
+    def render_summary(self) -> str:
+        """Краткая сводка для администратора"""
+        # Без разметки: сводка отправляется простым текстом (имена состояний содержат "_")
+        response = "📊 СТАТИСТИКА БОТА\n\n"
+
+        for name, callback in sorted(self.gauges.items()):
+            response += f"• {self.descriptions.get(name, name)}: {callback()}\n"
+        for name, counter in sorted(self.rates.items()):
+            response += f"• {self.descriptions.get(name, name)}: {counter.total()}\n"
+
+        for name, series in sorted(self.histograms.items()):
+            if not any(histogram.count for histogram in series.values()):
+                continue
+            is_latency = next(iter(series.values())).buckets is LATENCY_BUCKETS
+            scale, unit = (1000, ', мс') if is_latency else (1, '')
+            response += f"\n⏱️ {self.descriptions.get(name, name)} (p50 / p95 / p99{unit}):\n"
+            for key, histogram in sorted(series.items()):
+                if not histogram.count:
+                    continue
+                label = ', '.join(value for _, value in key) or 'всего'
+                response += (
+                    f"• {label}: {histogram.percentile(50) * scale:.2f} / "
+                    f"{histogram.percentile(95) * scale:.2f} / "
+                    f"{histogram.percentile(99) * scale:.2f} (n={histogram.count})\n"
+                )
+
+        return response
+
+    def _header(self, lines: List[str], name: str, metric_type: str):
+        """Строки HELP/TYPE"""
+        if name in self.descriptions:
+            lines.append(f"# HELP {name} {self.descriptions[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+
+class _Timer:
+    """Замер времени блока with"""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+# Общий реестр процесса
+registry = MetricsRegistry()
+
+
+def start_metrics_server(host: str, port: int):
+    """Запуск HTTP-сервера метрик в фоновом потоке"""
+    # http.server импортируется только здесь: без сервера метрик он не нужен при старте
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        """Обработчик /metrics"""
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            """Запросы к /metrics не пишем в лог"""
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,146 @@
+"""
+Кеш заказов пользователя для просмотра билетов
+
+Чтение через кеш (read-through) с загрузкой из БД при промахе, запись через кеш
+(write-through) при сохранении заказа. Записи вытесняются по LRU и устаревают
+через ttl секунд - на случай изменений из других процессов.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from metrics import registry
+
+registry.describe('order_cache_requests_total', 'Обращения к кешу заказов')
+
+
+class _Entry:
+    """Заказы пользователя: новые первыми; complete - список загружен из БД целиком"""
+
+    __slots__ = ('orders', 'complete', 'loaded_at')
+
+    def __init__(self, orders: List[Dict], complete: bool):
+        self.orders = orders
+        self.complete = complete
+        self.loaded_at = time.monotonic()
+
+
+class OrderCache:
+    """LRU-кеш последних заказов по user_id"""
+
+    def __init__(self, load_orders: Callable[[int], List[Dict]],
+                 load_latest: Callable[[int], Optional[Dict]],
+                 capacity: int, ttl: float, limit: int = 10):
+        self.load_orders = load_orders
+        self.load_latest = load_latest
+        self.capacity = capacity
+        self.ttl = ttl
+        # Сколько заказов показывает история (LIMIT запроса get_user_orders)
+        self.limit = limit
+        self._entries: 'OrderedDict[int, _Entry]' = OrderedDict()
+        # Загрузки из БД в процессе: user_id -> метка. Запись или сброс снимает метку,
+        # и загруженный до них список не попадает в кеш
+        self._loading: Dict[int, object] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        registry.gauge('order_cache_hit_ratio', self.hit_ratio, 'Доля попаданий в кеш заказов')
+        registry.gauge('order_cache_users', lambda: len(self._entries), 'Пользователей в кеше заказов')
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _get(self, user_id: int, need_complete: bool) -> Optional[_Entry]:
+        """Актуальная запись (под блокировкой)"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.loaded_at > self.ttl:
+            del self._entries[user_id]
+            return None
+        if need_complete and not entry.complete:
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def _put(self, user_id: int, entry: _Entry):
+        """Сохранение записи с вытеснением самой старой (под блокировкой)"""
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def _record(self, hit: bool, view: str):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        registry.inc('order_cache_requests_total', result='hit' if hit else 'miss', view=view)
+
+    def _begin_load(self, user_id: int) -> object:
+        """Метка загрузки (под блокировкой)"""
+        token = self._loading[user_id] = object()
+        return token
+
+    def _end_load(self, user_id: int, token: object) -> bool:
+        """True - за время загрузки записей и сбросов не было (под блокировкой)"""
+        if self._loading.get(user_id) is not token:
+            return False
+        del self._loading[user_id]
+        return True
+
+    def get_orders(self, user_id: int) -> List[Dict]:
+        """Последние заказы пользователя (новые первыми)"""
+        with self._lock:
+            entry = self._get(user_id, need_complete=True)
+            if entry is None:
+                token = self._begin_load(user_id)
+        self._record(entry is not None, 'orders')
+        if entry is not None:
+            return entry.orders
+
+        orders = self.load_orders(user_id)
+        with self._lock:
+            if self._end_load(user_id, token):
+                self._put(user_id, _Entry(orders, complete=True))
+        return orders
+
+    def get_latest(self, user_id: int) -> Optional[Dict]:
+        """Последний заказ пользователя"""
+        with self._lock:
+            entry = self._get(user_id, need_complete=False)
+            if entry is None or not entry.orders:
+                token = self._begin_load(user_id)
+        if entry is not None and entry.orders:
+            self._record(True, 'latest')
+            return entry.orders[0]
+        self._record(False, 'latest')
+
+        order = self.load_latest(user_id)
+        with self._lock:
+            if self._end_load(user_id, token) and order is not None and user_id not in self._entries:
+                self._put(user_id, _Entry([order], complete=False))
+        return order
+
+    def add_order(self, user_id: int, order: Dict):
+        """Write-through: новый заказ попадает в начало списка"""
+        with self._lock:
+            self._loading.pop(user_id, None)
+            entry = self._get(user_id, need_complete=False)
+            if entry is None:
+                self._put(user_id, _Entry([order], complete=False))
+            else:
+                entry.orders = [order] + entry.orders[:self.limit - 1]
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Сброс записи пользователя (None - всего кеша)"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                self._loading.clear()
+            else:
+                self._entries.pop(user_id, None)
+                self._loading.pop(user_id, None)
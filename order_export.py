@@ -0,0 +1,325 @@
+"""
+Потоковая выгрузка orders и order_items в CSV, JSONL и колоночный формат
+
+Строки читаются курсором порциями по chunk_size и сразу пишутся в файл:
+расход памяти не зависит от размера таблицы. В режиме --incremental
+выгружаются только строки с ключом больше сохраненной отметки (watermark).
+
+Примеры:
+    python order_export.py orders --format csv
+    python order_export.py order_items --format columnar --incremental
+    python order_export.py --benchmark 500000
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import struct
+import time
+import zlib
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import DATABASE_NAME, EXPORT_DIR, EXPORT_CHUNK_SIZE
+
+try:
+    import orjson
+
+    def _dumps(row: Dict) -> bytes:
+        return orjson.dumps(row)
+except ImportError:
+    def _dumps(row: Dict) -> bytes:
+        return json.dumps(row, ensure_ascii=False).encode('utf-8')
+
+# Выгружаемые таблицы и их возрастающие ключи
+TABLES = {
+    'orders': 'order_id',
+    'order_items': 'item_id'
+}
+
+FORMATS = {'csv': 'csv', 'jsonl': 'jsonl', 'columnar': 'tbc'}
+
+WATERMARK_FILE = '.watermarks.json'
+
+# Колоночный формат: заголовок, затем блоки по chunk_size строк.
+# Колонка в блоке: тип (q/d/s), маска NULL и значения, сжатые zlib.
+COLUMNAR_MAGIC = b'TBC1'
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[Tuple[str, str]]:
+    """Колонки таблицы и их тип в колоночном формате"""
+    columns = []
+    for _, name, declared, *_ in conn.execute(f'PRAGMA table_info({table})'):
+        declared = (declared or '').upper()
+        if 'INT' in declared:
+            kind = 'q'
+        elif 'REAL' in declared or 'FLOA' in declared or 'DOUB' in declared:
+            kind = 'd'
+        else:
+            kind = 's'
+        columns.append((name, kind))
+    return columns
+
+
+def iter_chunks(conn: sqlite3.Connection, table: str, since: int = 0,
+                chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[Tuple]]:
+    """Строки таблицы с ключом больше since порциями по chunk_size"""
+    key = TABLES[table]
+    cursor = conn.execute(f'SELECT * FROM {table} WHERE {key} > ? ORDER BY {key}', (since,))
+    cursor.arraysize = chunk_size
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            return
+        yield rows
+
+
+class CsvWriter:
+    """CSV с заголовком"""
+
+    def __init__(self, path: str, columns: List[Tuple[str, str]]):
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows: List[Tuple]):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlWriter:
+    """Объект JSON на строку"""
+
+    def __init__(self, path: str, columns: List[Tuple[str, str]]):
+        self.file = open(path, 'wb')
+        self.names = [name for name, _ in columns]
+
+    def write(self, rows: List[Tuple]):
+        names = self.names
+        self.file.write(b'\n'.join(_dumps(dict(zip(names, row))) for row in rows) + b'\n')
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnarWriter:
+    """Компактный колоночный формат: типизированные массивы со сжатием по блокам"""
+
+    def __init__(self, path: str, columns: List[Tuple[str, str]]):
+        self.file = open(path, 'wb')
+        self.columns = columns
+        header = json.dumps([[name, kind] for name, kind in columns]).encode('utf-8')
+        self.file.write(COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header)
+
+    @staticmethod
+    def _encode(values: List, kind: str) -> bytes:
+        nulls = bytes(value is None for value in values)
+        if kind == 'q':
+            data = array('q', [0 if value is None else int(value) for value in values]).tobytes()
+        elif kind == 'd':
+            data = array('d', [0.0 if value is None else float(value) for value in values]).tobytes()
+        else:
+            encoded = [b'' if value is None else str(value).encode('utf-8') for value in values]
+            data = array('I', map(len, encoded)).tobytes() + b''.join(encoded)
+        return zlib.compress(nulls + data, 1)
+
+    def write(self, rows: List[Tuple]):
+        self.file.write(struct.pack('<I', len(rows)))
+        for index, (_, kind) in enumerate(self.columns):
+            block = self._encode([row[index] for row in rows], kind)
+            self.file.write(struct.pack('<I', len(block)) + block)
+
+    def close(self):
+        self.file.close()
+
+
+def read_columnar(path: str) -> Iterator[Dict]:
+    """Чтение колоночного файла построчно (для проверки выгрузки)"""
+    with open(path, 'rb') as source:
+        if source.read(4) != COLUMNAR_MAGIC:
+            raise ValueError(f"{path}: не колоночный файл выгрузки")
+        header_size, = struct.unpack('<I', source.read(4))
+        columns = json.loads(source.read(header_size))
+        while True:
+            count_bytes = source.read(4)
+            if not count_bytes:
+                return
+            count, = struct.unpack('<I', count_bytes)
+            values = []
+            for _, kind in columns:
+                size, = struct.unpack('<I', source.read(4))
+                block = zlib.decompress(source.read(size))
+                nulls, data = block[:count], block[count:]
+                if kind in ('q', 'd'):
+                    column = array(kind)
+                    column.frombytes(data)
+                    column = list(column)
+                else:
+                    lengths = array('I')
+                    lengths.frombytes(data[:4 * count])
+                    column, offset = [], 4 * count
+                    for length in lengths:
+                        column.append(data[offset:offset + length].decode('utf-8'))
+                        offset += length
+                values.append([None if null else value for null, value in zip(nulls, column)])
+            names = [name for name, _ in columns]
+            for row in zip(*values):
+                yield dict(zip(names, row))
+
+
+WRITERS = {'csv': CsvWriter, 'jsonl': JsonlWriter, 'columnar': ColumnarWriter}
+
+
+class ExportResult:
+    """Итог выгрузки"""
+
+    __slots__ = ('path', 'rows', 'last_key', 'seconds')
+
+    def __init__(self, path: Optional[str], rows: int, last_key: int, seconds: float):
+        self.path = path
+        self.rows = rows
+        self.last_key = last_key
+        self.seconds = seconds
+
+
+def export_table(table: str, fmt: str, path: str, since: int = 0,
+                 chunk_size: int = EXPORT_CHUNK_SIZE, database: str = DATABASE_NAME) -> ExportResult:
+    """Выгрузка строк таблицы с ключом больше since в файл path"""
+    if table not in TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    started = time.perf_counter()
+    conn = sqlite3.connect(database)
+    temp_path = path + '.tmp'
+    writer = None
+    try:
+        columns = _columns(conn, table)
+        key_index = [name for name, _ in columns].index(TABLES[table])
+        writer = WRITERS[fmt](temp_path, columns)
+        rows, last_key = 0, since
+        for chunk in iter_chunks(conn, table, since, chunk_size):
+            writer.write(chunk)
+            rows += len(chunk)
+            last_key = chunk[-1][key_index]
+        writer.close()
+        writer = None
+        # Файл появляется целиком или не появляется вовсе
+        os.replace(temp_path, path)
+    finally:
+        if writer is not None:
+            writer.close()
+            os.remove(temp_path)
+        conn.close()
+    return ExportResult(path, rows, last_key, time.perf_counter() - started)
+
+
+def _load_watermarks(output_dir: str) -> Dict[str, int]:
+    try:
+        with open(os.path.join(output_dir, WATERMARK_FILE), encoding='utf-8') as watermark_file:
+            return json.load(watermark_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_watermarks(output_dir: str, watermarks: Dict[str, int]):
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as watermark_file:
+        json.dump(watermarks, watermark_file)
+    os.replace(path + '.tmp', path)
+
+
+def export_incremental(table: str, fmt: str, output_dir: str = EXPORT_DIR,
+                       chunk_size: int = EXPORT_CHUNK_SIZE, database: str = DATABASE_NAME) -> ExportResult:
+    """Выгрузка строк, добавленных после прошлой выгрузки этой таблицы в этом формате"""
+    os.makedirs(output_dir, exist_ok=True)
+    watermarks = _load_watermarks(output_dir)
+    mark = f"{table}.{fmt}"
+    since = watermarks.get(mark, 0)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(output_dir, f"{table}-{stamp}-from{since + 1}.{FORMATS[fmt]}")
+
+    result = export_table(table, fmt, path, since, chunk_size, database)
+    if result.rows == 0:
+        # Пустые файлы не оставляем
+        os.remove(path)
+        result.path = None
+        return result
+    # Отметка сохраняется только после успешной записи файла
+    watermarks[mark] = result.last_key
+    _save_watermarks(output_dir, watermarks)
+    return result
+
+
+def _benchmark(count: int, chunk_size: int):
+    """Скорость выгрузки каждого формата, строк в секунду"""
+    import resource
+    import tempfile
+
+    directory = tempfile.mkdtemp(prefix='travel_bot_export_')
+    database = os.path.join(directory, 'export.db')
+    conn = sqlite3.connect(database)
+    conn.execute('''
+        CREATE TABLE orders (
+            order_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, ticket_number TEXT UNIQUE,
+            destination TEXT, travel_date TEXT, scenario_name TEXT, total_price REAL,
+            status TEXT DEFAULT 'confirmed', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany(
+        'INSERT INTO orders (user_id, ticket_number, destination, travel_date, scenario_name, total_price) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        ((i % 5000, f"TK{i:010d}", ('Москва', 'Сочи', 'Казань')[i % 3], '20.10.2026',
+          'Стандартный', 1000 + i % 7000 + 0.5) for i in range(count))
+    )
+    conn.commit()
+    conn.close()
+
+    for fmt in WRITERS:
+        path = os.path.join(directory, f"orders.{FORMATS[fmt]}")
+        result = export_table('orders', fmt, path, chunk_size=chunk_size, database=database)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"{fmt:<9} {result.rows / result.seconds:>10.0f} строк/с, {size_mb:6.1f} МБ")
+
+    assert sum(1 for _ in read_columnar(os.path.join(directory, 'orders.tbc'))) == count
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Пик RSS: {peak:.0f} МБ при {count} строках")
+
+    # Инкрементальная выгрузка: вторая выгрузка без новых строк пуста
+    first = export_incremental('orders', 'jsonl', directory, chunk_size, database)
+    second = export_incremental('orders', 'jsonl', directory, chunk_size, database)
+    print(f"Инкрементальная выгрузка: {first.rows} строк, повторная: {second.rows}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('table', nargs='?', choices=sorted(TABLES))
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--output', help="файл выгрузки (без --incremental)")
+    parser.add_argument('--output-dir', default=EXPORT_DIR)
+    parser.add_argument('--incremental', action='store_true', help="только строки после прошлой выгрузки")
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument('--database', default=DATABASE_NAME)
+    parser.add_argument('--benchmark', type=int, metavar='N', help="бенчмарк на N синтетических заказах")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark(args.benchmark, args.chunk_size)
+        return
+    if not args.table:
+        parser.error("укажите таблицу")
+
+    if args.incremental:
+        result = export_incremental(args.table, args.format, args.output_dir, args.chunk_size, args.database)
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        path = args.output or os.path.join(args.output_dir, f"{args.table}.{FORMATS[args.format]}")
+        result = export_table(args.table, args.format, path, 0, args.chunk_size, args.database)
+    print(f"{args.table}: {result.rows} строк за {result.seconds:.2f} с -> {result.path or 'нет новых строк'}")
+
+
+if __name__ == "__main__":
+    main()
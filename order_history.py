@@ -0,0 +1,201 @@
+"""
+История заказов с keyset-пагинацией по (created_at, order_id)
+
+Страница определяется заказом на ее границе, а не смещением: стоимость запроса
+не зависит от глубины листания. Курсор - order_id граничного заказа, его
+(created_at, order_id) берется из той же таблицы.
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from config import DATABASE_NAME, HISTORY_PAGE_SIZE
+
+# Направления листания: к более старым и к более новым заказам
+OLDER = 'o'
+NEWER = 'n'
+
+_SELECT = '''
+    SELECT o.*,
+           (SELECT GROUP_CONCAT(oi.item_name, ', ')
+            FROM order_items oi WHERE oi.order_id = o.order_id) as items_list
+    FROM orders o
+'''
+
+_KEY = '(SELECT created_at, order_id FROM orders WHERE order_id = ?)'
+
+
+class HistoryPage:
+    """Страница истории: заказы (новые первыми) и курсоры соседних страниц"""
+
+    __slots__ = ('orders', 'newer', 'older')
+
+    def __init__(self, orders: List[Dict], newer: Optional[int], older: Optional[int]):
+        self.orders = orders
+        self.newer = newer
+        self.older = older
+
+
+def _rows(cursor: sqlite3.Cursor) -> Iterator[Dict]:
+    """Построчное чтение результата без fetchall()"""
+    columns = [description[0] for description in cursor.description]
+    for row in cursor:
+        yield dict(zip(columns, row))
+
+
+def fetch_page(user_id: int, cursor: Optional[int] = None, direction: str = OLDER,
+               limit: int = HISTORY_PAGE_SIZE, database: str = DATABASE_NAME) -> HistoryPage:
+    """Страница после (OLDER) или перед (NEWER) заказом cursor; без курсора - самые новые"""
+    conn = sqlite3.connect(database)
+    try:
+        if cursor is None:
+            query = _SELECT + 'WHERE o.user_id = ? ORDER BY o.created_at DESC, o.order_id DESC LIMIT ?'
+            params = (user_id, limit + 1)
+        elif direction == NEWER:
+            query = (_SELECT + f'WHERE o.user_id = ? AND (o.created_at, o.order_id) > {_KEY} '
+                     'ORDER BY o.created_at ASC, o.order_id ASC LIMIT ?')
+            params = (user_id, cursor, limit + 1)
+        else:
+            query = (_SELECT + f'WHERE o.user_id = ? AND (o.created_at, o.order_id) < {_KEY} '
+                     'ORDER BY o.created_at DESC, o.order_id DESC LIMIT ?')
+            params = (user_id, cursor, limit + 1)
+
+        orders = list(_rows(conn.execute(query, params)))
+    finally:
+        conn.close()
+
+    # Лишняя строка показывает, есть ли страница дальше в направлении листания
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    if cursor is not None and direction == NEWER:
+        orders.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = cursor is not None, has_more
+
+    if not orders:
+        return HistoryPage([], None, None)
+    return HistoryPage(
+        orders,
+        orders[0]['order_id'] if has_newer else None,
+        orders[-1]['order_id'] if has_older else None
+    )
+
+
+def iter_orders(user_id: int, batch_size: int = 500, database: str = DATABASE_NAME) -> Iterator[Dict]:
+    """Все заказы пользователя (новые первыми) потоком, без загрузки в память"""
+    conn = sqlite3.connect(database)
+    try:
+        cursor = conn.execute(
+            'SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC, order_id DESC', (user_id,)
+        )
+        cursor.arraysize = batch_size
+        columns = [description[0] for description in cursor.description]
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        conn.close()
+
+
+def _format_created(value) -> str:
+    """Дата бронирования для показа"""
+    try:
+        return datetime.fromisoformat(value).strftime('%d.%m.%Y %H:%M')
+    except (ValueError, TypeError):
+        return str(value)
+
+
+def render_page(page: HistoryPage) -> str:
+    """Текст страницы истории"""
+    if not page.orders:
+        return "🎫 История заказов пуста. Начните новое бронирование!"
+
+    lines = ["📜 **ИСТОРИЯ ЗАКАЗОВ**\n"]
+    for order in page.orders:
+        lines.append(f"**Билет №{order['ticket_number']}**")
+        lines.append(f"📍 {order.get('destination') or 'Не указано'} • 📅 {order.get('travel_date') or 'Не указана'}")
+        lines.append(f"💰 {order.get('total_price') or 0:.2f} руб. • 📋 {order.get('status', 'Неизвестно')}")
+        lines.append(f"🕒 Забронирован: {_format_created(order.get('created_at'))}")
+        lines.append("━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Листание истории пользователя со 100 000 заказов: OFFSET против keyset
+    import os
+    import random
+    import tempfile
+    import time
+
+    ORDERS = 100_000
+    PAGE = HISTORY_PAGE_SIZE
+    USER_ID = 42
+
+    database = os.path.join(tempfile.mkdtemp(), 'history.db')
+    conn = sqlite3.connect(database)
+    conn.executescript('''
+        CREATE TABLE orders (
+            order_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, ticket_number TEXT UNIQUE,
+            destination TEXT, travel_date TEXT, scenario_name TEXT, total_price REAL,
+            status TEXT DEFAULT 'confirmed', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE order_items (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT, order_id INTEGER, item_type TEXT,
+            item_name TEXT, price REAL, quantity INTEGER DEFAULT 1
+        );
+        CREATE INDEX idx_orders_user_created ON orders (user_id, created_at, order_id);
+        CREATE INDEX idx_order_items_order ON order_items (order_id);
+    ''')
+    # Несколько заказов в секунду: порядок внутри секунды решает order_id
+    start_time = time.time() - ORDERS
+    conn.executemany(
+        'INSERT INTO orders (user_id, ticket_number, destination, travel_date, scenario_name, total_price, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((USER_ID if i % 10 else i, f"TK{i:010d}", random.choice(['Москва', 'Сочи', 'Казань']), '01.01.2027',
+          'Стандартный', random.uniform(1000, 9000),
+          datetime.fromtimestamp(start_time + i // 3).strftime('%Y-%m-%d %H:%M:%S'))
+         for i in range(ORDERS * 10 // 9))
+    )
+    conn.executemany(
+        'INSERT INTO order_items (order_id, item_type, item_name, price) VALUES (?, ?, ?, ?)',
+        ((order_id, 'ticket', 'Билет', 1000) for order_id in range(1, ORDERS * 10 // 9 + 1))
+    )
+    conn.commit()
+    total = conn.execute('SELECT COUNT(*) FROM orders WHERE user_id = ?', (USER_ID,)).fetchone()[0]
+    print(f"Заказов пользователя: {total}")
+
+    def offset_page(offset: int):
+        return conn.execute(
+            _SELECT + 'WHERE o.user_id = ? ORDER BY o.created_at DESC, o.order_id DESC LIMIT ? OFFSET ?',
+            (USER_ID, PAGE, offset)
+        ).fetchall()
+
+    for depth in (0, 1000, 10_000, total // PAGE - 1):
+        offset = depth * PAGE
+        started = time.perf_counter()
+        expected = offset_page(offset)
+        offset_ms = (time.perf_counter() - started) * 1000
+
+        # Курсор страницы depth - последний заказ предыдущей страницы
+        cursor = None if depth == 0 else offset_page(offset - PAGE)[-1][0]
+        started = time.perf_counter()
+        page = fetch_page(USER_ID, cursor, OLDER, PAGE, database)
+        keyset_ms = (time.perf_counter() - started) * 1000
+        assert [order['order_id'] for order in page.orders] == [row[0] for row in expected]
+        print(f"Страница {depth:>6}: OFFSET {offset_ms:8.2f} мс, keyset {keyset_ms:6.2f} мс")
+
+    # Листание вперед и назад возвращает те же страницы
+    first = fetch_page(USER_ID, None, OLDER, PAGE, database)
+    second = fetch_page(USER_ID, first.older, OLDER, PAGE, database)
+    back = fetch_page(USER_ID, second.newer, NEWER, PAGE, database)
+    assert [o['order_id'] for o in back.orders] == [o['order_id'] for o in first.orders]
+    assert back.newer is None and first.newer is None
+
+    started = time.perf_counter()
+    streamed = sum(1 for _ in iter_orders(USER_ID, database=database))
+    print(f"Потоковый обход всех заказов: {streamed} за {(time.perf_counter() - started) * 1000:.0f} мс")
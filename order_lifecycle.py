@@ -0,0 +1,323 @@
+"""
+Жизненный цикл заказа: переходы статусов, журнал order_events и счетчики по статусам
+
+Статус хранится в orders.status, каждый переход дописывается в order_events
+(журнал только пополняется). Массовый переход - набор SQL-операторов над всеми
+подходящими заказами в одной транзакции: журнал заполняется INSERT ... SELECT,
+статус меняется одним UPDATE, без чтения заказов в Python. Число заказов по
+статусам лежит в order_status_counts и обновляется в той же транзакции,
+поэтому сводка не просматривает orders. Отмена и возврат в той же транзакции
+возвращают проданные места в seat_inventory и вычитают заказы из агрегатов продаж.
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import analytics
+import inventory
+from config import DATABASE_NAME
+from config_snapshot import config_store
+from inventory import seat_inventory
+from metrics import registry
+
+registry.describe('order_transitions_total', 'Переходы статусов заказов')
+
+PENDING = 'pending'
+CONFIRMED = 'confirmed'
+PAID = 'paid'
+PROCESSING = 'processing'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+REFUNDED = 'refunded'
+
+# Допустимые переходы: из статуса -> в статусы. Заказ бота создается оплаченным
+# по факту подтверждения (confirmed), поэтому его отмена - возврат денег
+TRANSITIONS = {
+    PENDING: {CONFIRMED, CANCELLED},
+    CONFIRMED: {PAID, PROCESSING, COMPLETED, REFUNDED},
+    PAID: {PROCESSING, COMPLETED, REFUNDED},
+    PROCESSING: {COMPLETED, REFUNDED},
+    COMPLETED: set(),
+    CANCELLED: set(),
+    REFUNDED: set()
+}
+
+
+class TransitionResult(NamedTuple):
+    """Итог перехода: число заказов, сумма возврата, затронутые пользователи и даты с возвращенными местами"""
+    orders: int
+    refunded: float
+    user_ids: List[int]
+    seats: Tuple[Tuple[str, str], ...] = ()
+
+
+def ensure_tables(cursor: sqlite3.Cursor):
+    """Журнал переходов, счетчики по статусам (заполняются по существующим заказам) и индексы"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            from_status TEXT,
+            to_status TEXT NOT NULL,
+            refund_amount REAL NOT NULL DEFAULT 0,
+            reason TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_events_order ON order_events (order_id, event_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_events_status ON order_events (to_status, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_status_counts (
+            status TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    if cursor.execute('SELECT 1 FROM order_status_counts LIMIT 1').fetchone() is None:
+        cursor.execute('''
+            INSERT INTO order_status_counts (status, orders)
+            SELECT COALESCE(status, ?), COUNT(*) FROM orders GROUP BY status
+        ''', (CONFIRMED,))
+
+
+def _count(cursor: sqlite3.Cursor, rows: Iterable[Tuple[str, int]]):
+    cursor.executemany('''
+        INSERT INTO order_status_counts (status, orders) VALUES (?, ?)
+        ON CONFLICT (status) DO UPDATE SET orders = orders + excluded.orders
+    ''', rows)
+
+
+def record_created(cursor: sqlite3.Cursor, order_ids: Sequence[int], status: str = CONFIRMED):
+    """Учет новых заказов (в транзакции сохранения заказа)"""
+    cursor.executemany(
+        'INSERT INTO order_events (order_id, from_status, to_status) VALUES (?, NULL, ?)',
+        [(order_id, status) for order_id in order_ids]
+    )
+    _count(cursor, [(status, len(order_ids))])
+
+
+def _return_seats(cursor: sqlite3.Cursor, scope: str, params: Tuple) -> Dict[Tuple[str, str], int]:
+    """Возврат мест отменяемых заказов: (направление, дата ISO) -> число мест"""
+    # В orders дата в формате отображения, в seat_inventory - ISO
+    date_format = config_store.current.display['date_format']
+    seats: Dict[Tuple[str, str], int] = {}
+    for destination, travel_date, count in cursor.execute(
+        f'SELECT destination, travel_date, COUNT(*) FROM orders WHERE {scope} GROUP BY destination, travel_date',
+        params
+    ).fetchall():
+        try:
+            day = datetime.strptime(travel_date, date_format).date().isoformat()
+        except (TypeError, ValueError):
+            continue
+        seats[(destination, day)] = seats.get((destination, day), 0) + count
+    inventory.return_sold(cursor, seats)
+    return seats
+
+
+def _transition(cursor: sqlite3.Cursor, to_status: str, where: str, params: Tuple,
+                reason: Optional[str], refund_percentage: float) -> TransitionResult:
+    """Переход всех заказов условия where из допустимых статусов (внутри транзакции)"""
+    sources = [status for status, targets in TRANSITIONS.items() if to_status in targets]
+    if not sources:
+        return TransitionResult(0, 0.0, [])
+    scope = f"({where}) AND status IN ({', '.join('?' * len(sources))})"
+    scope_params = tuple(params) + tuple(sources)
+
+    counts = cursor.execute(
+        f'SELECT status, COUNT(*), COALESCE(SUM(total_price), 0) FROM orders WHERE {scope} GROUP BY status',
+        scope_params
+    ).fetchall()
+    if not counts:
+        return TransitionResult(0, 0.0, [])
+
+    share = refund_percentage / 100 if to_status == REFUNDED else 0.0
+    cursor.execute(f'''
+        INSERT INTO order_events (order_id, from_status, to_status, refund_amount, reason)
+        SELECT order_id, status, ?, ROUND(COALESCE(total_price, 0) * ?, 2), ? FROM orders WHERE {scope}
+    ''', (to_status, share, reason) + scope_params)
+    user_ids = [row[0] for row in cursor.execute(f'SELECT DISTINCT user_id FROM orders WHERE {scope}', scope_params)]
+    seats = {}
+    if to_status in (CANCELLED, REFUNDED):
+        # До смены статуса: условие scope выбирает заказы по исходным статусам
+        analytics.forget_orders(cursor, scope, scope_params)
+        seats = _return_seats(cursor, scope, scope_params)
+    cursor.execute(f'UPDATE orders SET status = ? WHERE {scope}', (to_status,) + scope_params)
+
+    total = sum(count for _, count, _ in counts)
+    _count(cursor, [(status, -count) for status, count, _ in counts] + [(to_status, total)])
+    registry.inc('order_transitions_total', total, to=to_status)
+    return TransitionResult(total, round(sum(amount for _, _, amount in counts) * share, 2), user_ids, tuple(seats))
+
+
+def _run(database: str, steps) -> TransitionResult:
+    """Переходы одной транзакцией; steps(cursor) возвращает список TransitionResult"""
+    conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            results = steps(conn.cursor())
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    seats = tuple({key for result in results for key in result.seats})
+    seat_inventory.forget(seats)
+    return TransitionResult(
+        sum(result.orders for result in results),
+        round(sum(result.refunded for result in results), 2),
+        sorted({user_id for result in results for user_id in result.user_ids}),
+        seats
+    )
+
+
+def _refund_percentage(refund_percentage: Optional[float]) -> float:
+    if refund_percentage is None:
+        return config_store.current.business['refund_percentage']
+    return refund_percentage
+
+
+def transition(order_ids: Sequence[int], to_status: str, reason: str = None,
+               refund_percentage: float = None, database: str = DATABASE_NAME) -> TransitionResult:
+    """Перевод заказов в статус; недопустимые переходы пропускаются"""
+    # Список номеров - один параметр JSON, без ограничения числа параметров SQLite
+    ids = json.dumps(list(order_ids))
+    return _run(database, lambda cursor: [_transition(
+        cursor, to_status, 'order_id IN (SELECT value FROM json_each(?))', (ids,),
+        reason, _refund_percentage(refund_percentage)
+    )])
+
+
+def refund_ticket(user_id: int, ticket_number: str, reason: str = None,
+                  database: str = DATABASE_NAME) -> TransitionResult:
+    """Возврат заказа пользователем по номеру билета (процент возврата из business)"""
+    return _run(database, lambda cursor: [_transition(
+        cursor, REFUNDED, 'ticket_number = ? AND user_id = ?', (ticket_number, user_id),
+        reason, _refund_percentage(None)
+    )])
+
+
+def cancel_trip(destination: str, travel_date: str, reason: str = None,
+                database: str = DATABASE_NAME) -> TransitionResult:
+    """Отмена поезда: неоплаченные заказы отменяются, оплаченные возвращаются полностью"""
+    where, params = 'destination = ? AND travel_date = ?', (destination, travel_date)
+    return _run(database, lambda cursor: [
+        _transition(cursor, CANCELLED, where, params, reason, 0),
+        _transition(cursor, REFUNDED, where, params, reason, 100)
+    ])
+
+
+def status_counts(database: str = DATABASE_NAME) -> Dict[str, int]:
+    """Число заказов по статусам"""
+    conn = sqlite3.connect(database)
+    try:
+        return dict(conn.execute('SELECT status, orders FROM order_status_counts WHERE orders > 0'))
+    finally:
+        conn.close()
+
+
+def order_events(order_id: int, database: str = DATABASE_NAME) -> List[Tuple]:
+    """История переходов заказа: (из статуса, в статус, возврат, причина, время)"""
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute(
+            'SELECT from_status, to_status, refund_amount, reason, created_at FROM order_events '
+            'WHERE order_id = ? ORDER BY event_id', (order_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def render_status(status: str) -> str:
+    """Статус заказа для пользователя: значок и название из order_statuses"""
+    if not status:
+        return 'Неизвестно'
+    name = config_store.current.raw.get('order_statuses', {}).get(status, status)
+    return f"{'❌' if status in (CANCELLED, REFUNDED) else '✅'} {name}"
+
+
+def render_status_counts(counts: Dict[str, int]) -> str:
+    """Сводка по статусам для администратора"""
+    names = config_store.current.raw.get('order_statuses', {})
+    lines = ["📋 Заказы по статусам", ""]
+    for status in TRANSITIONS:
+        if counts.get(status):
+            lines.append(f"{names.get(status, status)}: {counts[status]}")
+    lines.append("")
+    lines.append(f"Всего: {sum(counts.values())}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Массовые переходы на 200 тыс. заказов и счетчики против COUNT по orders
+    import os
+    import random
+    import tempfile
+    import time
+
+    COUNT = 200_000
+    database = os.path.join(tempfile.mkdtemp(), 'lifecycle.db')
+    conn = sqlite3.connect(database)
+    conn.execute('''
+        CREATE TABLE orders (
+            order_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, ticket_number TEXT UNIQUE,
+            destination TEXT, travel_date TEXT, scenario_name TEXT, total_price REAL,
+            status TEXT DEFAULT 'confirmed', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_orders_destination_date ON orders (destination, travel_date)')
+    conn.execute('CREATE TABLE order_items (order_id INTEGER, item_type TEXT, item_name TEXT)')
+    conn.execute('CREATE INDEX idx_order_items_order ON order_items (order_id)')
+    routes = ['Москва', 'Сочи', 'Казань', 'Новосибирск']
+    dates = [f"{day:02d}.07.2027" for day in range(1, 31)]
+    conn.executemany(
+        'INSERT INTO orders (user_id, ticket_number, destination, travel_date, total_price) VALUES (?, ?, ?, ?, ?)',
+        ((random.randrange(20_000), f"TK{i:010d}", random.choice(routes), random.choice(dates),
+          random.randint(1000, 5000)) for i in range(COUNT))
+    )
+    ensure_tables(conn.cursor())
+    analytics.ensure_tables(conn.cursor())
+    inventory.ensure_tables(conn.cursor(), dict.fromkeys(routes, 0))
+    # Места дня отмены проданы: отмена вернет их в счетчик
+    sold = conn.execute(
+        "SELECT COUNT(*) FROM orders WHERE destination = 'Сочи' AND travel_date = '15.07.2027'"
+    ).fetchone()[0]
+    conn.execute("INSERT INTO seat_inventory (route, travel_date, capacity, sold) VALUES ('Сочи', '2027-07-15', ?, ?)",
+                 (sold, sold))
+    conn.commit()
+    conn.close()
+
+    started = time.perf_counter()
+    paid = transition(range(1, COUNT + 1, 2), PAID, database=database)
+    print(f"Оплата {paid.orders} заказов одной транзакцией: {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    started = time.perf_counter()
+    trip = cancel_trip('Сочи', '15.07.2027', reason='Поезд отменен', database=database)
+    print(f"Отмена поезда: {trip.orders} заказов, возврат {trip.refunded:.2f} руб., "
+          f"{len(trip.user_ids)} пользователей за {(time.perf_counter() - started) * 1000:.1f} мс")
+    conn = sqlite3.connect(database)
+    assert conn.execute("SELECT sold FROM seat_inventory WHERE route = 'Сочи'").fetchone()[0] == 0
+    assert conn.execute(
+        "SELECT orders FROM sales_rollup WHERE dimension = 'total' AND key = 'all'"
+    ).fetchone()[0] == COUNT - trip.orders
+    conn.close()
+
+    started = time.perf_counter()
+    refund = refund_ticket(-1, 'TK0000000001', database=database)
+    print(f"Возврат одного билета (чужой - не найден): {refund.orders} за "
+          f"{(time.perf_counter() - started) * 1000:.2f} мс")
+
+    conn = sqlite3.connect(database)
+    started = time.perf_counter()
+    scanned = dict(conn.execute('SELECT status, COUNT(*) FROM orders GROUP BY status'))
+    scan_ms = (time.perf_counter() - started) * 1000
+    conn.close()
+    started = time.perf_counter()
+    counts = status_counts(database)
+    counts_ms = (time.perf_counter() - started) * 1000
+    assert counts == scanned, (counts, scanned)
+    print(f"Счетчики по статусам: {counts_ms:.2f} мс (COUNT по orders {scan_ms:.1f} мс)")
+    print(render_status_counts(counts))
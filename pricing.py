@@ -0,0 +1,220 @@
+"""
+Динамические цены билетов: спрос, срок до поездки и день недели
+
+Цены считаются заранее для каждого направления на все дни окна бронирования
+(max_booking_days) и лежат в одном массиве array: индекс - номер направления
+* число дней + смещение даты от дня расчета. Поиск цены при обработке
+сообщения - одно обращение к словарю и к массиву. Таблица пересчитывается
+в фоне (спрос из orders меняется с каждым заказом), после перезагрузки
+конфигурации и при смене суток; готовая таблица подменяется одной ссылкой.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    DATABASE_NAME, DYNAMIC_PRICING, PRICE_REFRESH_INTERVAL, PRICE_WEEKDAY_FACTORS,
+    PRICE_LEAD_TIME_FACTORS, PRICE_DEMAND_WEIGHT, PRICE_MIN_FACTOR, PRICE_MAX_FACTOR
+)
+from config_snapshot import config_store
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+registry.describe('price_table_refresh_seconds', 'Пересчет таблицы цен')
+
+# Цена направления, которого нет в конфигурации
+DEFAULT_PRICE = 1000
+
+
+def ensure_tables(cursor: sqlite3.Cursor):
+    """Индекс заказов по направлению и дате для расчета спроса"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_destination_date ON orders (destination, travel_date)')
+
+
+def lead_time_factor(days: int) -> float:
+    """Множитель по числу дней до поездки"""
+    for max_days, factor in PRICE_LEAD_TIME_FACTORS:
+        if max_days is None or days <= max_days:
+            return factor
+    return 1.0
+
+
+class PriceTable:
+    """Цены на дни [first_day, first_day + days) для каждого направления"""
+
+    __slots__ = ('days', 'rows', 'offsets', 'prices', 'expires_at')
+
+    def __init__(self, first_day: date, days: int, rows: Dict[str, int], prices: array):
+        self.days = days
+        self.rows = rows
+        # Дата ISO -> смещение: без разбора даты на каждом поиске
+        self.offsets = {(first_day + timedelta(days=offset)).isoformat(): offset for offset in range(days)}
+        self.prices = prices
+        # Таблица считается от сегодняшнего дня: в полночь нужна новая
+        self.expires_at = datetime.combine(first_day + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+class DynamicPricing:
+    """Таблица цен с фоновым пересчетом"""
+
+    def __init__(self, database: str = DATABASE_NAME):
+        self.database = database
+        self._table: Optional[PriceTable] = None
+        self._refresh_lock = threading.Lock()
+        # Занята, пока идет пересчет, запущенный поиском цены
+        self._refresh_pending = threading.Lock()
+        self._stop = threading.Event()
+        config_store.subscribe(lambda snapshot: self.refresh())
+
+    def _demand(self, date_texts: List[str]) -> Tuple[Dict[Tuple[str, str], int], Dict[str, int]]:
+        """Заказы по (направление, дата) в окне и мест в день по направлениям"""
+        conn = sqlite3.connect(self.database)
+        try:
+            # В orders дата хранится в формате отображения, поэтому окно - список дат, а не диапазон
+            placeholders = ', '.join('?' * len(date_texts))
+            orders = {
+                (route, travel_date): count
+                for route, travel_date, count in conn.execute(
+                    f"SELECT destination, travel_date, COUNT(*) FROM orders "
+                    f"WHERE travel_date IN ({placeholders}) AND status NOT IN ('cancelled', 'refunded') "
+                    f"GROUP BY destination, travel_date",
+                    date_texts
+                )
+            }
+            capacity = dict(conn.execute('SELECT route, SUM(seats) FROM trains GROUP BY route'))
+        except sqlite3.OperationalError:
+            # База еще не создана: цены без учета спроса
+            return {}, {}
+        finally:
+            conn.close()
+        return orders, capacity
+
+    @registry.timed('price_table_refresh_seconds')
+    def refresh(self) -> PriceTable:
+        """Пересчет таблицы цен от сегодняшнего дня"""
+        with self._refresh_lock:
+            config = config_store.current
+            first_day = date.today()
+            days = config.business['max_booking_days'] + 1
+            dates = [first_day + timedelta(days=offset) for offset in range(days)]
+            # Множители срока и дня недели одинаковы для всех направлений
+            calendar = [
+                lead_time_factor(offset) * PRICE_WEEKDAY_FACTORS[day.weekday()]
+                for offset, day in enumerate(dates)
+            ]
+            date_texts = [day.strftime(config.display['date_format']) for day in dates]
+            orders, capacity = self._demand(date_texts)
+
+            rows = {}
+            prices = array('q')
+            for route, base_price in config.prices.items():
+                rows[route] = len(rows)
+                seats = capacity.get(route) or 0
+                for offset, factor in enumerate(calendar):
+                    if seats:
+                        factor *= 1 + PRICE_DEMAND_WEIGHT * min(1.0, orders.get((route, date_texts[offset]), 0) / seats)
+                    factor = min(PRICE_MAX_FACTOR, max(PRICE_MIN_FACTOR, factor))
+                    prices.append(round(base_price * factor))
+
+            self._table = PriceTable(first_day, days, rows, prices)
+            return self._table
+
+    def refresh_async(self):
+        """Пересчет таблицы в отдельном потоке, если он еще не запущен"""
+        if not self._refresh_pending.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Ошибка пересчета таблицы цен")
+            finally:
+                self._refresh_pending.release()
+
+        threading.Thread(target=run, name='price-refresh-once', daemon=True).start()
+
+    def price(self, route: str, travel_date: Optional[str]) -> int:
+        """Цена билета на направление и дату (ISO); без даты - базовая цена"""
+        if not DYNAMIC_PRICING or not travel_date:
+            return config_store.current.prices.get(route, DEFAULT_PRICE)
+        table = self._table
+        if table is None or time.time() >= table.expires_at:
+            # Сообщение не ждет пересчета: до готовности новой таблицы - прежняя или базовая цена
+            self.refresh_async()
+            if table is None:
+                return config_store.current.prices.get(route, DEFAULT_PRICE)
+        row = table.rows.get(route)
+        offset = table.offsets.get(travel_date)
+        if row is None or offset is None:
+            return config_store.current.prices.get(route, DEFAULT_PRICE)
+        return table.prices[row * table.days + offset]
+
+    def start(self, interval: float = PRICE_REFRESH_INTERVAL) -> threading.Thread:
+        """Фоновый пересчет таблицы"""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("Ошибка пересчета таблицы цен")
+
+        thread = threading.Thread(target=run, name='price-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+# Общий экземпляр для бота
+dynamic_prices = DynamicPricing()
+
+
+if __name__ == "__main__":
+    # Пересчет таблицы по 5 тыс. заказов и стоимость поиска цены против плоского словаря
+    import os
+    import random
+    import tempfile
+    import timeit
+
+    import inventory
+
+    database = os.path.join(tempfile.mkdtemp(), 'pricing.db')
+    conn = sqlite3.connect(database)
+    conn.execute('CREATE TABLE orders (destination TEXT, travel_date TEXT, status TEXT)')
+    inventory.ensure_tables(conn.cursor())
+    ensure_tables(conn.cursor())
+    routes = list(config_store.current.prices)
+    today = date.today()
+    conn.executemany('INSERT INTO orders VALUES (?, ?, ?)', (
+        (random.choice(routes), (today + timedelta(days=int(random.expovariate(1 / 10)))).strftime('%d.%m.%Y'),
+         'confirmed')
+        for _ in range(5000)
+    ))
+    conn.commit()
+    conn.close()
+
+    pricing = DynamicPricing(database)
+    started = time.perf_counter()
+    table = pricing.refresh()
+    print(f"Таблица {len(table.rows)} x {table.days} цен за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    route = routes[0]
+    for offset in (1, 5, 30, 120):
+        day = today + timedelta(days=offset)
+        print(f"  {route}, {day:%d.%m} ({day:%a}): {pricing.price(route, day.isoformat())} "
+              f"(базовая {config_store.current.prices[route]})")
+
+    lookups = [(random.choice(routes), (today + timedelta(days=random.randint(0, 180))).isoformat())
+               for _ in range(1000)]
+    flat = config_store.current.prices
+    dynamic = timeit.timeit(lambda: [pricing.price(r, d) for r, d in lookups], number=100) / 100_000
+    static = timeit.timeit(lambda: [flat.get(r, DEFAULT_PRICE) for r, d in lookups], number=100) / 100_000
+    print(f"Поиск цены: {dynamic * 1e9:.0f} нс (плоская цена {static * 1e9:.0f} нс)")
@@ -0,0 +1,164 @@
+"""
+Выборочный профилировщик обработчиков: стеки в формате collapsed (flamegraph.pl, speedscope)
+"""
+
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from config import PROFILE_SAMPLE_RATE, PROFILE_INTERVAL, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+_DISABLED = nullcontext()
+
+
+def _frame_name(frame) -> str:
+    """Имя кадра стека для collapsed-формата"""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sample:
+    """Профилируемый вызов обработчика"""
+
+    __slots__ = ('profiler', 'branch', 'thread_id')
+
+    def __init__(self, profiler: 'SamplingProfiler', branch: str):
+        self.profiler = profiler
+        self.branch = branch
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        # Кадр, вызвавший profile() - граница снимаемого стека
+        self.profiler._active[self.thread_id] = (self.branch, sys._getframe(1))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._active.pop(self.thread_id, None)
+        with self.profiler._lock:
+            self.profiler.messages[self.branch] += 1
+        return False
+
+
+class SamplingProfiler:
+    """Семплирующий профилировщик с агрегацией по веткам обработчика"""
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 interval: float = PROFILE_INTERVAL, output_dir: str = PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.output_dir = output_dir
+        self.enabled = False
+        self.stacks: Counter = Counter()
+        self.messages: Counter = Counter()
+        # id потока -> (ветка, граничный кадр)
+        self._active: Dict[int, Tuple[str, object]] = {}
+        self._thread: Optional[threading.Thread] = None
+        # Счетчики stacks и messages меняются из потоков обработчиков и сборщика
+        self._lock = threading.Lock()
+
+    def profile(self, branch: str):
+        """Контекст профилирования ветки обработчика (выключен - одна проверка флага)"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return _DISABLED
+        return _Sample(self, branch)
+
+    def start(self, sample_rate: Optional[float] = None):
+        """Включение профилирования; доля сообщений - в интервале (0, 1]"""
+        if sample_rate is not None:
+            if not 0 < sample_rate <= 1:
+                raise ValueError(f"Доля сообщений должна быть в интервале (0, 1], а не {sample_rate}")
+            self.sample_rate = sample_rate
+        if self.enabled:
+            return
+        self.enabled = True
+        self._thread = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+        self._thread.start()
+        logger.info("Профилирование включено (доля сообщений: %s)", self.sample_rate)
+
+    def stop(self) -> Optional[str]:
+        """Выключение профилирования и сохранение результатов"""
+        if not self.enabled:
+            return None
+        self.enabled = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._active.clear()
+        path = self.dump()
+        logger.info("Профилирование выключено, результаты: %s", path)
+        return path
+
+    def toggle(self) -> Optional[str]:
+        """Переключение режима (для сигнала)"""
+        if self.enabled:
+            return self.stop()
+        self.start()
+        return None
+
+    def dump(self) -> Optional[str]:
+        """Запись накопленных стеков в файл и очистка"""
+        with self._lock:
+            stacks = self.stacks
+            if not stacks:
+                return None
+            self.stacks = Counter()
+            self.messages = Counter()
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(
+            self.output_dir, f"collapsed-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+        )
+        with open(path, 'w', encoding='utf-8') as output:
+            for stack, count in stacks.most_common():
+                output.write(f"{stack} {count}\n")
+        return path
+
+    def summary(self) -> str:
+        """Сводка по веткам для администратора"""
+        state = "включено" if self.enabled else "выключено"
+        response = f"🔬 Профилирование {state}, доля сообщений: {self.sample_rate}\n"
+        with self._lock:
+            stacks = self.stacks.copy()
+            branches = self.messages.copy()
+        samples_by_branch: Counter = Counter()
+        for stack, count in stacks.items():
+            samples_by_branch[stack.split(';', 1)[0]] += count
+        for branch, messages in branches.most_common():
+            response += f"• {branch}: {messages} сообщ., {samples_by_branch[branch]} выборок\n"
+        return response
+
+    def install_signal_handler(self, signum: int = getattr(signal, 'SIGUSR2', 0)):
+        """Переключение профилирования сигналом (kill -USR2 <pid>)"""
+        if signum:
+            signal.signal(signum, lambda *_: self.toggle())
+
+    def _sample_loop(self):
+        """Фоновый сбор стеков активных обработчиков"""
+        while self.enabled:
+            if self._active:
+                frames = sys._current_frames()
+                samples = []
+                for thread_id, (branch, boundary) in list(self._active.items()):
+                    frame = frames.get(thread_id)
+                    names = []
+                    while frame is not None and frame is not boundary:
+                        names.append(_frame_name(frame))
+                        frame = frame.f_back
+                    names.append(branch)
+                    samples.append(';'.join(reversed(names)))
+                with self._lock:
+                    self.stacks.update(samples)
+            time.sleep(self.interval)
+
+
+# Общий профилировщик процесса
+profiler = SamplingProfiler()
@@ -0,0 +1,294 @@
+"""
+Воспроизведение записанных диалогов через TravelBot.process_message
+
+Запись - JSONL со строками {"user_id": 1, "text": "москва", "timestamp": 1760000000.5}
+(timestamp - секунды эпохи или ISO-строка). Сообщения одного пользователя
+обрабатываются одним процессом по порядку; каждый процесс работает со своей
+временной базой.
+
+Примеры:
+    python replay.py --import-dialogues dialogues.txt --output traffic.jsonl
+    python replay.py traffic.jsonl --speed 0 --workers 4 --output run.jsonl
+    python replay.py traffic.jsonl --speed 10 --baseline run.jsonl
+"""
+
+import argparse
+import heapq
+import json
+import multiprocessing
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+# Изменчивые части ответов, которые не считаются расхождением
+_NORMALIZE = [
+    (re.compile(r'TK[0-9A-Z]{10,12}'), 'TK#'),
+    (re.compile(r'\d{2}\.\d{2}\.\d{4}( \d{2}:\d{2}(:\d{2})?)?'), '<дата>'),
+    (re.compile(r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}'), '<дата>')
+]
+
+# Признак начала нового диалога при импорте dialogues.txt
+_GREETINGS = ('привет', 'здравствуй', '/start')
+
+
+def normalize(response: str) -> str:
+    """Ответ без номеров билетов и дат"""
+    for pattern, replacement in _NORMALIZE:
+        response = pattern.sub(replacement, response)
+    return response
+
+
+def _timestamp(value) -> float:
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def load_records(path: str) -> Iterator[Dict]:
+    """Записи JSONL построчно"""
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                record['timestamp'] = _timestamp(record.get('timestamp'))
+                yield record
+
+
+def import_dialogues(path: str, output: str, interval: float = 2.0, first_user_id: int = 1) -> int:
+    """Преобразование dialogues.txt в JSONL: каждое приветствие начинает нового пользователя"""
+    user_id = first_user_id - 1
+    timestamp = time.time()
+    count = 0
+    with open(path, encoding='utf-8') as source, open(output, 'w', encoding='utf-8') as target:
+        for line in source:
+            if not line.startswith('пользователь:'):
+                continue
+            text = line.split(':', 1)[1].strip()
+            if user_id < first_user_id or text.lower().startswith(_GREETINGS):
+                user_id += 1
+            timestamp += interval
+            target.write(json.dumps({'user_id': user_id, 'text': text, 'timestamp': timestamp},
+                                    ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+class ConversationRecorder:
+    """Запись входящих сообщений бота в JSONL для последующего воспроизведения"""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'a', encoding='utf-8', buffering=1)
+        self._lock = threading.Lock()
+
+    def record(self, user_id: int, text: str):
+        line = json.dumps({'user_id': user_id, 'text': text, 'timestamp': time.time()}, ensure_ascii=False)
+        with self._lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+def _worker(index: int, tasks, output: str, start_at: float, first_ts: float, speed: float):
+    """Процесс воспроизведения: свой каталог и база, задержки по времени записи"""
+    os.chdir(tempfile.mkdtemp(prefix=f'travel_bot_replay_{index}_'))
+    import logging
+    import random
+    logging.disable(logging.CRITICAL)
+    from advanced_bot import TravelBot
+
+    travel_bot = TravelBot()
+    with open(output, 'w', encoding='utf-8') as results:
+        while True:
+            batch = tasks.get()
+            if batch is None:
+                break
+            for seq, record in batch:
+                if speed > 0:
+                    delay = start_at + (record['timestamp'] - first_ts) / speed - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                # Случайные фразы зависят только от номера сообщения, а не от числа процессов
+                random.seed(seq)
+                started = time.perf_counter()
+                response = travel_bot.process_message(record['text'], {'user_id': record['user_id']})
+                latency = time.perf_counter() - started
+                results.write(json.dumps({
+                    'seq': seq, 'user_id': record['user_id'], 'text': record['text'],
+                    'response': response, 'latency_ms': round(latency * 1000, 4)
+                }, ensure_ascii=False) + '\n')
+
+
+def _read_results(path: str) -> Iterator[Dict]:
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            yield json.loads(line)
+
+
+def _percentile(values: array, percent: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _chain(first: Dict, rest: Iterator[Dict]) -> Iterator[Dict]:
+    yield first
+    yield from rest
+
+
+def _put(tasks, item, process, timeout: float = 1.0):
+    """Постановка в очередь процесса; остановившийся процесс - ошибка, а не вечное ожидание"""
+    while True:
+        try:
+            tasks.put(item, timeout=timeout)
+            return
+        except queue.Full:
+            if not process.is_alive():
+                raise RuntimeError(f"Процесс воспроизведения {process.name} завершился с кодом {process.exitcode}")
+
+
+def replay(path: str, output: str, speed: float = 0, workers: int = 1, batch_size: int = 256) -> Dict:
+    """Воспроизведение записи; результаты по порядку seq в output"""
+    records = load_records(path)
+    first = next(records, None)
+    if first is None:
+        raise ValueError(f"{path}: нет записей")
+
+    context = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+    directory = tempfile.mkdtemp(prefix='travel_bot_replay_')
+    queues = [context.Queue(maxsize=64) for _ in range(workers)]
+    outputs = [os.path.join(directory, f"worker-{index}.jsonl") for index in range(workers)]
+    start_at = time.time() + 0.5
+    processes = [
+        context.Process(target=_worker, args=(index, queues[index], outputs[index], start_at,
+                                              first['timestamp'], speed))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    started = time.perf_counter()
+    batches: List[List] = [[] for _ in range(workers)]
+    seq = 0
+    try:
+        for record in _chain(first, records):
+            shard = record['user_id'] % workers
+            batches[shard].append((seq, record))
+            seq += 1
+            if len(batches[shard]) >= batch_size:
+                _put(queues[shard], batches[shard], processes[shard])
+                batches[shard] = []
+        for shard, batch in enumerate(batches):
+            if batch:
+                _put(queues[shard], batch, processes[shard])
+            _put(queues[shard], None, processes[shard])
+        for process in processes:
+            process.join()
+        failed = [process for process in processes if process.exitcode != 0]
+        if failed:
+            raise RuntimeError("Воспроизведение прервано: " + ", ".join(
+                f"{process.name} (код {process.exitcode})" for process in failed
+            ))
+    except BaseException:
+        for process, tasks in zip(processes, queues):
+            process.terminate()
+            # Непереданные пакеты не держат выход из процесса
+            tasks.cancel_join_thread()
+        raise
+    elapsed = time.perf_counter() - started
+
+    # Файлы процессов упорядочены по seq: слияние без загрузки в память
+    latencies = array('d')
+    with open(output, 'w', encoding='utf-8') as target:
+        for result in heapq.merge(*(_read_results(path) for path in outputs), key=lambda item: item['seq']):
+            latencies.append(result['latency_ms'])
+            target.write(json.dumps(result, ensure_ascii=False) + '\n')
+    for path in outputs:
+        os.remove(path)
+
+    latencies = array('d', sorted(latencies))
+    return {
+        'messages': seq,
+        'elapsed_seconds': round(elapsed, 3),
+        'messages_per_second': round(seq / elapsed, 1),
+        'p50_ms': _percentile(latencies, 50),
+        'p95_ms': _percentile(latencies, 95),
+        'p99_ms': _percentile(latencies, 99)
+    }
+
+
+def compare(output: str, baseline: str, show: int = 5) -> Dict:
+    """Сравнение ответов и задержек с базовым прогоном"""
+    mismatches = []
+    compared = 0
+    current_latency, baseline_latency = array('d'), array('d')
+    for current, expected in zip(_read_results(output), _read_results(baseline)):
+        compared += 1
+        current_latency.append(current['latency_ms'])
+        baseline_latency.append(expected['latency_ms'])
+        if current['text'] != expected['text']:
+            raise ValueError(f"Запись {current['seq']}: прогоны сделаны по разным записям")
+        if normalize(current['response']) != normalize(expected['response']):
+            mismatches.append(current['seq'])
+            if len(mismatches) <= show:
+                print(f"Расхождение #{current['seq']} (user {current['user_id']}, {current['text']!r}):\n"
+                      f"  было:  {expected['response'][:200]!r}\n  стало: {current['response'][:200]!r}")
+
+    current_latency = array('d', sorted(current_latency))
+    baseline_latency = array('d', sorted(baseline_latency))
+    return {
+        'compared': compared,
+        'mismatches': len(mismatches),
+        'latency': {
+            name: (_percentile(baseline_latency, percent), _percentile(current_latency, percent))
+            for name, percent in (('p50', 50), ('p95', 95), ('p99', 99))
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?', help="JSONL с записанными сообщениями")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="1 - реальное время, N - в N раз быстрее, 0 - максимальная скорость")
+    parser.add_argument('--workers', type=int, default=1, help="число процессов")
+    parser.add_argument('--output', help="JSONL с ответами (по умолчанию replay-<время>.jsonl)")
+    parser.add_argument('--baseline', help="результат прошлого прогона для сравнения")
+    parser.add_argument('--import-dialogues', metavar='PATH', help="преобразовать dialogues.txt в JSONL")
+    args = parser.parse_args()
+
+    if args.import_dialogues:
+        output = args.output or 'traffic.jsonl'
+        count = import_dialogues(args.import_dialogues, output)
+        print(f"Импортировано сообщений: {count} -> {output}")
+        return
+    if not args.input:
+        parser.error("укажите файл записи")
+
+    output = os.path.abspath(args.output or f"replay-{datetime.now():%Y%m%d-%H%M%S}.jsonl")
+    summary = replay(os.path.abspath(args.input), output, args.speed, args.workers)
+    print(f"Сообщений: {summary['messages']} за {summary['elapsed_seconds']} с "
+          f"({summary['messages_per_second']} сообщ./с), p50 {summary['p50_ms']:.3f} мс, "
+          f"p95 {summary['p95_ms']:.3f} мс, p99 {summary['p99_ms']:.3f} мс -> {output}")
+
+    if args.baseline:
+        result = compare(output, args.baseline)
+        print(f"Сравнено: {result['compared']}, расхождений: {result['mismatches']}")
+        for name, (before, after) in result['latency'].items():
+            change = f" ({(after - before) / before * 100:+.1f}%)" if before else ''
+            print(f"  {name}: {before:.3f} -> {after:.3f} мс{change}")
+        if result['mismatches']:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
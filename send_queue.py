@@ -0,0 +1,349 @@
+"""
+Очередь исходящих сообщений с учетом лимитов Telegram
+
+Обработчики ставят сообщения в очередь и сразу возвращаются. Потоки-отправители
+соблюдают token bucket на чат и общий, отдают приоритет подтверждениям,
+склеивают подряд идущие сообщения одному чату и повторяют отправку после 429.
+send возвращает Future: результат - Message, отправленный Telegram (у склеенных
+сообщений он общий), или исключение, если отправить не удалось.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Optional
+
+from config import (
+    SEND_GLOBAL_RATE, SEND_GLOBAL_BURST, SEND_CHAT_RATE, SEND_CHAT_BURST,
+    SEND_WORKERS, SEND_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты (меньше - важнее)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Максимальная длина сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+# Как часто удалять состояние неактивных чатов, с
+PRUNE_INTERVAL = 60
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 - уже доступен)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """Списание токена"""
+        self.tokens -= 1
+
+
+def _send_key(kwargs: Dict) -> Dict:
+    """Параметры отправки для сравнения: клавиатуры - по JSON, а не по объекту"""
+    return {
+        name: value.to_json() if hasattr(value, 'to_json') else value
+        for name, value in kwargs.items()
+    }
+
+
+class _Message:
+    """Исходящее сообщение в очереди"""
+
+    __slots__ = ('chat_id', 'text', 'kwargs', 'key', 'priority', 'attempts', 'future')
+
+    def __init__(self, chat_id, text: str, kwargs: Dict, priority: int):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.key = _send_key(kwargs)
+        self.priority = priority
+        self.attempts = 0
+        self.future = Future()
+
+
+class _Chat:
+    """Состояние чата: очередь сообщений, лимит и блокировка после 429"""
+
+    __slots__ = ('pending', 'bucket', 'blocked_until', 'entry', 'in_flight')
+
+    def __init__(self):
+        self.pending: Deque[_Message] = deque()
+        self.bucket = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+        self.blocked_until = 0.0
+        # Номер актуальной записи чата в очереди (None - чат не запланирован)
+        self.entry: Optional[int] = None
+        self.in_flight = False
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """retry_after из ошибки 429 (ApiTelegramException и аналоги)"""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    result = getattr(error, 'result_json', None) or {}
+    return float(result.get('parameters', {}).get('retry_after', 1))
+
+
+class SendScheduler:
+    """Планировщик исходящих сообщений"""
+
+    def __init__(self, send_func: Callable, workers: int = SEND_WORKERS):
+        self.send_func = send_func
+        self.global_bucket = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_BURST)
+        self.chats: Dict[object, _Chat] = {}
+        # Готовые чаты: (приоритет, номер записи, chat_id)
+        self._ready: List = []
+        # Отложенные чаты (лимит или 429): (время готовности, приоритет, номер записи, chat_id)
+        self._delayed: List = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self._pruned_at = time.monotonic()
+        self.stats = {'queued': 0, 'sent': 0, 'coalesced': 0, 'retries': 0, 'failed': 0}
+        self._threads = [
+            threading.Thread(target=self._work, name=f'sender-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def send(self, chat_id, text: str, priority: int = PRIORITY_NORMAL, **kwargs) -> Future:
+        """Постановка сообщения в очередь (совместимо с bot.send_message, результат - Future)"""
+        message = _Message(chat_id, text, kwargs, priority)
+        with self._condition:
+            chat = self.chats.get(chat_id)
+            if chat is None:
+                chat = self.chats[chat_id] = _Chat()
+            chat.pending.append(message)
+            self.stats['queued'] += 1
+            if chat.in_flight:
+                # Чат будет запланирован после завершения текущей отправки
+                pass
+            elif chat.entry is None:
+                self._schedule(chat_id, chat, 0.0)
+            elif priority < self._chat_priority(chat, exclude_last=True):
+                # Чат с важным сообщением поднимается в очереди (старая запись устаревает)
+                self._schedule(chat_id, chat, chat.blocked_until)
+            self._condition.notify()
+        return message.future
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Ожидание отправки всех сообщений"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while any(chat.pending or chat.in_flight for chat in self.chats.values()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(min(remaining, 0.05))
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Дождаться отправки и остановить потоки"""
+        self.flush(timeout)
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        # Неотправленные за timeout сообщения: ожидающие Future не должны висеть вечно
+        for chat in self.chats.values():
+            for message in chat.pending:
+                message.future.cancel()
+            chat.pending.clear()
+
+    @staticmethod
+    def _chat_priority(chat: _Chat, exclude_last: bool = False) -> int:
+        """Приоритет чата - самый важный из ожидающих сообщений"""
+        messages = list(chat.pending)[:-1] if exclude_last else chat.pending
+        return min((message.priority for message in messages), default=PRIORITY_LOW + 1)
+
+    def _schedule(self, chat_id, chat: _Chat, ready_at: float):
+        """Постановка чата в очередь (под блокировкой)"""
+        entry = next(self._sequence)
+        chat.entry = entry
+        priority = self._chat_priority(chat)
+        if ready_at > time.monotonic():
+            heapq.heappush(self._delayed, (ready_at, priority, entry, chat_id))
+        else:
+            heapq.heappush(self._ready, (priority, entry, chat_id))
+
+    def _next_batch(self):
+        """Выбор чата и склейка его сообщений (под блокировкой)"""
+        while self._running:
+            now = time.monotonic()
+            if now - self._pruned_at > PRUNE_INTERVAL:
+                self._prune(now)
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, entry, chat_id = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (priority, entry, chat_id))
+
+            if not self._ready:
+                self._condition.wait(self._delayed[0][0] - now if self._delayed else None)
+                continue
+
+            wait = self.global_bucket.wait_time(now)
+            if wait > 0:
+                self._condition.wait(wait)
+                continue
+
+            _, entry, chat_id = heapq.heappop(self._ready)
+            chat = self.chats[chat_id]
+            if chat.entry != entry:
+                continue
+            chat.entry = None
+            if not chat.pending:
+                continue
+
+            delay = max(chat.blocked_until - now, chat.bucket.wait_time(now))
+            if delay > 0:
+                self._schedule(chat_id, chat, now + delay)
+                continue
+
+            chat.bucket.consume()
+            self.global_bucket.consume()
+            chat.in_flight = True
+            return chat_id, chat, self._coalesce(chat)
+        return None
+
+    def _prune(self, now: float):
+        """Удаление чатов без сообщений с полностью восстановленным лимитом"""
+        self._pruned_at = now
+        idle = [
+            chat_id for chat_id, chat in self.chats.items()
+            if not chat.pending and not chat.in_flight and chat.entry is None
+            and chat.blocked_until <= now and chat.bucket.wait_time(now) == 0
+            and chat.bucket.tokens >= chat.bucket.capacity
+        ]
+        for chat_id in idle:
+            del self.chats[chat_id]
+
+    def _coalesce(self, chat: _Chat) -> List[_Message]:
+        """Подряд идущие сообщения чату с теми же параметрами отправки"""
+        batch = [chat.pending.popleft()]
+        length = len(batch[0].text)
+        key = batch[0].key
+        while chat.pending:
+            candidate = chat.pending[0]
+            # Клавиатура, parse_mode, reply_to_message_id и т.п. должны совпадать
+            if candidate.key != key:
+                break
+            if length + 2 + len(candidate.text) > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(chat.pending.popleft())
+            length += 2 + len(candidate.text)
+        return batch
+
+    def _work(self):
+        """Поток отправки"""
+        while True:
+            with self._condition:
+                selected = self._next_batch()
+                if selected is None:
+                    return
+            chat_id, chat, batch = selected
+
+            text = "\n\n".join(message.text for message in batch)
+            error = None
+            try:
+                result = self.send_func(chat_id, text, **batch[0].kwargs)
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                chat.in_flight = False
+                now = time.monotonic()
+                if error is None:
+                    self.stats['sent'] += 1
+                    self.stats['coalesced'] += len(batch) - 1
+                    for message in batch:
+                        message.future.set_result(result)
+                else:
+                    retry_after = _retry_after(error)
+                    batch[0].attempts += 1
+                    if retry_after is not None and batch[0].attempts <= SEND_MAX_RETRIES:
+                        self.stats['retries'] += 1
+                        chat.blocked_until = now + retry_after
+                        chat.pending.extendleft(reversed(batch))
+                    else:
+                        self.stats['failed'] += len(batch)
+                        logger.error("Не удалось отправить сообщение в чат %s: %s", chat_id, error)
+                        for message in batch:
+                            message.future.set_exception(error)
+                if chat.pending and chat.entry is None:
+                    self._schedule(chat_id, chat, chat.blocked_until)
+                self._condition.notify_all()
+
+
+if __name__ == "__main__":
+    # Проверка на локальной заглушке Bot API с инъекцией ошибок 429
+    import json
+    import urllib.error
+    import urllib.parse
+    import urllib.request
+
+    from telebot import types
+
+    from fake_telegram_api import FakeTelegramAPI, start_fake_api
+
+    def create_keyboard():
+        keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        keyboard.add(types.KeyboardButton("🛒 Корзина"), types.KeyboardButton("ℹ️ Помощь"))
+        return keyboard
+
+    class StubApiError(Exception):
+        def __init__(self, error_code: int, result_json: Dict):
+            super().__init__(result_json.get('description'))
+            self.error_code = error_code
+            self.result_json = result_json
+
+    api = FakeTelegramAPI(latency_ms=20, error_rate=0.1, retry_after=1)
+    server = start_fake_api(api, '127.0.0.1', 0)
+    url = f"http://127.0.0.1:{server.server_address[1]}/botTEST/sendMessage"
+
+    def http_send(chat_id, text, **kwargs):
+        data = urllib.parse.urlencode({'chat_id': chat_id, 'text': text}).encode()
+        try:
+            with urllib.request.urlopen(url, data=data) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            raise StubApiError(e.code, json.load(e))
+
+    scheduler = SendScheduler(http_send, workers=8)
+    chats, per_chat = 50, 6
+    futures = []
+    start = time.perf_counter()
+    for i in range(per_chat):
+        for chat_id in range(chats):
+            priority = PRIORITY_HIGH if i == per_chat - 1 else PRIORITY_LOW
+            # Каждое третье сообщение - с другим parse_mode: склеиваются только одинаковые параметры.
+            # Клавиатура - новый объект на каждое сообщение, как в обработчиках бота
+            kwargs = {'parse_mode': 'HTML'} if i % 3 == 0 else {'reply_markup': create_keyboard()}
+            futures.append(scheduler.send(chat_id, f"Сообщение {i}", priority=priority, **kwargs))
+    scheduler.stop(timeout=120)
+    elapsed = time.perf_counter() - start
+    delivered = sum(1 for future in futures if future.done() and not future.cancelled() and not future.exception())
+
+    print(f"Поставлено: {scheduler.stats['queued']}, запросов: {scheduler.stats['sent']}, "
+          f"склеено: {scheduler.stats['coalesced']}, повторов после 429: {scheduler.stats['retries']}, "
+          f"потеряно: {scheduler.stats['failed']}, доставлено по Future: {delivered}")
+    print(f"Время: {elapsed:.2f} с, запросов к API: {api.stats['sendMessage']}")
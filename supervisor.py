@@ -0,0 +1,221 @@
+"""
+Перезапуск бота после сбоев: экспоненциальная задержка с jitter и контрольная точка offset
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from config import (
+    SUPERVISOR_BASE_DELAY, SUPERVISOR_MAX_DELAY, SUPERVISOR_RESET_AFTER, CHECKPOINT_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(failures: int, base: float = SUPERVISOR_BASE_DELAY,
+                  cap: float = SUPERVISOR_MAX_DELAY) -> float:
+    """Задержка перед перезапуском: экспонента с полным jitter"""
+    return random.uniform(0, min(cap, base * 2 ** (failures - 1)))
+
+
+class OffsetCheckpoint:
+    """Последний обработанный update_id на диске (запись не чаще interval секунд)"""
+
+    def __init__(self, path: str, interval: float = CHECKPOINT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.update_id = 0
+        self._saved_id = 0
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        """Чтение контрольной точки (0, если ее нет)"""
+        try:
+            with open(self.path, encoding='utf-8') as checkpoint_file:
+                self.update_id = int(json.load(checkpoint_file)['update_id'])
+        except (OSError, ValueError, KeyError):
+            self.update_id = 0
+        self._saved_id = self.update_id
+        return self.update_id
+
+    def advance(self, update_id: int):
+        """Отметка обработанного обновления"""
+        with self._lock:
+            if update_id <= self.update_id:
+                return
+            self.update_id = update_id
+            if time.monotonic() - self._saved_at < self.interval:
+                return
+        self.save()
+
+    def save(self):
+        """Запись на диск через временный файл и атомарную замену"""
+        with self._lock:
+            if self.update_id == self._saved_id:
+                return
+            update_id = self.update_id
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as checkpoint_file:
+                json.dump({'update_id': update_id}, checkpoint_file)
+            os.replace(temp_path, self.path)
+            self._saved_id = update_id
+            self._saved_at = time.monotonic()
+
+
+class UpdateTracker:
+    """Обновления в обработке: контрольная точка не обгоняет незавершенные обработчики"""
+
+    def __init__(self, checkpoint: OffsetCheckpoint):
+        self.checkpoint = checkpoint
+        # update_id -> число незавершенных задач обработчиков
+        self._tasks: Dict[int, int] = {}
+        # Обновления, задачи которых еще ставятся в очередь
+        self._dispatching: Set[int] = set()
+        # id(объекта обновления, например Message) -> update_id и обратно
+        self._owners: Dict[int, int] = {}
+        self._payloads: Dict[int, List[int]] = {}
+        self._latest = 0
+        self._lock = threading.Lock()
+
+    def begin(self, update_id: int, payloads: Iterable[object] = ()):
+        """Начало разбора обновления; payloads - объекты, которые получат обработчики"""
+        with self._lock:
+            self._latest = max(self._latest, update_id)
+            if update_id in self._tasks:
+                # Обновление уже в обработке: счетчик задач и объекты остаются прежними
+                return
+            self._tasks[update_id] = 0
+            self._dispatching.add(update_id)
+            self._payloads[update_id] = [id(payload) for payload in payloads]
+            for key in self._payloads[update_id]:
+                self._owners[key] = update_id
+
+    def task_started(self, payload) -> Optional[int]:
+        """Постановка задачи обработчика; update_id или None для чужого объекта"""
+        with self._lock:
+            update_id = self._owners.get(id(payload))
+            if update_id is not None:
+                self._tasks[update_id] += 1
+            return update_id
+
+    def task_done(self, update_id: int):
+        """Завершение задачи обработчика"""
+        with self._lock:
+            self._tasks[update_id] -= 1
+            self._finish(update_id)
+        self._advance()
+
+    def dispatched(self, update_ids: Iterable[int]):
+        """Все задачи обновлений поставлены (обновления без обработчиков завершены сразу)"""
+        with self._lock:
+            for update_id in update_ids:
+                self._dispatching.discard(update_id)
+                self._finish(update_id)
+        self._advance()
+
+    def _finish(self, update_id: int):
+        """Снятие завершенного обновления с учета (под блокировкой)"""
+        if update_id in self._dispatching or self._tasks.get(update_id):
+            return
+        self._tasks.pop(update_id, None)
+        for key in self._payloads.pop(update_id, ()):
+            self._owners.pop(key, None)
+
+    def _advance(self):
+        with self._lock:
+            safe = min(self._tasks) - 1 if self._tasks else self._latest
+        if safe > 0:
+            self.checkpoint.advance(safe)
+
+
+class Supervisor:
+    """Цикл запуска target: после сбоя - checkpoint и перезапуск с задержкой"""
+
+    def __init__(self, target: Callable[[], None], checkpoint: Optional[Callable[[], None]] = None,
+                 reset_after: float = SUPERVISOR_RESET_AFTER):
+        self.target = target
+        self.checkpoint = checkpoint
+        self.reset_after = reset_after
+        self.restarts = 0
+        self._stop = threading.Event()
+
+    def request_stop(self):
+        """Остановка после завершения текущего запуска"""
+        self._stop.set()
+
+    def run(self):
+        """Запуск до request_stop (блокирующий)"""
+        failures = 0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            error = None
+            try:
+                self.target()
+            except KeyboardInterrupt:
+                self._stop.set()
+            except Exception as e:
+                error = e
+
+            self._checkpoint()
+            if self._stop.is_set():
+                break
+
+            # Долгая стабильная работа сбрасывает счетчик сбоев
+            if time.monotonic() - started > self.reset_after:
+                failures = 0
+            failures += 1
+            self.restarts += 1
+            delay = backoff_delay(failures)
+            if error is not None:
+                logger.error("Сбой бота: %s. Перезапуск через %.2f с (попытка %s)", error, delay, failures,
+                             exc_info=error)
+            else:
+                logger.warning("Бот остановился без ошибки. Перезапуск через %.2f с (попытка %s)",
+                               delay, failures)
+            self._stop.wait(delay)
+        logger.info("Супервизор остановлен, перезапусков: %s", self.restarts)
+
+    def _checkpoint(self):
+        """Сохранение состояния (ошибки не прерывают перезапуск)"""
+        if self.checkpoint is None:
+            return
+        try:
+            self.checkpoint()
+        except Exception as e:
+            logger.error("Не удалось сохранить состояние: %s", e)
+
+
+if __name__ == "__main__":
+    # Время восстановления после сбоя: от исключения до повторного запуска target
+    import tempfile
+
+    runs = []
+
+    def flaky():
+        runs.append(time.perf_counter())
+        if len(runs) >= 6:
+            supervisor.request_stop()
+            return
+        raise RuntimeError("сбой")
+
+    checkpoint = OffsetCheckpoint(os.path.join(tempfile.mkdtemp(), 'offset.json'))
+
+    def save_state():
+        checkpoint.advance(len(runs))
+        checkpoint.save()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    supervisor = Supervisor(flaky, checkpoint=save_state)
+    supervisor.run()
+    gaps = [(b - a) * 1000 for a, b in zip(runs, runs[1:])]
+    print("Паузы между запусками, мс: " + ", ".join(f"{gap:.1f}" for gap in gaps))
+    print(f"Контрольная точка: update_id={OffsetCheckpoint(checkpoint.path).load()}")
@@ -4,28 +4,87 @@ Telegram Travel Bot - Версия с полным циклом подтверж
 
 import telebot
 import logging
-from telebot import types
-from config import TELEGRAM_TOKEN, BOT_CONFIG, LOG_FILE, LOG_LEVEL
+from telebot import apihelper, types
+from config import (
+    TELEGRAM_TOKEN, TELEGRAM_API_URL, ADMIN_USER_IDS, METRICS_HOST, METRICS_PORT,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_WORKERS,
+    UPDATE_OFFSET_FILE, SESSIONS_FILE, UPDATE_DEDUP_WINDOW, CAPTURE_FILE,
+    CONFIG_RELOAD_INTERVAL, EXPIRY_INTERVAL, CHECKOUT_REMINDER, DYNAMIC_PRICING, PRICE_REFRESH_INTERVAL
+)
 from advanced_bot import TravelBot, DatabaseManager
+from config_snapshot import config_store
+from date_parser import parse_date, format_date
+import order_lifecycle
+from pricing import dynamic_prices
+import analytics
+from logging_setup import setup_logging
+from metrics import registry, start_metrics_server
+from profiler import profiler
+from send_queue import SendScheduler, PRIORITY_HIGH, PRIORITY_LOW
+from http_transport import install as install_http_transport
+from supervisor import OffsetCheckpoint, Supervisor, UpdateTracker
+from idempotency import DedupWindow
+from order_history import NEWER, OLDER
 from datetime import datetime
 import random
+import signal
+import time
 
-# Настройка логирования
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# Инициализация бота
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
+# Замер задержки отправки сообщений в Telegram
+registry.describe('telegram_send_seconds', 'Отправка сообщений в Telegram')
+
+# Бот и его зависимости создает create_app(): импорт модуля не открывает соединений и базу
+http_transport = None
+bot = None
+send_scheduler = None
+travel_bot = None
+update_checkpoint = None
+update_tracker = None
+processed_updates = None
+recorder = None
+_process_new_updates = None
+
+
+def _update_payloads(update) -> list:
+    """Объекты обновления, которые telebot передает обработчикам (Message, CallbackQuery и т.п.)"""
+    return [value for name, value in vars(update).items() if name != 'update_id' and value is not None]
+
+
+def _process_and_checkpoint(updates):
+    """Обработка пачки обновлений без дубликатов; контрольная точка сдвигается по завершении обработчиков"""
+    fresh = [update for update in updates if processed_updates.claim(update.update_id)]
+    if len(fresh) < len(updates):
+        logger.info("Пропущено повторных обновлений: %s", len(updates) - len(fresh))
+    if recorder is not None:
+        for update in fresh:
+            if update.message is not None and update.message.text:
+                recorder.record(update.message.from_user.id, update.message.text)
+    # Повторные обновления не трогают учет: их первая обработка может еще идти
+    for update in fresh:
+        update_tracker.begin(update.update_id, _update_payloads(update))
+    try:
+        if fresh:
+            _process_new_updates(fresh)
+    finally:
+        update_tracker.dispatched(update.update_id for update in fresh)
+
 
-# Инициализация логики бота
-travel_bot = TravelBot()
+def _track_handler_tasks(exec_task):
+    """Обертка TeleBot._exec_task: завершение задачи обработчика отмечается в UpdateTracker"""
+    def exec_tracked(task, *args, **kwargs):
+        update_id = update_tracker.task_started(args[0]) if args else None
+        if update_id is None:
+            return exec_task(task, *args, **kwargs)
+        
+        def run(*task_args, **task_kwargs):
+            try:
+                return task(*task_args, **task_kwargs)
+            finally:
+                update_tracker.task_done(update_id)
+        return exec_task(run, *args, **kwargs)
+    return exec_tracked
 
 
 class DialogueManager:
@@ -34,22 +93,17 @@ class DialogueManager:
     @staticmethod
     def get_random_phrase(phrase_type):
         """Получить случайную фразу из конфигурации"""
-        if 'checkout_dialogue' in BOT_CONFIG and phrase_type in BOT_CONFIG['checkout_dialogue']:
-            phrases = BOT_CONFIG['checkout_dialogue'][phrase_type]
-            if phrases:
-                return random.choice(phrases)
+        phrases = config_store.current.checkout_dialogue.get(phrase_type)
+        if phrases:
+            return random.choice(phrases)
         return ""
     
     @staticmethod
     def get_scenario_dialogue(scenario_id):
         """Получить диалог для сценария"""
-        if scenario_id in BOT_CONFIG['scenarios']:
-            scenario_data = BOT_CONFIG['scenarios'][scenario_id]
-            if 'dialogue' in scenario_data:
-                dialogues = scenario_data['dialogue']
-                if dialogues:
-                    return random.choice(dialogues)
-            return scenario_data.get('description', '')
+        scenario = config_store.current.scenario(scenario_id)
+        if scenario:
+            return random.choice(scenario.dialogue)
         return ""
     
     @staticmethod
@@ -230,11 +284,11 @@ class CustomReplyKeyboard:
         """Создает клавиатуру для выбора сценариев"""
         keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
         
-        scenarios = BOT_CONFIG['scenarios']
+        scenarios = config_store.current.scenarios
         
         # Показываем сценарии
         for i in range(1, min(6, len(scenarios) + 1)):
-            scenario_name = scenarios[str(i)]['name']
+            scenario_name = scenarios[str(i)].name
             keyboard.add(types.KeyboardButton(f"🎯 {i}. {scenario_name}"))
         
         keyboard.row(
@@ -249,11 +303,11 @@ class CustomReplyKeyboard:
         """Создает клавиатуру для выбора акций"""
         keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
         
-        promotions = BOT_CONFIG['promotions']
+        promotions = config_store.current.promotions
         
         # Показываем первые 6 акций
         for i in range(1, min(7, len(promotions) + 1)):
-            promo_text = promotions[i-1]['short']
+            promo_text = promotions[i-1].short
             keyboard.add(types.KeyboardButton(f"🎁 {i}. {promo_text[:15]}..."))
         
         keyboard.row(
@@ -262,10 +316,23 @@ class CustomReplyKeyboard:
         )
         
         return keyboard
+    
+    @staticmethod
+    def create_history_keyboard(page):
+        """Создает inline-кнопки листания истории заказов"""
+        buttons = []
+        if page.newer is not None:
+            buttons.append(types.InlineKeyboardButton("◀️ Новее", callback_data=f"hist:{NEWER}:{page.newer}"))
+        if page.older is not None:
+            buttons.append(types.InlineKeyboardButton("Старее ▶️", callback_data=f"hist:{OLDER}:{page.older}"))
+        if not buttons:
+            return None
+        keyboard = types.InlineKeyboardMarkup()
+        keyboard.row(*buttons)
+        return keyboard
 
 
 # Обработчики команд
-@bot.message_handler(commands=['start'])
 def handle_start(message):
     """Обработчик команды /start"""
     user_data = {
@@ -305,10 +372,9 @@ def handle_start(message):
     
     # Сохраняем пользователя в БД
     DatabaseManager.save_user(user_data)
-    logger.info(f"Новый пользователь: {user_data['first_name']} {user_data['last_name']}")
+    logger.info("Новый пользователь: %s %s", user_data['first_name'], user_data['last_name'])
 
 
-@bot.message_handler(commands=['help'])
 def handle_help(message):
     """Обработчик команды /help"""
     help_text = """
@@ -319,6 +385,8 @@ def handle_help(message):
 /help - показать это сообщение
 /cart - показать корзину
 /ticket - показать электронный билет
+/history - история заказов
+/refund <номер билета> - вернуть билет
 /reset - сбросить текущее бронирование
 
 🛒 **Работа с корзиной:**
@@ -352,7 +420,6 @@ def handle_help(message):
     )
 
 
-@bot.message_handler(commands=['ticket'])
 def handle_ticket_command(message):
     """Обработчик команды /ticket"""
     state = travel_bot.get_state(message.from_user.id)
@@ -368,9 +435,184 @@ def handle_ticket_command(message):
     )
 
 
-@bot.message_handler(func=lambda message: True)
+def handle_history_command(message):
+    """Обработчик команды /history - первая страница истории заказов"""
+    history_message, page = travel_bot.show_order_history(message.from_user.id)
+    
+    bot.send_message(
+        message.chat.id,
+        history_message,
+        parse_mode='Markdown',
+        reply_markup=CustomReplyKeyboard.create_history_keyboard(page)
+    )
+
+
+def handle_refund_command(message):
+    """Обработчик команды /refund <номер билета> - возврат билета"""
+    args = (message.text or '').split()[1:]
+    if not args:
+        bot.send_message(message.chat.id, "Укажите номер билета: /refund TK0000000123")
+        return
+    
+    result = DatabaseManager.refund_ticket(message.from_user.id, args[0].upper())
+    if result.orders:
+        refund_percentage = config_store.current.business['refund_percentage']
+        response = (f"✅ Билет {args[0].upper()} возвращен.\n"
+                    f"К возврату: {result.refunded:.2f} руб. ({refund_percentage}% стоимости)")
+    else:
+        response = "❌ Билет не найден среди ваших заказов или уже не подлежит возврату."
+    bot.send_message(message.chat.id, response)
+
+
+def handle_history_page(call):
+    """Листание истории заказов: сообщение редактируется на месте"""
+    try:
+        _, direction, cursor = call.data.split(':')
+        history_message, page = travel_bot.show_order_history(call.from_user.id, int(cursor), direction)
+    except ValueError:
+        bot.answer_callback_query(call.id, "Некорректная страница")
+        return
+    
+    bot.edit_message_text(
+        history_message,
+        call.message.chat.id,
+        call.message.message_id,
+        parse_mode='Markdown',
+        reply_markup=CustomReplyKeyboard.create_history_keyboard(page)
+    )
+    bot.answer_callback_query(call.id)
+
+
+def handle_stats_command(message):
+    """Обработчик команды /stats (только для администраторов)"""
+    if message.from_user.id not in ADMIN_USER_IDS:
+        bot.send_message(message.chat.id, "⛔ Команда доступна только администраторам.")
+        return
+    
+    # Без Markdown: имена состояний содержат символ "_"
+    bot.send_message(message.chat.id, registry.render_summary())
+
+
+def handle_report_command(message):
+    """Обработчик команды /report - отчет по продажам (только для администраторов)"""
+    if message.from_user.id not in ADMIN_USER_IDS:
+        bot.send_message(message.chat.id, "⛔ Команда доступна только администраторам.")
+        return
+    
+    bot.send_message(message.chat.id, analytics.render_report(analytics.load_report()))
+
+
+def handle_orders_command(message):
+    """Обработчик команды /orders - заказы по статусам (только для администраторов)"""
+    if message.from_user.id not in ADMIN_USER_IDS:
+        bot.send_message(message.chat.id, "⛔ Команда доступна только администраторам.")
+        return
+    
+    bot.send_message(message.chat.id, order_lifecycle.render_status_counts(order_lifecycle.status_counts()))
+
+
+def handle_cancel_trip_command(message):
+    """Обработчик команды /cancel_trip <направление> <дата> - отмена поезда (только для администраторов)"""
+    if message.from_user.id not in ADMIN_USER_IDS:
+        bot.send_message(message.chat.id, "⛔ Команда доступна только администраторам.")
+        return
+    
+    args = (message.text or '').split()[1:]
+    if len(args) < 2:
+        bot.send_message(message.chat.id, "Формат: /cancel_trip <направление> <дата, например 20.10.2026>")
+        return
+    
+    # Заказы хранят каноническое название и дату в формате отображения: ввод приводится к ним
+    destination = config_store.current.destinations.resolve(' '.join(args[:-1]))
+    if destination is None:
+        bot.send_message(message.chat.id, f"Направление «{' '.join(args[:-1])}» не найдено.")
+        return
+    # Окно бронирования не проверяется: отменить можно и поезд, отправляющийся сегодня
+    parsed = parse_date(args[-1])
+    if parsed is None:
+        bot.send_message(message.chat.id, config_store.current.errors['invalid_date'])
+        return
+    travel_date = format_date(parsed)
+    
+    result = DatabaseManager.cancel_trip(destination, travel_date, reason="Отмена поезда администратором")
+    bot.send_message(
+        message.chat.id,
+        f"🚫 {destination}, {travel_date}: отменено заказов {result.orders}, "
+        f"пассажиров {len(result.user_ids)}, к возврату {result.refunded:.2f} руб."
+    )
+
+
+def handle_reload_command(message):
+    """Обработчик команды /reload - перечитать конфигурацию (только для администраторов)"""
+    if message.from_user.id not in ADMIN_USER_IDS:
+        bot.send_message(message.chat.id, "⛔ Команда доступна только администраторам.")
+        return
+    
+    ok, messages = config_store.reload()
+    if ok:
+        response = f"✅ Загружена конфигурация версии {config_store.current.version}"
+    else:
+        response = f"❌ Конфигурация не загружена, работает версия {config_store.current.version}"
+    if messages:
+        response += "\n\n" + "\n".join(f"• {text}" for text in messages)
+    bot.send_message(message.chat.id, response)
+
+
+def handle_profile_command(message):
+    """Обработчик команды /profile on [доля] | off | status (только для администраторов)"""
+    if message.from_user.id not in ADMIN_USER_IDS:
+        bot.send_message(message.chat.id, "⛔ Команда доступна только администраторам.")
+        return
+    
+    args = message.text.split()[1:]
+    action = args[0].lower() if args else 'status'
+    
+    if action == 'on':
+        try:
+            sample_rate = float(args[1]) if len(args) > 1 else None
+            profiler.start(sample_rate)
+            response = profiler.summary()
+        except ValueError:
+            response = "Формат: /profile on [доля от 0 до 1, например 0.1]"
+    elif action == 'off':
+        path = profiler.stop()
+        response = f"🔬 Профилирование выключено. Стеки: {path or 'нет данных'}"
+    else:
+        response = profiler.summary()
+    
+    bot.send_message(message.chat.id, response)
+
+
+def _profile_branch(text: str) -> str:
+    """Ветка обработчика для агрегации профиля"""
+    if text in PROFILED_BUTTONS:
+        return text
+    if text.startswith("🎯 "):
+        return "🎯 <сценарий>"
+    if text.startswith("🎁 "):
+        return "🎁 <акция>"
+    return "<текст>"
+
+
+# Кнопки, которые профилируются как отдельные ветки
+PROFILED_BUTTONS = {
+    "✅ Да, подтверждаю", "❌ Нет, отменить", "✅ Оформить", "🛒 Корзина",
+    "🎫 Мой билет", "🔙 Назад", "🔄 Сброс", "ℹ️ Помощь", "🎯 Сценарии",
+    "🎁 Акции", "🗑️ Очистить", "📋 Продолжить"
+}
+
+
 def handle_all_messages(message):
     """Обработчик всех текстовых сообщений"""
+    # Ответ и клавиатура строятся по одной версии конфигурации; сессия пользователя
+    # не снимается по сроку, пока сообщение обрабатывается
+    with config_store.pinned(), travel_bot.session(message.from_user.id), \
+            profiler.profile(_profile_branch(message.text or '')):
+        _handle_all_messages(message)
+
+
+def _handle_all_messages(message):
+    """Маршрутизация текстовых сообщений и кнопок"""
     user_data = {
         'user_id': message.from_user.id,
         'username': message.from_user.username,
@@ -385,7 +627,7 @@ def handle_all_messages(message):
     if text == "✅ Да, подтверждаю":
         # Пользователь подтвердил заказ
         if state.context.get('awaiting_order_confirmation'):
-            logger.info(f"Пользователь {user_data['user_id']} подтвердил заказ")
+            logger.info("Пользователь %s подтвердил заказ", user_data['user_id'])
             
             # Передаем управление в TravelBot
             response = travel_bot.process_message(text, user_data)
@@ -396,9 +638,10 @@ def handle_all_messages(message):
                     message.chat.id,
                     response,
                     parse_mode='Markdown',
-                    reply_markup=CustomReplyKeyboard.create_main_keyboard()
+                    reply_markup=CustomReplyKeyboard.create_main_keyboard(),
+                    priority=PRIORITY_HIGH
                 )
-                logger.info(f"Заказ подтвержден для пользователя {user_data['user_id']}")
+                logger.info("Заказ подтвержден для пользователя %s", user_data['user_id'])
             else:
                 bot.send_message(
                     message.chat.id,
@@ -519,7 +762,8 @@ def handle_all_messages(message):
             message.chat.id,
             promotions_text,
             parse_mode='Markdown',
-            reply_markup=CustomReplyKeyboard.create_promotions_keyboard()
+            reply_markup=CustomReplyKeyboard.create_promotions_keyboard(),
+            priority=PRIORITY_LOW
         )
         
         # Отправляем детали акций
@@ -528,7 +772,8 @@ def handle_all_messages(message):
             message.chat.id,
             promotions_details,
             parse_mode='Markdown',
-            reply_markup=CustomReplyKeyboard.create_main_keyboard()
+            reply_markup=CustomReplyKeyboard.create_main_keyboard(),
+            priority=PRIORITY_LOW
         )
         return
     
@@ -929,6 +1174,19 @@ def handle_cart(message):
     )
 
 
+def notify_expired(user_id, kind):
+    """Напоминание о снятом по сроку неподтвержденном заказе (чат пользователя совпадает с его id)"""
+    if kind != 'confirmation':
+        return
+    bot.send_message(
+        user_id,
+        "⏰ Заказ не был подтвержден, и место освобождено.\n\n"
+        "Корзина сохранена - нажмите '✅ Оформить заказ', чтобы оформить его снова.",
+        priority=PRIORITY_LOW,
+        reply_markup=CustomReplyKeyboard.create_cart_keyboard()
+    )
+
+
 def handle_reset(message):
     """Обработчик сброса"""
     state = travel_bot.get_state(message.from_user.id)
@@ -941,19 +1199,150 @@ def handle_reset(message):
     )
 
 
+def run_webhook():
+    """Прием обновлений через webhook вместо long polling"""
+    from webhook_server import run_webhook_server
+    
+    bot.remove_webhook()
+    bot.set_webhook(url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None)
+    logger.info("Webhook установлен: %s%s", WEBHOOK_URL, WEBHOOK_PATH)
+    
+    # Обработчики выполняются в потоке webhook-сервера, закрепленном за чатом:
+    # пул telebot переставил бы сообщения одного чата
+    bot.threaded = False
+    run_webhook_server(
+        lambda update: bot.process_new_updates([types.Update.de_json(update)]),
+        WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH,
+        secret=WEBHOOK_SECRET or None, workers=WEBHOOK_WORKERS
+    )
+
+
+def _wait_for_handlers(timeout: float = 10.0):
+    """Ожидание разбора очереди обработчиков telebot"""
+    tasks = getattr(bot.worker_pool, 'tasks', None) if bot.threaded else None
+    deadline = time.monotonic() + timeout
+    while tasks is not None and not tasks.empty() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def save_state():
+    """Сохранение состояния перед перезапуском или остановкой"""
+    _wait_for_handlers()
+    if not send_scheduler.flush(timeout=10):
+        logger.warning("Не все исходящие сообщения отправлены до перезапуска")
+    travel_bot.save_sessions(SESSIONS_FILE)
+    update_checkpoint.save()
+
+
+def run_bot():
+    """Один запуск приема обновлений (возврат или исключение - сбой)"""
+    if BOT_MODE == 'webhook':
+        run_webhook()
+    else:
+        # non_stop=False: ошибки API завершают polling, перезапуском управляет супервизор
+        bot.polling(non_stop=False, timeout=60, long_polling_timeout=60)
+
+
+def _register_handlers(bot):
+    """Обработчики команд и сообщений (общий обработчик текста - последним)"""
+    bot.register_message_handler(handle_start, commands=['start'])
+    bot.register_message_handler(handle_help, commands=['help'])
+    bot.register_message_handler(handle_ticket_command, commands=['ticket'])
+    bot.register_message_handler(handle_history_command, commands=['history'])
+    bot.register_message_handler(handle_refund_command, commands=['refund'])
+    bot.register_callback_query_handler(handle_history_page, func=lambda call: (call.data or '').startswith('hist:'))
+    bot.register_message_handler(handle_stats_command, commands=['stats'])
+    bot.register_message_handler(handle_report_command, commands=['report'])
+    bot.register_message_handler(handle_orders_command, commands=['orders'])
+    bot.register_message_handler(handle_cancel_trip_command, commands=['cancel_trip'])
+    bot.register_message_handler(handle_reload_command, commands=['reload'])
+    bot.register_message_handler(handle_profile_command, commands=['profile'])
+    bot.register_message_handler(handle_all_messages, func=lambda message: True)
+
+
+def create_app():
+    """Создание бота: логирование, HTTP-пул, очередь отправки, TravelBot и обработчики"""
+    global http_transport, bot, send_scheduler, travel_bot, update_checkpoint, update_tracker, processed_updates
+    global recorder, _process_new_updates
+    if bot is not None:
+        return bot
+    
+    setup_logging()
+    
+    if TELEGRAM_API_URL:
+        # Альтернативный сервер Bot API (например, локальная заглушка для нагрузочных тестов)
+        apihelper.API_URL = TELEGRAM_API_URL.rstrip('/') + "/bot{0}/{1}"
+    # Общий пул keep-alive соединений вместо нового соединения на запрос
+    http_transport = install_http_transport()
+    new_bot = telebot.TeleBot(TELEGRAM_TOKEN)
+    new_bot.send_message = registry.timed('telegram_send_seconds')(new_bot.send_message)
+    
+    # Отправка через очередь с лимитами Telegram: обработчики не ждут ответа API
+    send_scheduler = SendScheduler(new_bot.send_message)
+    new_bot.send_message = send_scheduler.send
+    
+    # Логика бота; база данных инициализируется здесь, а не при импорте advanced_bot
+    travel_bot = TravelBot()
+    
+    # Последний обработанный update_id: после перезапуска polling продолжает с него
+    update_checkpoint = OffsetCheckpoint(UPDATE_OFFSET_FILE)
+    # Обработчики выполняются в пуле потоков: offset сдвигается, когда они завершились
+    update_tracker = UpdateTracker(update_checkpoint)
+    # Недавние update_id: повторная доставка Telegram не обрабатывается дважды
+    processed_updates = DedupWindow(UPDATE_DEDUP_WINDOW)
+    registry.gauge('duplicate_updates_total', lambda: processed_updates.duplicates, 'Пропущенные повторные обновления')
+    if CAPTURE_FILE:
+        # Запись входящих сообщений для воспроизведения (replay.py); модуль нужен только здесь
+        from replay import ConversationRecorder
+        recorder = ConversationRecorder(CAPTURE_FILE)
+    
+    _process_new_updates = new_bot.process_new_updates
+    new_bot.process_new_updates = _process_and_checkpoint
+    new_bot._exec_task = _track_handler_tasks(new_bot._exec_task)
+    _register_handlers(new_bot)
+    bot = new_bot
+    return bot
+
+
 def main():
     """Основная функция запуска бота"""
+    create_app()
     logger.info("Запуск Telegram Travel Bot...")
     
-    try:
-        # Запускаем бота
-        bot.infinity_polling(timeout=60, long_polling_timeout=60)
-    except Exception as e:
-        logger.error(f"Ошибка при запуске бота: {e}")
-        logger.info("Попытка перезапуска через 10 секунд...")
-        import time
-        time.sleep(10)
-        main()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
+        logger.info("Метрики доступны на http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+    
+    profiler.install_signal_handler()
+    if CONFIG_RELOAD_INTERVAL:
+        config_store.watch(CONFIG_RELOAD_INTERVAL)
+    if DYNAMIC_PRICING:
+        dynamic_prices.start(PRICE_REFRESH_INTERVAL)
+    
+    # Восстановление после предыдущего запуска
+    bot.last_update_id = update_checkpoint.load()
+    travel_bot.load_sessions(SESSIONS_FILE)
+    if EXPIRY_INTERVAL:
+        travel_bot.start_expiry(EXPIRY_INTERVAL, notify_expired if CHECKOUT_REMINDER else None)
+    
+    supervisor = Supervisor(run_bot, checkpoint=save_state)
+    
+    def stop(signum, frame):
+        logger.info("Получен сигнал %s, остановка...", signum)
+        supervisor.request_stop()
+        bot.stop_polling()
+        if BOT_MODE == 'webhook':
+            # Прерывает asyncio-сервер; супервизор сохранит состояние и завершится
+            raise KeyboardInterrupt
+    
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    
+    supervisor.run()
+    travel_bot.stop_expiry()
+    dynamic_prices.stop()
+    send_scheduler.stop()
+    logger.info("Бот остановлен")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+"""
+Генератор номеров билетов: блоки последовательности резервируются в SQLite
+
+Каждый поток получает собственный диапазон [start, end) и выдает номера без
+блокировок; к базе обращается только при исчерпании блока. Номера уникальны
+между процессами, использующими одну базу, и возрастают внутри потока.
+"""
+
+import sqlite3
+import threading
+from typing import Tuple
+
+from config import DATABASE_NAME, TICKET_ID_BLOCK_SIZE
+
+TICKET_PREFIX = 'TK'
+SEQUENCE_NAME = 'ticket'
+
+
+class TicketIdGenerator:
+    """Выдача уникальных номеров блоками из таблицы id_sequences"""
+
+    def __init__(self, database: str = DATABASE_NAME, block_size: int = TICKET_ID_BLOCK_SIZE,
+                 name: str = SEQUENCE_NAME):
+        self.database = database
+        self.block_size = block_size
+        self.name = name
+        self._local = threading.local()
+        # Таблица создается при первом резервировании, а не при импорте модуля
+        self._table_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: транзакцией управляем явно через BEGIN IMMEDIATE
+        return sqlite3.connect(self.database, timeout=30, isolation_level=None)
+
+    def _ensure_table(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS id_sequences (
+                    name TEXT PRIMARY KEY,
+                    next_value INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('INSERT OR IGNORE INTO id_sequences (name, next_value) VALUES (?, 1)', (self.name,))
+        finally:
+            conn.close()
+
+    def _reserve(self) -> Tuple[int, int]:
+        """Резервирование следующего блока (блокировка записи SQLite между процессами)"""
+        if not self._table_ready:
+            self._ensure_table()
+            self._table_ready = True
+        conn = self._connect()
+        try:
+            # Ошибка BEGIN (например, база занята дольше timeout) не требует ROLLBACK
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                start = conn.execute(
+                    'SELECT next_value FROM id_sequences WHERE name = ?', (self.name,)
+                ).fetchone()[0]
+                conn.execute(
+                    'UPDATE id_sequences SET next_value = ? WHERE name = ?', (start + self.block_size, self.name)
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            return start, start + self.block_size
+        finally:
+            conn.close()
+
+    def next_id(self) -> int:
+        """Следующий номер из блока текущего потока"""
+        local = self._local
+        try:
+            return next(local.ids)
+        except (AttributeError, StopIteration):
+            local.ids = iter(range(*self._reserve()))
+            return next(local.ids)
+
+    def next_ticket_number(self) -> str:
+        """Номер билета в формате TK0000000123"""
+        return f"{TICKET_PREFIX}{self.next_id():010d}"
+
+
+ticket_ids = TicketIdGenerator()
+
+
+if __name__ == "__main__":
+    # Скорость выдачи и проверка уникальности: несколько процессов и потоков на одной базе
+    import os
+    import tempfile
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    COUNT = 2_000_000
+    PROCESSES = 4
+    THREADS = 4
+
+    database = os.path.join(tempfile.mkdtemp(), 'ids.db')
+
+    def generate(count: int):
+        generator = TicketIdGenerator(database, block_size=100_000)
+        results = [[] for _ in range(THREADS)]
+
+        def work(index):
+            next_id = generator.next_id
+            results[index] = [next_id() for _ in range(count // THREADS)]
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ids = [value for chunk in results for value in chunk]
+        # Номера возрастают внутри каждого потока
+        assert all(all(a < b for a, b in zip(chunk, chunk[1:])) for chunk in results)
+        return ids
+
+    generator = TicketIdGenerator(database, block_size=100_000)
+    next_id = generator.next_id
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        next_id()
+    elapsed = time.perf_counter() - start
+    print(f"Один поток: {COUNT / elapsed / 1e6:.2f} млн номеров/с")
+
+    start = time.perf_counter()
+    for _ in range(COUNT // 4):
+        generator.next_ticket_number()
+    elapsed = time.perf_counter() - start
+    print(f"С форматированием номера билета: {COUNT // 4 / elapsed / 1e6:.2f} млн/с")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(PROCESSES) as executor:
+        chunks = list(executor.map(generate, [COUNT] * PROCESSES))
+    elapsed = time.perf_counter() - start
+    all_ids = [value for chunk in chunks for value in chunk]
+    print(f"{PROCESSES} процесса x {THREADS} потока: {len(all_ids)} номеров за {elapsed:.2f} с, "
+          f"совпадений: {len(all_ids) - len(set(all_ids))}")
@@ -0,0 +1,176 @@
+"""
+Прием обновлений Telegram через webhook: асинхронный HTTP-сервер и пул обработчиков
+"""
+
+import asyncio
+import hmac
+import logging
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+
+try:
+    import orjson
+
+    def _loads(data: bytes):
+        return orjson.loads(data)
+except ImportError:
+    import json
+
+    def _loads(data: bytes):
+        return json.loads(data)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+MAX_BODY_SIZE = 1024 * 1024
+
+_RESPONSES = {
+    200: b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n',
+    400: b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n',
+    403: b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n',
+    404: b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n',
+    413: b'HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+}
+
+
+def _chat_key(update: Dict) -> int:
+    """Ключ упорядочивания: сообщения одного чата обрабатываются по порядку"""
+    for field in ('message', 'edited_message', 'callback_query'):
+        payload = update.get(field)
+        if payload:
+            chat = payload.get('chat') or payload.get('message', {}).get('chat') or payload.get('from') or {}
+            if 'id' in chat:
+                return chat['id']
+    return update.get('update_id', 0)
+
+
+class UpdateDispatcher:
+    """Пул потоков: обновление уходит в очередь потока по id чата
+
+    Порядок внутри чата сохраняется, только если handler обрабатывает обновление
+    синхронно (у TeleBot - threaded=False).
+    """
+
+    def __init__(self, handler: Callable[[Dict], None], workers: int = 4):
+        self.handler = handler
+        self.queues: List[queue.SimpleQueue] = [queue.SimpleQueue() for _ in range(workers)]
+        self.threads = [
+            threading.Thread(target=self._work, args=(worker_queue,), name=f'webhook-worker-{i}', daemon=True)
+            for i, worker_queue in enumerate(self.queues)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, body: bytes):
+        """Постановка тела запроса в очередь (разбор выполняет обработчик)"""
+        try:
+            update = _loads(body)
+        except ValueError:
+            logger.warning("Некорректный JSON в webhook-запросе")
+            return
+        if not isinstance(update, dict):
+            logger.warning("Webhook-запрос не является объектом JSON")
+            return
+        self.queues[_chat_key(update) % len(self.queues)].put(update)
+
+    def stop(self):
+        """Остановка потоков после обработки очередей"""
+        for worker_queue in self.queues:
+            worker_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self, worker_queue: queue.SimpleQueue):
+        while True:
+            update = worker_queue.get()
+            if update is None:
+                return
+            try:
+                self.handler(update)
+            except Exception as e:
+                logger.error("Ошибка обработки обновления %s: %s", update.get('update_id'), e)
+
+
+class WebhookServer:
+    """Минимальный HTTP/1.1 сервер на asyncio для webhook Telegram"""
+
+    def __init__(self, dispatcher: UpdateDispatcher, path: str, secret: Optional[str] = None):
+        self.dispatcher = dispatcher
+        self.path = path.encode()
+        self.secret = secret.encode() if secret else None
+        self.received = 0
+        self.rejected = 0
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                status, body, keep_alive = self._parse_request(head)
+                if status == 200:
+                    body = await reader.readexactly(body)
+
+                # Ответ отправляется сразу, обработка идет в пуле потоков
+                writer.write(_RESPONSES[status])
+                if status == 200:
+                    self.received += 1
+                    self.dispatcher.submit(body)
+                else:
+                    self.rejected += 1
+                if not keep_alive:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _parse_request(self, head: bytes):
+        """Проверка запроса: (статус, длина тела, keep-alive)"""
+        lines = head.split(b'\r\n')
+        parts = lines[0].split(b' ')
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(b':')
+            if name:
+                headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get(b'connection', b'').lower() != b'close'
+        try:
+            length = int(headers.get(b'content-length', b'0') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return 400, 0, False
+        # Длина проверяется до пути и секрета: тело отклоненного запроса не вычитывается,
+        # соединение закрывается
+        if length > MAX_BODY_SIZE:
+            return 413, 0, False
+
+        if len(parts) < 2 or parts[0] != b'POST' or parts[1] != self.path:
+            return 404, 0, keep_alive and not length
+        # Сравнение за постоянное время: секрет не подбирается по времени ответа
+        secret = headers.get(SECRET_HEADER.encode(), b'')
+        if self.secret is not None and not hmac.compare_digest(secret, self.secret):
+            return 403, 0, keep_alive and not length
+        if length == 0:
+            return 400, 0, keep_alive
+        return 200, length, keep_alive
+
+    async def serve(self, host: str, port: int):
+        """Работа сервера до отмены"""
+        server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        logger.info("Webhook-сервер слушает %s:%s%s", host, port, self.path.decode())
+        async with server:
+            await server.serve_forever()
+
+
+def run_webhook_server(handler: Callable[[Dict], None], host: str, port: int, path: str,
+                       secret: Optional[str] = None, workers: int = 4):
+    """Запуск webhook-сервера (блокирующий)"""
+    dispatcher = UpdateDispatcher(handler, workers)
+    server = WebhookServer(dispatcher, path, secret)
+    try:
+        asyncio.run(server.serve(host, port))
+    finally:
+        dispatcher.stop()